@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# AnalysisCache – On-disk cache of BreathingAnalyser's intermediate results, so reopening a session skips the filtering
+# Entries are content-addressed: a stage's key hashes its input (the recorded arrays, or the key of the stage it builds on)
+# together with its parameters, so changing e.g. the breath peak threshold reuses the cached breathing signal and only
+# recomputes the peaks. Each entry is a directory of .npy files, opened memory-mapped. The cache is bounded to `max_bytes`,
+# least recently used entries (by modification time, refreshed on every hit) are evicted first.
+
+class AnalysisCache:
+    VERSION = 1 # part of every key, bump when a stage's computation changes
+
+    def __init__(self, directory, max_bytes=2*1024**3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def hash_arrays(*arrays):
+        # Content hash of arrays, including their dtypes and shapes
+        digest = hashlib.blake2b(digest_size=20)
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            digest.update(f"{array.dtype.str}{array.shape}".encode())
+            digest.update(memoryview(array).cast('B'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(stage, inputs, params):
+        # Key of a stage's result: its name, the keys of its inputs and its parameters (JSON serialisable)
+        text = json.dumps([AnalysisCache.VERSION, stage, inputs, params], sort_keys=True)
+        return hashlib.blake2b(text.encode(), digest_size=20).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        # The arrays stored under `key` (memory-mapped, read-only), or None
+        path = self.entry_path(key)
+        try:
+            names = [name for name in os.listdir(path) if name.endswith(".npy")]
+            arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode='r') for name in names}
+            os.utime(path) # most recently used
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return arrays
+
+    def put(self, key, arrays):
+        # Store a dict of arrays under `key`. Written to a temporary directory and renamed, so readers (e.g. batch_analysis
+        # workers sharing the cache) never see a partial entry
+        path = self.entry_path(key)
+        if os.path.exists(path):
+            return
+        tmp_path = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_path, f"{name}.npy"), np.asarray(array))
+            os.rename(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True) # another process stored it first
+        self.evict()
+
+    def entries(self):
+        # (modification time, size in bytes, path) of each entry
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir() or entry.name.startswith(".tmp-"):
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry.path))
+            entries.append((entry.stat().st_mtime, size, entry.path))
+        return entries
+
+    def evict(self):
+        # Remove least recently used entries until the cache fits in max_bytes
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def clear(self):
+        for _, _, path in self.entries():
+            shutil.rmtree(path, ignore_errors=True)
@@ -1,19 +1,53 @@
-import matplotlib.pyplot as plt
-from scipy.signal import butter, filtfilt, find_peaks
+from scipy.signal import butter, filtfilt, find_peaks, sosfiltfilt
 import numpy as np
+from RollingHrv import RollingHrv
+import spectral
 
 # BreathingAnalyser – Class to analyse breathing rate and heart rate variability from accelerometer and interbeat interval (IBI) data
 
 class BreathingAnalyser:
-    def __init__(self, acc_data, ibi_data):
+    ACC_SAMPLING_FREQ = 200 # PolarH10.ACC_SAMPLING_FREQ
+
+    def __init__(self, acc_data, ibi_data, decimated_freq=None, gravity_cutoff_freq=0.04, noise_cutoff_freq=0.5, filter_order=2,
+                 peak_threshold=0.02, br_smooth_window=3, ibi_p2p_fraction=0.15, cache=None):
+        # decimated_freq: if set (e.g. 10 Hz), filter the breathing signal at this lower rate, see calculate_breathing_signal_multirate.
+        # The results are then the *_decimated signals and the breath peaks, full-rate signals are only built for plots (full_rate_signals)
+        # cache: an AnalysisCache, each stage's results are loaded from it if they were computed before with the same inputs and parameters
+        self.set_parameters(decimated_freq, gravity_cutoff_freq, noise_cutoff_freq, filter_order, peak_threshold, br_smooth_window, ibi_p2p_fraction, cache)
+        if cache is not None:
+            self.stage_keys['acc'] = cache.hash_arrays(acc_data['times'], acc_data['values'])
+            self.stage_keys['ibi'] = cache.hash_arrays(ibi_data['times'], ibi_data['values'])
         self.acc_times, self.acc_values = acc_data['times'], acc_data['values']/100.0
         self.ibi_times, self.ibi_values = ibi_data['times'], ibi_data['values']
-        self.acc_values_norm = np.linalg.norm(self.acc_values, axis=1)
+        self.clear_results()
+
+        self.calculate_breathing_signal()
+        self.calculate_breathing_rate()
+        self.calculate_heart_rate_variability()
+
+    def set_parameters(self, decimated_freq, gravity_cutoff_freq, noise_cutoff_freq, filter_order, peak_threshold, br_smooth_window, ibi_p2p_fraction, cache):
+        self.decimated_freq = decimated_freq
+        self.gravity_cutoff_freq = gravity_cutoff_freq # Hz, low pass that separates gravity from movement
+        self.noise_cutoff_freq = noise_cutoff_freq # Hz, low pass of the breathing signal
+        self.filter_order = filter_order
+        self.peak_threshold = peak_threshold # min rise of a breath peak above the trough since the previous one
+        self.br_smooth_window = br_smooth_window
+        self.ibi_p2p_fraction = ibi_p2p_fraction # min IBI peak-to-peak, as a fraction of the max of the last 3 accepted
+        self.cache = cache
+        self.stage_keys = {}
+
+    def clear_results(self):
+        # Signals and results, empty until calculated
+        self.acc_values_norm = []
         self.acc_low_pass = []
         self.acc_low_pass_norm = []
         self.acc_values_filt = []
         self.acc_values_filt_norm = []
         self.breathing_signal = []
+        self.acc_low_pass_decimated = []
+        self.breathing_signal_decimated = []
+        self.decimated_idx = []
+        self.decimation_factor = 1
         self.br_values = []
         self.br_times = []
         self.br_values_smooth = []
@@ -23,165 +57,239 @@ class BreathingAnalyser:
         self.hrv_values_interp = []
         self.ibi_extremes_idx = []
 
-        self.calculate_breathing_signal()
-        self.calculate_breathing_rate()
-        self.calculate_heart_rate_variability()
+    def cached_stage(self, stage, input_stage, params, compute, names):
+        # Set the attributes `names` from the cache entry of this stage, or run `compute` and store them. The key chains the
+        # input stage's key, so a stage is recomputed when its own parameters or those of any stage before it change
+        if self.cache is None:
+            compute()
+            return
+        key = self.cache.key(stage, self.stage_keys[input_stage], params)
+        self.stage_keys[stage] = key
+        arrays = self.cache.get(key)
+        if arrays is not None and all(name in arrays for name in names):
+            for name in names:
+                setattr(self, name, arrays[name])
+            return
+        compute()
+        self.cache.put(key, {name: getattr(self, name) for name in names})
+
+    def breathing_signal_params(self):
+        return {'fs': self.ACC_SAMPLING_FREQ, 'decimated_freq': self.decimated_freq, 'gravity_cutoff_freq': self.gravity_cutoff_freq,
+                'noise_cutoff_freq': self.noise_cutoff_freq, 'filter_order': self.filter_order}
 
     def calculate_breathing_signal(self):
+        if self.decimated_freq is not None:
+            self.cached_stage('breathing_signal', 'acc', self.breathing_signal_params(), self.calculate_breathing_signal_multirate,
+                              ['acc_low_pass_decimated', 'breathing_signal_decimated', 'decimated_idx', 'decimation_factor'])
+            self.decimation_factor = int(self.decimation_factor)
+            return
+
+        # Only gravity and the breathing signal are cached, the differences and norms between them are quick to redo
+        self.cached_stage('breathing_signal', 'acc', self.breathing_signal_params(), self.filter_breathing_signal,
+                          ['acc_low_pass', 'breathing_signal'])
+        self.acc_values_norm = np.linalg.norm(self.acc_values, axis=1)
+        self.acc_low_pass_norm = np.linalg.norm(self.acc_low_pass, axis=1)
+        self.acc_values_filt = self.acc_values - self.acc_low_pass
+        self.acc_values_filt_norm = np.linalg.norm(self.acc_values_filt, axis=1)
+
+    def filter_breathing_signal(self):
         # Gravity Filter
-        cutoff_freq = 0.04  # Hz
-        filter_order = 2
-        nyquist_freq = 0.5 * 200 # PolarH10.ACC_SAMPLING_FREQ
-        cutoff_norm = cutoff_freq / nyquist_freq
-        b, a = butter(filter_order, cutoff_norm, btype='low')
+        nyquist_freq = 0.5 * self.ACC_SAMPLING_FREQ
+        b, a = butter(self.filter_order, self.gravity_cutoff_freq / nyquist_freq, btype='low')
         self.acc_low_pass = np.zeros_like(self.acc_values)
         for i in range(3):
             self.acc_low_pass[:, i] = filtfilt(b, a, self.acc_values[:, i])
-        
-        self.acc_low_pass_norm = np.linalg.norm(self.acc_low_pass, axis=1)
-        self.acc_values_filt = self.acc_values - self.acc_low_pass
-        self.acc_values_filt_norm = np.linalg.norm(self.acc_values_filt, axis=1)
+        acc_values_filt_norm = np.linalg.norm(self.acc_values - self.acc_low_pass, axis=1)
 
         # Noise Filter
-        nyquist_freq = 0.5 * 200 #PolarH10.ACC_SAMPLING_FREQ  
-        cutoff_freq = 0.5  
-        filter_order = 2  
-        b, a = butter(filter_order, cutoff_freq / nyquist_freq, btype='low')
-        self.breathing_signal = filtfilt(b, a, self.acc_values_filt_norm)
+        b, a = butter(self.filter_order, self.noise_cutoff_freq / nyquist_freq, btype='low')
+        self.breathing_signal = filtfilt(b, a, acc_values_filt_norm)
+
+    def calculate_breathing_signal_multirate(self):
+        # Breathing content is below 1 Hz, so anti-alias and decimate to `decimated_freq` with a block mean (boxcar, its nulls sit at
+        # the multiples of the low rate that would alias into the breathing band) and run second-order-section filters there.
+        # Low-rate sample k is the mean of original samples [k*q, (k+1)*q), centred at k*q + (q-1)/2.
+        self.decimation_factor = max(1, int(round(self.ACC_SAMPLING_FREQ / self.decimated_freq)))
+        q = self.decimation_factor
+        nyquist_freq = 0.5 * self.ACC_SAMPLING_FREQ / q
+        block_starts = np.arange(0, len(self.acc_values), q)
+        block_sizes = np.diff(np.append(block_starts, len(self.acc_values)))
+        self.decimated_idx = block_starts + (block_sizes - 1)/2
+        acc_decimated = np.add.reduceat(self.acc_values, block_starts, axis=0) / block_sizes[:, None]
+
+        # Gravity Filter
+        sos = butter(self.filter_order, self.gravity_cutoff_freq / nyquist_freq, btype='low', output='sos')
+        self.acc_low_pass_decimated = sosfiltfilt(sos, acc_decimated, axis=0)
+        acc_values_filt_decimated = acc_decimated - self.acc_low_pass_decimated
+
+        # Noise Filter
+        sos = butter(self.filter_order, self.noise_cutoff_freq / nyquist_freq, btype='low', output='sos')
+        self.breathing_signal_decimated = sosfiltfilt(sos, np.linalg.norm(acc_values_filt_decimated, axis=1))
+
+    def full_rate_signals(self):
+        # Multirate runs only keep the low-rate signals and the breath peaks mapped to acc_times. The full-rate attributes are
+        # interpolated from them the first time a plot or report needs them
+        if self.decimated_freq is not None and len(self.breathing_signal) == 0:
+            self.interpolate_decimated_signals()
+
+    def interpolate_decimated_signals(self):
+        # Gravity and the breathing signal are interpolated back onto acc_times so the full-rate attributes keep their shape
+        sample_idx = np.arange(len(self.acc_values))
+        self.acc_values_norm = np.sqrt(np.einsum('ij,ij->i', self.acc_values, self.acc_values))
+        self.acc_low_pass = np.column_stack([np.interp(sample_idx, self.decimated_idx, self.acc_low_pass_decimated[:, i]) for i in range(3)])
+        self.acc_low_pass_norm = np.sqrt(np.einsum('ij,ij->i', self.acc_low_pass, self.acc_low_pass))
+        self.acc_values_filt = self.acc_values - self.acc_low_pass
+        self.acc_values_filt_norm = np.sqrt(np.einsum('ij,ij->i', self.acc_values_filt, self.acc_values_filt))
+        self.breathing_signal = np.interp(sample_idx, self.decimated_idx, self.breathing_signal_decimated)
+
+    def map_decimated_peaks(self, signal, peaks):
+        # Refine each low-rate peak with a parabola through its neighbours and map it to the nearest original sample
+        peaks = np.asarray(peaks, dtype=int)
+        inner = (peaks > 0) & (peaks < len(signal) - 1)
+        offset = np.zeros(len(peaks))
+        left, centre, right = signal[peaks[inner] - 1], signal[peaks[inner]], signal[peaks[inner] + 1]
+        curvature = left - 2*centre + right
+        with np.errstate(divide='ignore', invalid='ignore'):
+            offset[inner] = np.where(curvature != 0, 0.5*(left - right)/curvature, 0.0)
+        q = self.decimation_factor
+        mapped = np.round((peaks + np.clip(offset, -0.5, 0.5))*q + (q - 1)/2).astype(int)
+        return np.clip(mapped, 0, len(self.acc_times) - 1)
 
     def calculate_breathing_rate(self):
+        self.cached_stage('breathing_rate', 'breathing_signal', {'peak_threshold': self.peak_threshold, 'br_smooth_window': self.br_smooth_window},
+                          self.find_breaths, ['breath_peaks', 'br_values', 'br_times', 'br_values_smooth'])
 
+    def find_breaths(self):
         # Breathing rate
-        peak_threshold = 0.02 #0.04
-        breathing_peak_signal = -self.breathing_signal # More reliable to low acceleration points, i.e. mid-inhale and mid-exhale
+        # More reliable to low acceleration points, i.e. mid-inhale and mid-exhale
+        if self.decimated_freq is not None:
+            breathing_peak_signal = -self.breathing_signal_decimated
+        else:
+            breathing_peak_signal = -self.breathing_signal
         breath_peaks_all, _ = find_peaks(breathing_peak_signal)
-        # Iterate through each peak index
-        for i in range(len(breath_peaks_all)):
-            peak_val = breathing_peak_signal[breath_peaks_all[i]]
-
-            if i == 0:
-                self.breath_peaks.append(breath_peaks_all[i])
-            else: 
-                # Use the previous peak as the starting point to search for the preceding trough
-                start_idx = breath_peaks_all[i-1]
-                end_idx = breath_peaks_all[i]
-                trough_idx = np.argmin(breathing_peak_signal[start_idx:end_idx]) + start_idx
-                trough_val = breathing_peak_signal[trough_idx]
-                
-                if peak_val - trough_val >= peak_threshold:
-                    # If the peak meets the criteria, add it to the list of valid peaks
-                    self.breath_peaks.append(breath_peaks_all[i])
+        self.breath_peaks = BreathingAnalyser.validate_breath_peaks(breathing_peak_signal, breath_peaks_all, self.peak_threshold)
+
+        if self.decimated_freq is not None:
+            self.breath_peaks = self.map_decimated_peaks(breathing_peak_signal, self.breath_peaks)
 
         # Calculate breathing rate from valid peaks
         self.br_values = 60/(np.diff(self.acc_times[self.breath_peaks])*2)
         self.br_times = self.acc_times[self.breath_peaks[1:]]
-        window_size = 3
-        self.br_values_smooth = np.zeros_like(self.br_values)
-        for i in range(len(self.br_values)):
-            if i < window_size:
-                self.br_values_smooth[i] = np.mean(self.br_values[0:i+window_size])
-            elif i > len(self.br_values) - window_size:
-                self.br_values_smooth[i] = np.mean(self.br_values[i-window_size:])
-            else:
-                self.br_values_smooth[i] = np.mean(self.br_values[i-window_size:i+window_size])
+        self.br_values_smooth = BreathingAnalyser.smooth_values(self.br_values, window_size=self.br_smooth_window)
+
+    @staticmethod
+    def validate_breath_peaks(signal, peaks, peak_threshold):
+        # A peak is valid if it rises `peak_threshold` above the trough since the previous peak, the first peak is always kept
+        if len(peaks) == 0:
+            return peaks
+        trough_vals = np.minimum.reduceat(signal, peaks)[:-1] # min over [previous peak, peak) for each peak after the first
+        valid = np.ones(len(peaks), dtype=bool)
+        valid[1:] = signal[peaks[1:]] - trough_vals >= peak_threshold
+        return peaks[valid]
+
+    @staticmethod
+    def smooth_values(values, window_size):
+        # Mean over [i - window_size, i + window_size), clipped at the ends of the series
+        n = len(values)
+        if n == 0:
+            return np.zeros_like(values)
+        window_sums = np.convolve(values, np.ones(2*window_size))[window_size - 1:n + window_size - 1]
+        idx = np.arange(n)
+        window_counts = np.minimum(n, idx + window_size) - np.maximum(0, idx - window_size)
+        return window_sums / window_counts
 
     def calculate_heart_rate_variability(self):
+        self.cached_stage('heart_rate_variability', 'ibi', {'ibi_p2p_fraction': self.ibi_p2p_fraction}, self.find_ibi_extremes,
+                          ['ibi_extremes_idx', 'hrv_values', 'hrv_times'])
+        self.hrv_values_interp = np.interp(self.br_times, self.hrv_times, self.hrv_values)
 
+    def find_ibi_extremes(self):
         # Heart rate variability
         ibi_peaks_idx, _ = find_peaks(self.ibi_values)
         ibi_troughs_idx, _ = find_peaks(-self.ibi_values)
         ibi_extremes_raw_idx = np.append(ibi_peaks_idx, ibi_troughs_idx)
         ibi_extremes_raw_idx = np.sort(ibi_extremes_raw_idx)
-        p2p_buffer = np.zeros(3)
-        for i in range(len(ibi_extremes_raw_idx)):
-            p2p_threshold = 0.15*np.amax(p2p_buffer) # peak-to-peak must be greater than 30% of max of the last 3
-            if i == 0:
-                self.ibi_extremes_idx.append(ibi_extremes_raw_idx[i])
-            else:
-                p2p = abs(self.ibi_values[ibi_extremes_raw_idx[i]] - self.ibi_values[ibi_extremes_raw_idx[i-1]])
-                if p2p > p2p_threshold: 
-                    self.ibi_extremes_idx.append(ibi_extremes_raw_idx[i])
-                    p2p_buffer = np.roll(p2p_buffer, -1)
-                    p2p_buffer[-1] = p2p
-        
+        self.ibi_extremes_idx = BreathingAnalyser.validate_ibi_extremes(self.ibi_values, ibi_extremes_raw_idx, self.ibi_p2p_fraction)
+
         ibi_extreme_times = self.ibi_times[self.ibi_extremes_idx]
         ibi_extreme_values = self.ibi_values[self.ibi_extremes_idx]
 
         self.hrv_values = abs(np.diff(ibi_extreme_values))
         self.hrv_times = ibi_extreme_times[1:]
-        self.hrv_values_interp = np.interp(self.br_times, self.hrv_times, self.hrv_values)
 
-    def show_breathing_signal(self):
+    @staticmethod
+    def validate_ibi_extremes(ibi_values, extremes_idx, p2p_fraction=0.15):
+        # Peak-to-peak must be greater than `p2p_fraction` (15%) of the max of the last 3 accepted, the first extreme is always kept.
+        # Acceptance depends on the accepted history, so this stays a scan, but over precomputed native floats.
+        if len(extremes_idx) == 0:
+            return extremes_idx
+        p2p_values = np.abs(np.diff(ibi_values[extremes_idx])).tolist()
+        valid = np.zeros(len(extremes_idx), dtype=bool)
+        valid[0] = True
+        p2p_1, p2p_2, p2p_3 = 0.0, 0.0, 0.0
+        for i, p2p in enumerate(p2p_values, start=1):
+            if p2p > p2p_fraction*max(p2p_1, p2p_2, p2p_3):
+                valid[i] = True
+                p2p_1, p2p_2, p2p_3 = p2p_2, p2p_3, p2p
+        return extremes_idx[valid]
+
+    def rolling_hrv(self, window=60):
+        # RMSSD, SDNN, pNN50 and mean HR of the `window` seconds ending at each beat, see RollingHrv.series
+        return RollingHrv.series(self.ibi_times, self.ibi_values, window)
 
-        fig, axes = plt.subplots(nrows=4, ncols=1, figsize=(10, 7))
-        axes[0].plot(self.acc_times, self.acc_values[:, 0], color='r', marker='o', label='x', markersize=0.3, linewidth=0.05)
-        axes[0].plot(self.acc_times, self.acc_low_pass[:, 0], color='gray', marker='o', label='gravity', markersize=0.3, linewidth=0.5)
-        axes[0].legend()
-        axes[0].set_ylabel('X Acceleration')
-
-        axes[1].plot(self.acc_times, self.acc_values[:, 1], color='g', marker='o', label='y', markersize=0.3, linewidth=0.05)
-        axes[1].plot(self.acc_times, self.acc_low_pass[:, 1], color='gray', marker='o', label='y', markersize=0.3, linewidth=0.5)
-        axes[1].set_ylabel('Y Acceleration')
-
-        axes[2].plot(self.acc_times, self.acc_values[:, 2], color='b', marker='o', label='z', markersize=0.3, linewidth=0.05)
-        axes[2].plot(self.acc_times, self.acc_low_pass[:, 2], color='gray', marker='o', label='z', markersize=0.3, linewidth=0.5)
-        axes[2].set_ylabel('Z Acceleration')
-
-        axes[3].plot(self.acc_times, self.acc_values_norm, color='k', marker='o', label='z', markersize=0.3, linewidth=0.05)
-        axes[3].plot(self.acc_times, self.acc_low_pass_norm, color='gray', marker='o', label='z', markersize=0.3, linewidth=0.5)
-        axes[3].set_ylabel('Norm')
-        axes[3].set_xlabel('Time')
-        plt.tight_layout()
-        plt.gcf().canvas.manager.set_window_title("Accelerometer & Low Pass data")
-        plt.show(block=False)
-
-        # Filtered
-        plt.figure()
-        plt.plot(self.acc_times, self.acc_values_filt[:, 0], color='r', marker='o', label='x', markersize=0.2, linewidth = 0.1)
-        plt.plot(self.acc_times, self.acc_values_filt[:, 1], color='g', marker='o', label='y', markersize=0.2, linewidth = 0.1)
-        plt.plot(self.acc_times, self.acc_values_filt[:, 2], color='b', marker='o', label='z', markersize=0.2, linewidth = 0.1)
-        plt.gcf().canvas.manager.set_window_title("Filtered Data")
-        plt.legend()
-        plt.xlabel('Time')
-        plt.ylabel('Acceleration (filtered)')
-        plt.show(block=False)
+    def spectral_breathing_rate(self, window=60, segment=30):
+        # Breathing rate of sliding windows from the peak of their spectrum, less fragile than peak picking on noisy stretches,
+        # see spectral.spectral_breathing_rate. Returns window end times, rates (bpm) and peak concentrations
+        if self.decimated_freq is not None:
+            return spectral.spectral_breathing_rate(self.acc_times, self.breathing_signal_decimated, self.ACC_SAMPLING_FREQ/self.decimation_factor, window, segment)
+        return spectral.spectral_breathing_rate(self.acc_times, self.breathing_signal, self.ACC_SAMPLING_FREQ, window, segment)
+
+    def spectral_hrv(self, window=300, segment=120):
+        # LF and HF power of the IBI series over sliding windows, see spectral.spectral_hrv
+        return spectral.spectral_hrv(self.ibi_times, self.ibi_values, window, segment)
+
+    def get_summary(self):
+        # Per-session metrics as plain Python values, e.g. for a batch summary table. Series are lists, statistics NaN if there is no data
+        def stats(values):
+            values = np.asarray(values, dtype=float)
+            if len(values) == 0:
+                return np.nan, np.nan, np.nan
+            return float(np.mean(values)), float(np.median(values)), float(np.std(values))
+
+        mean_br, median_br, sd_br = stats(self.br_values)
+        mean_hrv, median_hrv, sd_hrv = stats(self.hrv_values)
+        session_hrv = {metric: float(values[-1]) if len(values) else np.nan for metric, values in self.rolling_hrv(window=np.inf).items() if metric != 'times'}
+        return {
+            'duration': float(self.acc_times[-1] - self.acc_times[0]) if len(self.acc_times) > 0 else 0.0,
+            'n_breaths': len(self.breath_peaks),
+            'n_beats': len(self.ibi_values),
+            'mean_br': mean_br,
+            'median_br': median_br,
+            'sd_br': sd_br,
+            'mean_hrv': mean_hrv,
+            'median_hrv': median_hrv,
+            'sd_hrv': sd_hrv,
+            'mean_ibi': stats(self.ibi_values)[0],
+            'rmssd': session_hrv['rmssd'],
+            'sdnn': session_hrv['sdnn'],
+            'pnn50': session_hrv['pnn50'],
+            'br_times': np.asarray(self.br_times, dtype=float).tolist(),
+            'br_values': np.asarray(self.br_values, dtype=float).tolist(),
+            'hrv_times': np.asarray(self.hrv_times, dtype=float).tolist(),
+            'hrv_values': np.asarray(self.hrv_values, dtype=float).tolist(),
+        }
+
+    def show_breathing_signal(self):
+        self.full_rate_signals()
+        import breathing_plots
+        breathing_plots.show_breathing_signal(self)
 
     def show_heart_rate_variability(self):
+        self.full_rate_signals()
+        import breathing_plots
+        breathing_plots.show_heart_rate_variability(self)
 
-        # Breath peaks and IBI peaks
-        fig, axes = plt.subplots(nrows=2, ncols=1, figsize=(11, 6), sharex=True)
-        axes[0].plot(self.acc_times, self.acc_values_filt_norm, color='k', marker='o', label='norm', markersize=0.05, linewidth = 0)
-        axes[0].plot(self.acc_times, self.breathing_signal, color='b', marker='o', label='x', markersize=0.5, linewidth = 0.3)
-        axes[0].vlines(self.acc_times[self.breath_peaks], ymin=np.min(self.breathing_signal), ymax=np.max(self.breathing_signal), color='b', linewidth=0.2)
-        axes[0].set_ylim(0.9*np.min(self.breathing_signal), 1.1*np.max(self.breathing_signal))
-        fig.suptitle(f"Average breath rate: {np.average(self.br_values):.1f} bpm")
-        axes[0].set_xlabel('Time')
-        axes[0].set_ylabel('Breathing Acc Mag.', color='b')
-        axes[0].tick_params(axis='y', labelcolor='b')
-        axes[1].plot(self.ibi_times, self.ibi_values, color='r', marker='o', label='y', markersize=3, linewidth=2)
-        axes[1].vlines(self.ibi_times[self.ibi_extremes_idx], ymin=np.min(self.ibi_values), ymax=np.max(self.ibi_values), color='r', linewidth=0.2)
-        axes[1].set_ylabel('Interbeat interval', color='r')
-        axes[1].tick_params(axis='y', labelcolor='r')
-        plt.show(block=False)
-
-        # BR and HRV over time
-        fig, ax1 = plt.subplots(figsize=(11, 6))
-        ax2 = ax1.twinx()
-        ax1.plot(self.br_times, self.br_values, color='b', marker='o', label='x', markersize=3, linewidth=1)
-        ax1.plot(self.br_times, self.br_values_smooth, color='b', marker='o', label='x', markersize=0, linewidth=2, linestyle='--')
-        ax1.set_xlabel('Time')
-        ax1.set_ylabel('Breath rate (bpm)', color='b')
-        ax1.tick_params(axis='y', labelcolor='b')
-        ax2.plot(self.hrv_times, self.hrv_values, color='r', marker='o', label='hrv', markersize=3, linewidth=2)
-        ax2.plot(self.br_times, self.hrv_values_interp, color='gray', marker='o', label='hrv_interp', markersize=0, linewidth=1, linestyle='--')
-        ax2.set_ylabel('HRV (ms)', color='r')
-        ax2.tick_params(axis='y', labelcolor='r')
-        ax2.set_xlabel('Time')
-        plt.show(block=False)
-
-        # Breathing rate vs hrv
-        plt.figure()
-        plt.plot(self.br_values_smooth, self.hrv_values_interp, color='k', marker='o', label='y', markersize=3, linewidth=0)
-        plt.xlabel('Breath rate')
-        plt.ylabel('HRV')
-        plt.show() 
\ No newline at end of file
+    def save_report(self, path):
+        self.full_rate_signals()
+        import breathing_plots
+        breathing_plots.save_report(self, path)
@@ -0,0 +1,188 @@
+from scipy.signal import butter, sosfilt, sosfilt_zi, find_peaks
+from collections import deque
+import numpy as np
+from spectral import StreamingBreathingRate
+
+# BreathingStreamAnalyser – Incremental breathing rate and heart rate variability from live accelerometer and IBI chunks
+# Uses the same filters and threshold rules as BreathingAnalyser, but causal and stateful so each chunk costs the same
+# however long the session has run. The causal filters delay the breathing signal (~1 s at typical breathing rates),
+# which shifts breath peak times but not the breathing rate derived from them.
+
+class ExtremaTracker:
+    """
+    Finds local maxima (and optionally minima) of a stream chunk by chunk with `find_peaks`.
+    Only the trailing samples that cannot be resolved yet (the last sample, or a trailing plateau) are carried over, at most
+    `max_tail` of them: a plateau longer than that (a flat or saturated signal) is dropped from its start and can't become a peak.
+    """
+    def __init__(self, troughs=False, max_tail=None):
+        self.troughs = troughs
+        self.max_tail = max_tail
+        self.tail_values = np.zeros(0)
+        self.tail_times = np.zeros(0)
+        self.tail_start = 0 # stream index of tail_values[0]
+
+    def update(self, times, values):
+        """
+        Returns the chunk extended by the carried tail (times, values, stream index of its first sample), the stream
+        indices of newly resolved peaks and troughs, and the stream index from which samples are carried to the next update.
+        """
+        x = np.concatenate((self.tail_values, values))
+        t = np.concatenate((self.tail_times, times))
+        base = self.tail_start
+        peaks, _ = find_peaks(x)
+        troughs, _ = find_peaks(-x) if self.troughs else (np.zeros(0, dtype=int), None)
+
+        changes = np.flatnonzero(x[1:] != x[:-1])
+        carry_from = changes[-1] if len(changes) else 0 # one sample before the trailing run of equal values
+        if self.max_tail is not None:
+            carry_from = max(carry_from, len(x) - self.max_tail)
+        self.tail_values = x[carry_from:]
+        self.tail_times = t[carry_from:]
+        self.tail_start = base + carry_from
+
+        return t, x, base, peaks + base, troughs + base, self.tail_start
+
+class BreathingStreamAnalyser:
+    ACC_SAMPLING_FREQ = 200 # PolarH10.ACC_SAMPLING_FREQ
+    MAX_BREATH_PERIOD = 30 # s, longest plateau of the breathing signal carried over by breath_tracker
+    MAX_IBI_TAIL = 100 # IBIs, longest plateau carried over by ibi_tracker
+
+    def __init__(self, peak_threshold=0.02, br_window_size=3):
+        gravity_cutoff_freq = 0.04 # Hz
+        noise_cutoff_freq = 0.5 # Hz
+        filter_order = 2
+        nyquist_freq = 0.5 * self.ACC_SAMPLING_FREQ
+        self.gravity_sos = butter(filter_order, gravity_cutoff_freq / nyquist_freq, btype='low', output='sos')
+        self.noise_sos = butter(filter_order, noise_cutoff_freq / nyquist_freq, btype='low', output='sos')
+        self.gravity_zi = None
+        self.noise_zi = None
+        self.peak_threshold = peak_threshold
+
+        # Breath peaks, searched on the negated breathing signal
+        self.breath_tracker = ExtremaTracker(max_tail=self.MAX_BREATH_PERIOD*self.ACC_SAMPLING_FREQ)
+        self.has_candidate = False
+        self.trough_search_idx = 0 # samples before this stream index are folded into trough_search_min
+        self.trough_search_min = np.inf # min of the signal since the last candidate peak
+        self.last_breath_time = None
+        self.br_recent = deque(maxlen=br_window_size)
+        self.br_latest = None
+        self.br_smooth_latest = None
+        self.breathing_signal_chunk = np.zeros(0)
+        self.breathing_times_chunk = np.zeros(0)
+        self.spectral_br = StreamingBreathingRate(self.ACC_SAMPLING_FREQ) # br_latest: spectral estimate of the last 60 s
+
+        # IBI extremes
+        self.ibi_tracker = ExtremaTracker(troughs=True, max_tail=self.MAX_IBI_TAIL)
+        self.p2p_buffer = deque([0.0, 0.0, 0.0], maxlen=3)
+        self.last_extreme_value = None
+        self.last_valid_extreme_value = None
+        self.hrv_latest = None
+
+        # Read positions in the PolarH10 stream buffers, see update_from_device
+        self.acc_total = 0
+        self.ibi_total = 0
+
+    def update_acc(self, acc_times, acc_values):
+        """
+        Feed a chunk of raw ACC samples (milli-g, as streamed by PolarH10).
+        Returns the times, breathing rates and smoothed breathing rates of breaths completed in this chunk.
+        The smoothed rate is the mean of the last `br_window_size` rates (causal, unlike BreathingAnalyser's centred window).
+        """
+        acc_values = np.asarray(acc_values)/100.0
+        if len(acc_values) == 0:
+            return np.zeros(0), np.zeros(0), np.zeros(0)
+
+        # Gravity Filter, state starts in steady state on the first sample to avoid a start-up transient
+        if self.gravity_zi is None:
+            self.gravity_zi = sosfilt_zi(self.gravity_sos)[:, :, None] * acc_values[0]
+        acc_low_pass, self.gravity_zi = sosfilt(self.gravity_sos, acc_values, axis=0, zi=self.gravity_zi)
+        acc_values_filt_norm = np.linalg.norm(acc_values - acc_low_pass, axis=1)
+
+        # Noise Filter
+        if self.noise_zi is None:
+            self.noise_zi = sosfilt_zi(self.noise_sos) * acc_values_filt_norm[0]
+        breathing_signal, self.noise_zi = sosfilt(self.noise_sos, acc_values_filt_norm, zi=self.noise_zi)
+        self.breathing_signal_chunk = breathing_signal
+        self.breathing_times_chunk = np.asarray(acc_times)
+        self.spectral_br.update(self.breathing_times_chunk, breathing_signal)
+
+        # Breath peaks: a peak is valid if it rises `peak_threshold` above the lowest point since the previous candidate peak
+        times, signal, base, peaks, _, carry_from = self.breath_tracker.update(acc_times, -breathing_signal)
+        br_times, br_values, br_values_smooth = [], [], []
+        for peak_idx in peaks:
+            peak_val = signal[peak_idx - base]
+            if self.has_candidate:
+                # Use the previous peak as the starting point to search for the preceding trough
+                segment = signal[self.trough_search_idx - base:peak_idx - base]
+                trough_val = min(self.trough_search_min, segment.min()) if len(segment) else self.trough_search_min
+                is_valid = peak_val - trough_val >= self.peak_threshold
+            else:
+                is_valid = True
+            if is_valid:
+                peak_time = times[peak_idx - base]
+                if self.last_breath_time is not None:
+                    self.br_latest = 60/((peak_time - self.last_breath_time)*2)
+                    self.br_recent.append(self.br_latest)
+                    self.br_smooth_latest = np.mean(self.br_recent)
+                    br_times.append(peak_time)
+                    br_values.append(self.br_latest)
+                    br_values_smooth.append(self.br_smooth_latest)
+                self.last_breath_time = peak_time
+            self.has_candidate = True
+            self.trough_search_min = peak_val
+            self.trough_search_idx = peak_idx
+
+        # Fold the samples that won't be seen again into the trough search
+        if self.has_candidate and carry_from > self.trough_search_idx:
+            segment = signal[self.trough_search_idx - base:carry_from - base]
+            self.trough_search_min = min(self.trough_search_min, segment.min())
+            self.trough_search_idx = carry_from
+
+        return np.array(br_times), np.array(br_values), np.array(br_values_smooth)
+
+    def update_ibi(self, ibi_times, ibi_values):
+        """
+        Feed a chunk of IBIs (ms). Returns the times and values of HRV (peak-to-trough IBI amplitude) completed in this chunk.
+        """
+        times, values, base, peaks, troughs, _ = self.ibi_tracker.update(ibi_times, np.asarray(ibi_values, dtype=float))
+        hrv_times, hrv_values = [], []
+        for extreme_idx in np.sort(np.append(peaks, troughs)):
+            value = values[extreme_idx - base]
+            if self.last_extreme_value is None:
+                self.last_valid_extreme_value = value
+            else:
+                p2p_threshold = 0.15*max(self.p2p_buffer) # peak-to-peak must be greater than 15% of max of the last 3
+                p2p = abs(value - self.last_extreme_value)
+                if p2p > p2p_threshold:
+                    self.hrv_latest = abs(value - self.last_valid_extreme_value)
+                    hrv_times.append(times[extreme_idx - base])
+                    hrv_values.append(self.hrv_latest)
+                    self.last_valid_extreme_value = value
+                    self.p2p_buffer.append(p2p)
+            self.last_extreme_value = value
+
+        return np.array(hrv_times), np.array(hrv_values)
+
+    def update_from_device(self, polar_device):
+        """
+        Feed the samples a PolarH10 has received since the last call. Returns (br_times, br_values, br_values_smooth), (hrv_times, hrv_values).
+        IBI times are rel to the start of the acc session, so IBIs are held back until the first ACC frame has arrived.
+        Samples a bounded PolarH10 buffer has already overwritten are skipped.
+        New samples are copied under the device's buffer lock, so a DecodeWorker can keep appending on its own thread.
+        """
+        with polar_device.buffer_lock:
+            acc_times = polar_device.acc_stream_times.since(self.acc_total).copy()
+            acc_values = polar_device.acc_stream_values.since(self.acc_total).copy()
+            self.acc_total = polar_device.acc_stream_values.total
+            acc_stream_start_time = polar_device.acc_stream_start_time
+            if acc_stream_start_time is not None:
+                ibi_times = polar_device.ibi_stream_times.since(self.ibi_total).copy()
+                ibi_values = polar_device.ibi_stream_values.since(self.ibi_total).copy()
+                self.ibi_total = polar_device.ibi_stream_values.total
+        br = self.update_acc(acc_times, acc_values)
+
+        hrv = (np.zeros(0), np.zeros(0))
+        if acc_stream_start_time is not None:
+            hrv = self.update_ibi(ibi_times - acc_stream_start_time, ibi_values)
+
+        return br, hrv
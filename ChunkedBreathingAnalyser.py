@@ -0,0 +1,141 @@
+from scipy.signal import butter, filtfilt, find_peaks
+import numpy as np
+from BreathingAnalyser import BreathingAnalyser
+
+# ChunkedBreathingAnalyser – BreathingAnalyser for recordings too long to filter in memory, e.g. memory-mapped 24 h sessions
+# The ACC is processed in blocks of `block_size` samples. Each block is filtered with `padding` samples of its neighbours on
+# either side, enough for the impulse responses of both zero-phase filters to decay below `tolerance`, so the block's own samples
+# match filtering the whole recording to within `tolerance` (relative) and peaks match exactly. Breath peaks are found per block,
+# with a margin either side so peaks at a seam see both neighbours, and the trough since the previous peak is carried across
+# blocks for their validation. Full-length signals are only kept if listed in `materialize`, peak memory is then set by
+# `block_size` rather than by the recording length. Plots and the spectral breathing rate raise a ValueError naming the signals
+# they need if those weren't kept.
+
+class ChunkedBreathingAnalyser(BreathingAnalyser):
+    SIGNALS = ('acc_values', 'acc_values_norm', 'acc_low_pass', 'acc_low_pass_norm', 'acc_values_filt', 'acc_values_filt_norm', 'breathing_signal')
+    PEAK_MARGIN = 200 # samples either side of a block searched for its peaks, longer than any plateau of the filtered signal
+
+    def __init__(self, acc_data, ibi_data, block_size=2**20, materialize=(), tolerance=1e-9, gravity_cutoff_freq=0.04,
+                 noise_cutoff_freq=0.5, filter_order=2, peak_threshold=0.02, br_smooth_window=3, ibi_p2p_fraction=0.15):
+        # materialize: names from SIGNALS to keep as full-length arrays, the others are None
+        unknown = set(materialize) - set(self.SIGNALS)
+        if unknown:
+            raise ValueError(f"Unknown signals {sorted(unknown)}, choose from {self.SIGNALS}")
+        self.set_parameters(None, gravity_cutoff_freq, noise_cutoff_freq, filter_order, peak_threshold, br_smooth_window, ibi_p2p_fraction, None)
+        self.block_size = block_size
+        self.materialize = tuple(materialize)
+        self.acc_times, self.acc_data_values = acc_data['times'], acc_data['values'] # raw, scaled per block
+        self.ibi_times, self.ibi_values = ibi_data['times'], ibi_data['values']
+        self.clear_results()
+        for name in self.SIGNALS:
+            setattr(self, name, None)
+
+        nyquist_freq = 0.5 * self.ACC_SAMPLING_FREQ
+        self.gravity_filter = butter(filter_order, gravity_cutoff_freq / nyquist_freq, btype='low')
+        self.noise_filter = butter(filter_order, noise_cutoff_freq / nyquist_freq, btype='low')
+        self.padding = (ChunkedBreathingAnalyser.settling_samples(*self.gravity_filter, tolerance)
+                        + ChunkedBreathingAnalyser.settling_samples(*self.noise_filter, tolerance) + self.PEAK_MARGIN)
+
+        self.calculate_breathing_rate()
+        self.calculate_heart_rate_variability()
+
+    @staticmethod
+    def settling_samples(b, a, tolerance):
+        # Samples for the impulse response of (b, a) to decay below `tolerance`, from the radius of its slowest pole,
+        # plus filtfilt's edge padding. Doubled, as the breathing signal is orders of magnitude smaller than gravity, whose
+        # filter state the error at a seam is relative to
+        radius = np.max(np.abs(np.roots(a)))
+        return 2*int(np.ceil(np.log(tolerance)/np.log(radius))) + 3*max(len(a), len(b))
+
+    def blocks(self):
+        # (start, end) of each block and its padded range [lo, hi)
+        n_samples = len(self.acc_times)
+        for start in range(0, n_samples, self.block_size):
+            end = min(start + self.block_size, n_samples)
+            yield start, end, max(0, start - self.padding), min(n_samples, end + self.padding)
+
+    def filter_block(self, lo, hi):
+        # The signals of samples [lo, hi), as in BreathingAnalyser.calculate_breathing_signal
+        b, a = self.gravity_filter
+        acc_values = self.acc_data_values[lo:hi]/100.0
+        acc_low_pass = filtfilt(b, a, acc_values, axis=0)
+        acc_values_filt = acc_values - acc_low_pass
+        acc_values_filt_norm = np.linalg.norm(acc_values_filt, axis=1)
+        b, a = self.noise_filter
+        signals = {'acc_values_filt_norm': acc_values_filt_norm, 'breathing_signal': filtfilt(b, a, acc_values_filt_norm)}
+        if 'acc_values' in self.materialize:
+            signals['acc_values'] = acc_values
+        if 'acc_values_norm' in self.materialize:
+            signals['acc_values_norm'] = np.linalg.norm(acc_values, axis=1)
+        if 'acc_low_pass' in self.materialize:
+            signals['acc_low_pass'] = acc_low_pass
+        if 'acc_low_pass_norm' in self.materialize:
+            signals['acc_low_pass_norm'] = np.linalg.norm(acc_low_pass, axis=1)
+        if 'acc_values_filt' in self.materialize:
+            signals['acc_values_filt'] = acc_values_filt
+        return signals
+
+    def calculate_breathing_signal(self):
+        # All signals are computed block by block in calculate_breathing_rate
+        pass
+
+    def calculate_breathing_rate(self):
+        n_samples = len(self.acc_times)
+        for name in self.materialize:
+            setattr(self, name, np.empty((n_samples, 3) if name in ('acc_values', 'acc_low_pass', 'acc_values_filt') else n_samples))
+
+        peaks = []
+        trough = None # min of the peak signal since the last raw peak, None before the first
+        for start, end, lo, hi in self.blocks():
+            signals = self.filter_block(lo, hi)
+            for name in self.materialize:
+                getattr(self, name)[start:end] = signals[name][start - lo:end - lo]
+
+            # Raw peaks of the block, searched with a margin so those at its first and last sample see their neighbours
+            margin_lo, margin_hi = max(lo, start - self.PEAK_MARGIN), min(hi, end + self.PEAK_MARGIN)
+            peak_signal = -signals['breathing_signal'][margin_lo - lo:margin_hi - lo] # as in BreathingAnalyser.find_breaths
+            block_peaks, _ = find_peaks(peak_signal)
+            block_peaks = block_peaks[(block_peaks >= start - margin_lo) & (block_peaks < end - margin_lo)]
+            core = peak_signal[start - margin_lo:end - margin_lo]
+            block_peaks -= start - margin_lo
+            if len(block_peaks) == 0:
+                if trough is not None:
+                    trough = min(trough, core.min())
+                continue
+
+            # A peak is valid if it rises peak_threshold above the trough since the previous raw peak, see validate_breath_peaks
+            troughs = np.empty(len(block_peaks))
+            troughs[0] = np.inf if trough is None else min(trough, core[:block_peaks[0]].min(initial=np.inf))
+            troughs[1:] = np.minimum.reduceat(core, block_peaks)[:-1]
+            valid = core[block_peaks] - troughs >= self.peak_threshold
+            if trough is None:
+                valid[0] = True # the first peak is always kept
+            peaks.append(block_peaks[valid] + start)
+            trough = core[block_peaks[-1]:].min()
+
+        self.breath_peaks = np.concatenate(peaks) if peaks else np.zeros(0, dtype=int)
+        self.br_values = 60/(np.diff(self.acc_times[self.breath_peaks])*2)
+        self.br_times = self.acc_times[self.breath_peaks[1:]]
+        self.br_values_smooth = BreathingAnalyser.smooth_values(self.br_values, window_size=self.br_smooth_window)
+
+    def require(self, use, *names):
+        # Raise if `use` needs full-length signals that weren't kept
+        missing = [name for name in names if name not in self.materialize]
+        if missing:
+            raise ValueError(f"{use} needs the full-length {', '.join(missing)}, pass materialize={tuple(names)} to ChunkedBreathingAnalyser")
+
+    def spectral_breathing_rate(self, window=60, segment=30):
+        self.require('spectral_breathing_rate', 'breathing_signal')
+        return super().spectral_breathing_rate(window, segment)
+
+    def show_breathing_signal(self):
+        self.require('show_breathing_signal', 'acc_values', 'acc_values_norm', 'acc_low_pass', 'acc_low_pass_norm', 'acc_values_filt')
+        super().show_breathing_signal()
+
+    def show_heart_rate_variability(self):
+        self.require('show_heart_rate_variability', 'acc_values_filt_norm', 'breathing_signal')
+        super().show_heart_rate_variability()
+
+    def save_report(self, path):
+        self.require('save_report', 'breathing_signal')
+        super().save_report(path)
@@ -1,89 +1,428 @@
-from bleak import BleakScanner
 import asyncio
+import json
 import numpy as np
 from tqdm import tqdm
 import argparse
 from PolarH10 import PolarH10
 from BreathingAnalyser import BreathingAnalyser
+from AnalysisCache import AnalysisCache
+from session_file import save_session, load_session, convert_csv_session
+from SessionWriter import SessionWriter
+from DecodeWorker import DecodeWorker
+from RPeakDetector import RPeakDetector
+import os
+import sys
 
 """ DHYB.py
-Scan and connect to Polar H10 device
+Scan and connect to Polar H10 devices
 Retrieve basic sensor information including battery level and serial number
-- Stream accelerometer data simultaneously with heart rate data
+- Stream accelerometer data simultaneously with heart rate data, from several straps concurrently
+- Optionally stream ECG and take IBIs from its R peaks instead of the heart rate service
+- Quick connect: stop scanning as soon as the strap is seen, by its remembered address, and read device info while streaming
 - Alternatively read sample data from a file
+- Optionally show the breathing signal, IBIs and BR/HRV live while recording
+- Show plots, or run headless and output summary metrics (JSON/CSV) and an image report
 """
 
-async def main(record_len):
-    
-    devices = await BleakScanner.discover()
-    polar_device_found = False
-    acc_data = None
-    ibi_data = None
-
-    for device in devices:
-        if device.name is not None and "Polar" in device.name:
-            polar_device_found = True
-            polar_device = PolarH10(device)
-            await polar_device.connect()
-            await polar_device.get_device_info()
-            await polar_device.print_device_info()
-
-            await polar_device.start_acc_stream()
-            await polar_device.start_hr_stream()
-            for i in tqdm(range(record_len), desc='Recording...'):
-                await asyncio.sleep(1)
-            await polar_device.stop_acc_stream()
-            await polar_device.stop_hr_stream()
+SAMPLE_SESSION_FILE = "data/sample_data.dhyb"
+KNOWN_DEVICES_FILE = "data/known_devices.json" # {device ID: BLE address} of straps recorded before
+
+def is_selected_device(device, device_ids, name=None):
+    # Polar straps advertise as "Polar H10 <device ID>", the ID is printed on the strap and is part of its serial number.
+    # `name` overrides device.name, e.g. with the local name of an advertisement
+    name = name or device.name
+    if name is None or "Polar" not in name:
+        return False
+    if not device_ids:
+        return True
+    return any(device_id.lower() == device.address.lower() or device_id in name for device_id in device_ids)
+
+def polar_filter(device_ids):
+    # Filter for BleakScanner.find_device_by_filter. The name is taken from the advertisement, device.name may only be
+    # filled in from a later scan response
+    return lambda device, advertisement_data: is_selected_device(device, device_ids, advertisement_data.local_name)
+
+def load_known_devices(path=KNOWN_DEVICES_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_known_devices(devices, path=KNOWN_DEVICES_FILE):
+    known_devices = load_known_devices(path)
+    known_devices.update({device_label(device): device.address for device in devices if device.name})
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(known_devices, f, indent=1)
+
+async def find_devices(scanner, device_ids=None, quick_connect=False, timeout=5.0, known_devices=None):
+    """
+    The Polar straps to record. By default all straps found in a `timeout` s scan, or those in `device_ids`.
+    With `quick_connect`, each scan returns as soon as its strap is seen instead: the first Polar strap if there are no
+    `device_ids`, else each of them, by its address if it is in `known_devices` ({device ID: address}) and by name otherwise.
+    """
+    if not quick_connect:
+        devices = await scanner.discover(timeout=timeout)
+        return [device for device in devices if is_selected_device(device, device_ids)]
+    if not device_ids:
+        device = await scanner.find_device_by_filter(polar_filter(None), timeout=timeout)
+        return [device] if device is not None else []
+    devices = []
+    for device_id in device_ids:
+        device = None
+        address = (known_devices or {}).get(device_id)
+        if address is not None:
+            device = await scanner.find_device_by_address(address, timeout=timeout)
+        if device is None: # not recorded before, or its address changed
+            device = await scanner.find_device_by_filter(polar_filter([device_id]), timeout=timeout)
+        if device is None:
+            print(f"{device_id}: not found")
+        else:
+            devices.append(device)
+    return devices
+
+def device_label(device):
+    return device.name.split()[-1] if device.name else device.address
 
-            acc_data = polar_device.get_acc_data()
-            ibi_data = polar_device.get_ibi_data()
+async def monitor_loop_lag(stats, interval=0.05):
+    # How late the event loop wakes a sleeping task, i.e. how far BLE notification handling can fall behind
+    while True:
+        start = asyncio.get_running_loop().time()
+        await asyncio.sleep(interval)
+        stats['max_loop_lag'] = max(stats['max_loop_lag'], asyncio.get_running_loop().time() - start - interval)
 
+async def log_stream_health(polar_device, label, interval, decode_worker=None, session_writer=None):
+    # Periodic health line per strap: sample rates, gaps, callback times and clock drift, see StreamHealth, and the frames the
+    # decoder and the chunks the session writer have dropped so far
+    while True:
+        await asyncio.sleep(interval)
+        line = f"{label}: {polar_device.health.summary_line()}"
+        if decode_worker is not None and decode_worker.counts['dropped'] > 0:
+            line += f" | decoder dropped {decode_worker.counts['dropped']} frames"
+        if session_writer is not None and session_writer.dropped_chunks > 0:
+            line += f" | writer dropped {session_writer.dropped_chunks} chunks"
+        tqdm.write(line)
+
+async def read_device_info(polar_device, session_writer=None):
+    await polar_device.get_device_info()
+    await polar_device.print_device_info()
+    if session_writer is not None:
+        session_writer.update_metadata(**polar_device.get_device_metadata())
+
+async def record_device(device, record_len, position, session_path, session_writer=None, buffer_len=None, client_class=None, dashboard=None, decode_queue=2048, overflow='drop_oldest', health_interval=0, ibi_source='hr', defer_device_info=False, decode_workers=None):
+    # Record one strap. Errors are caught and reported so a dropped strap doesn't stop the others.
+    # Notifications are decoded on a DecodeWorker thread with a `decode_queue` frame queue, or in the bleak callbacks if 0.
+    # With `ibi_source` 'ecg', ECG is streamed too and the result also has 'ecg_ibi_data', IBIs from its R peaks.
+    # With `defer_device_info`, streaming starts first and the device information is read while recording.
+    # The DecodeWorker is also added to `decode_workers`, if given, so the caller can stop it if recording is interrupted
+    polar_device = PolarH10(device, buffer_len=buffer_len, client_class=client_class)
+    decode_worker = None
+    if decode_queue > 0:
+        decode_worker = DecodeWorker(polar_device, max_queue=decode_queue, overflow=overflow)
+        decode_worker.start()
+        if decode_workers is not None:
+            decode_workers.append(decode_worker)
+    if session_writer is not None:
+        polar_device.add_sink(session_writer)
+    result = {'device': device, 'polar_device': polar_device, 'decode_worker': decode_worker, 'session_path': session_path, 'error': None, 'duration': 0.0}
+    loop = asyncio.get_running_loop()
+    device_info = None
+    try:
+        await polar_device.connect()
+        if not defer_device_info:
+            await read_device_info(polar_device, session_writer)
+
+        await polar_device.start_acc_stream()
+        if ibi_source == 'ecg':
+            await polar_device.start_ecg_stream()
+        await polar_device.start_hr_stream()
+        if defer_device_info:
+            device_info = asyncio.create_task(read_device_info(polar_device, session_writer))
+        if dashboard is not None:
+            dashboard.add_device(polar_device, device_label(device))
+        health_logger = None
+        if health_interval > 0:
+            health_logger = asyncio.create_task(log_stream_health(polar_device, device_label(device), health_interval, decode_worker, session_writer))
+        start_time = loop.time()
+        try:
+            for i in tqdm(range(record_len), desc=f'Recording {device_label(device)}...', position=position):
+                await asyncio.sleep(1)
+        finally:
+            result['duration'] = loop.time() - start_time
+            if health_logger is not None:
+                health_logger.cancel()
+        if ibi_source == 'ecg':
+            await polar_device.stop_ecg_stream()
+        await polar_device.stop_acc_stream()
+        await polar_device.stop_hr_stream()
+        if device_info is not None:
+            await device_info
+    except Exception as e:
+        result['error'] = e
+        print(f"{device_label(device)}: recording stopped, {type(e).__name__}: {e}")
+    finally:
+        if device_info is not None and not device_info.done():
+            device_info.cancel()
+        try:
             await polar_device.disconnect()
-    
-    if not polar_device_found:
+        except Exception:
+            pass
+        if decode_worker is not None:
+            decode_worker.stop() # decodes the frames still queued
+
+    if len(polar_device.acc_stream_times) > 0:
+        result['acc_data'] = polar_device.get_acc_data()
+        result['ibi_data'] = polar_device.get_ibi_data()
+    else:
+        result['acc_data'], result['ibi_data'] = None, None
+    result['ecg_data'], result['ecg_ibi_data'] = None, None
+    if len(polar_device.ecg_stream_times) > 0:
+        result['ecg_data'] = polar_device.get_ecg_data()
+        if polar_device.acc_time_origin is not None:
+            result['ecg_ibi_data'] = polar_device.get_ibi_data('ecg')
+    result['metadata'] = polar_device.get_device_metadata()
+    return result
+
+def print_packet_stats(results, loop_stats):
+    print("Device      ACC frames/s  ACC samples/s  HR packets/s  Dropped  Gaps (samples)  Clock drift  Status")
+    for result in results:
+        polar_device = result['polar_device']
+        duration = max(result['duration'], 1e-9)
+        status = "ok" if result['error'] is None else f"failed ({type(result['error']).__name__})"
+        dropped = result['decode_worker'].counts['dropped'] if result['decode_worker'] is not None else 0
+        health = polar_device.health.snapshot()
+        acc_health = health['streams'].get('acc', {'gaps': 0, 'missing_samples': 0})
+        gaps = f"{acc_health['gaps']} ({acc_health['missing_samples']})"
+        drift = f"{health['clock_drift_ppm']:+.0f} ppm" if np.isfinite(health['clock_drift_ppm']) else "-"
+        print(f"{device_label(result['device']):<12}{polar_device.packet_counts['acc']/duration:>12.1f}"
+              f"{polar_device.acc_stream_values.total/duration:>15.1f}{polar_device.packet_counts['hr']/duration:>14.2f}{dropped:>9}{gaps:>16}{drift:>13}  {status}")
+    print(f"Max event loop lag: {loop_stats['max_loop_lag']*1e3:.1f} ms")
+
+async def main(record_len, device_ids=None, session_path=SAMPLE_SESSION_FILE, session_writers=None, buffer_len=None, scanner=None, client_class=None, live_window=None, decode_queue=2048, overflow='drop_oldest', health_interval=0, ibi_source='hr',
+               quick_connect=False, scan_timeout=5.0, known_devices_path=None, decode_workers=None):
+    """
+    Record all selected Polar devices concurrently, each into its own PolarH10 buffers and session file (`session_path`,
+    suffixed with the device ID when there are several). If `session_writers` is a dict, each device records through a
+    SessionWriter collected there by session path, so the caller can finalize them even if recording is interrupted.
+    Returns one result dict per device with 'acc_data', 'ibi_data', 'metadata', 'session_path' and 'error'.
+    `scanner` and `client_class` replace BleakScanner and BleakClient, e.g. with PolarH10Simulator's stand-ins.
+    `decode_queue` and `overflow` configure each device's DecodeWorker, see record_device. If `decode_workers` is a list, the
+    DecodeWorkers are collected there, so the caller can stop them (decoding the frames still queued) before finalizing the writers.
+    With `health_interval` (s), a stream health line is printed for each device at that interval.
+    `ibi_source` 'ecg' also streams ECG, with IBIs from its R peaks (RPeakDetector) in 'ecg_ibi_data' and the ECG in 'ecg_data'.
+    With `live_window` (s), a LiveDashboard shows the most recent breathing signal and IBIs of each device while recording.
+    `quick_connect` stops scanning as soon as the straps are seen (see find_devices) and reads device info after streaming has
+    started. Addresses of the straps found are remembered in `known_devices_path`, if given, for later quick connects.
+    """
+    if scanner is None:
+        from bleak import BleakScanner # imported here so analysing saved sessions doesn't load bleak
+        scanner = BleakScanner
+    known_devices = load_known_devices(known_devices_path) if known_devices_path is not None else {}
+    polar_devices = await find_devices(scanner, device_ids, quick_connect, scan_timeout, known_devices)
+    if len(polar_devices) == 0:
         print("No Polar device found")
+        return []
+    if known_devices_path is not None:
+        save_known_devices(polar_devices, known_devices_path)
+
+    dashboard = None
+    if live_window is not None:
+        from LiveDashboard import LiveDashboard # imports matplotlib
+        dashboard = LiveDashboard(window=live_window)
+
+    recordings = []
+    for position, device in enumerate(polar_devices):
+        device_path = device_session_path(session_path, device, len(polar_devices))
+        session_writer = None
+        if session_writers is not None:
+            # With a DecodeWorker, appends come from its thread and can wait for the disk, its queue then takes the backlog
+            session_writer = SessionWriter(recording_journal_path(device_path), block_when_behind=decode_queue > 0)
+            session_writers[device_path] = session_writer
+        recordings.append(record_device(device, record_len, position, device_path, session_writer, buffer_len, client_class, dashboard, decode_queue, overflow, health_interval, ibi_source, quick_connect, decode_workers))
+
+    loop_stats = {'max_loop_lag': 0.0}
+    lag_monitor = asyncio.create_task(monitor_loop_lag(loop_stats))
+    if dashboard is not None:
+        dashboard_task = asyncio.create_task(dashboard.run())
+    start_time = asyncio.get_running_loop().time()
+    results = await asyncio.gather(*recordings)
+    lag_monitor.cancel()
+    print_packet_stats(results, loop_stats)
+    if dashboard is not None:
+        dashboard_task.cancel()
+        dashboard.print_stats(asyncio.get_running_loop().time() - start_time)
 
-    return [acc_data, ibi_data]
+    return results
 
-def save_sample_data(acc_data, ibi_data):
-    np.savetxt("data/sample_data_acc.csv", np.column_stack((acc_data['times'], acc_data['values'])), delimiter=",")
-    np.savetxt("data/sample_data_ibi.csv", np.column_stack((ibi_data['times'], ibi_data['values'])), delimiter=",")
+def device_session_path(session_path, device, n_devices):
+    # One session file per strap when recording several at once
+    if n_devices == 1:
+        return session_path
+    root, ext = os.path.splitext(session_path)
+    return f"{root}_{device_label(device).replace(':', '')}{ext}"
 
-def load_sample_data():
-    sample_acc_data = np.loadtxt("data/sample_data_acc.csv", delimiter=",")
-    acc_data = {'times': sample_acc_data[:, 0], 'values': sample_acc_data[:, 1:]}
-    sample_ibi_data = np.loadtxt("data/sample_data_ibi.csv", delimiter=",")
-    ibi_data = {'times': sample_ibi_data[:, 0], 'values': sample_ibi_data[:, 1]}
-    return acc_data, ibi_data
+def save_sample_data(acc_data, ibi_data, metadata=None, path=SAMPLE_SESSION_FILE, ecg_data=None):
+    save_session(path, acc_data=acc_data, ibi_data=ibi_data, ecg_data=ecg_data, metadata=metadata)
+    print(f"Data saved to {path}")
+
+def session_ecg_ibi_data(session):
+    # IBIs from R peaks of a loaded session's ECG
+    if session['ecg'] is None:
+        raise ValueError("session has no ECG data, record with --ibi-source ecg")
+    return RPeakDetector.ibi_data(session['ecg'], session['metadata'].get('acc_time_origin'))
+
+def load_sample_data(path=SAMPLE_SESSION_FILE, ibi_source='hr'):
+    # Older recordings were saved as CSV, convert them to a session file on first use
+    if not os.path.exists(path) and path == SAMPLE_SESSION_FILE and os.path.exists("data/sample_data_acc.csv"):
+        convert_csv_session("data/sample_data_acc.csv", "data/sample_data_ibi.csv", path)
+    session = load_session(path)
+    return session['acc'], session_ecg_ibi_data(session) if ibi_source == 'ecg' else session['ibi']
+
+def write_metrics(rows, path=None, stream=None):
+    # Summary metrics of each analysed recording, as CSV (same columns as batch_analysis) if `path` ends in .csv, else JSON.
+    # No path prints JSON to `stream` (default stdout)
+    if path is not None and path.endswith(".csv"):
+        import csv
+        from batch_analysis import SUMMARY_FIELDS, format_row
+        with open(path, "w", newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+            writer.writeheader()
+            writer.writerows(format_row(row) for row in rows)
+    else:
+        text = json.dumps([{key: (None if isinstance(value, float) and np.isnan(value) else value) for key, value in row.items()} for row in rows])
+        if path is None:
+            print(text, file=stream or sys.stdout)
+        else:
+            with open(path, "w") as f:
+                f.write(text)
+    if path is not None:
+        print(f"Metrics written to {path}")
+
+def report_path(path, session_path, n_recordings):
+    # One report per recording when several straps were recorded
+    if n_recordings == 1:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}_{os.path.splitext(os.path.basename(session_path))[0]}{ext}"
+
+def recording_journal_path(session_path):
+    return os.path.splitext(session_path)[0] + ".dhybrec"
 
 def get_arguments():
     parser = argparse.ArgumentParser(description="Polar H10 Heart Rate Variability and Breathing Rate Monitor")
     parser.add_argument("--use-sample-data", action="store_true", help="Use sample data loaded from a file")
+    parser.add_argument("--session-file", default=SAMPLE_SESSION_FILE, help="Session file to load sample data from and save recordings to")
     parser.add_argument("--record-len", type=int, default=20, help="Length of recording in seconds")
+    parser.add_argument("--device", nargs="+", default=None, help="Only record these devices, by BLE address or device ID (serial, as in the 'Polar H10 <ID>' name). Default: all Polar devices found")
+    parser.add_argument("--record-file", default=None, help="Write the recording to this session file while recording, crash-safe (a .dhybrec journal is kept until the recording finishes)")
+    parser.add_argument("--buffer-len", type=float, default=None, help="Seconds of each stream to keep in memory (default: all, or 60 with --record-file)")
+    parser.add_argument("--quick-connect", action="store_true", help="Stop scanning as soon as the strap (the first one, or each --device) is seen, using addresses remembered from earlier recordings, and read device info while streaming")
+    parser.add_argument("--scan-timeout", type=float, default=5.0, help="Seconds to scan for straps")
+    parser.add_argument("--simulate", type=int, default=0, metavar="N", help="Record from N simulated Polar H10s instead of scanning for real ones")
+    parser.add_argument("--simulate-speed", type=float, default=1.0, help="Speed-up of the simulated straps over real time, e.g. 10 to load test notification handling")
+    parser.add_argument("--simulate-replay", default=None, help="Session file the simulated straps replay instead of synthetic data")
+    parser.add_argument("--decimated-freq", type=float, default=None, help="Filter the breathing signal at this lower rate in Hz (e.g. 10), faster on long recordings")
+    parser.add_argument("--peak-threshold", type=float, default=0.02, help="Min rise of a breath peak above the preceding trough")
+    parser.add_argument("--cache-dir", default=None, help="Cache filtered signals, peaks and HRV in this directory, so reopening a session is instant")
+    parser.add_argument("--cache-size", type=float, default=2048, help="Max size of the cache in MB, least recently used results are removed first")
+    parser.add_argument("--decode-queue", type=int, default=2048, help="Notifications that can wait for the decoder thread, 0 decodes in the BLE callbacks")
+    parser.add_argument("--overflow", choices=DecodeWorker.OVERFLOW_POLICIES, default="drop_oldest", help="Which notifications to drop when the decode queue is full")
+    parser.add_argument("--ibi-source", choices=["hr", "ecg"], default="hr", help="IBIs from the heart rate service (1/1024 s, timed on arrival) or from R peaks of the ECG stream (sensor clock, streams ECG too)")
+    parser.add_argument("--health-interval", type=float, default=0, help="Print each strap's stream health (rates, gaps, callback times, clock drift) every this many seconds, 0: only at the end")
+    parser.add_argument("--live", action="store_true", help="Show the breathing signal, IBIs and current BR/HRV live while recording")
+    parser.add_argument("--live-window", type=float, default=30, help="Seconds shown by the live view")
+    parser.add_argument("--headless", action="store_true", help="Don't show plots or ask to save, only compute and output metrics (recordings are saved to the session file)")
+    parser.add_argument("--metrics-file", default=None, help="Write summary metrics to this .json or .csv file (with --headless, default: print JSON)")
+    parser.add_argument("--report", default=None, help="Render a summary figure to this image file, e.g. out.png (no display needed)")
     return parser.parse_args()
 
 if __name__ == "__main__":
 
     args = get_arguments()
+    metrics_stream = sys.stdout
+    if args.headless:
+        # Job runners parse the metrics JSON from stdout, so everything else printed (status, device info, tables) goes to stderr
+        sys.stdout = sys.stderr
     use_sample_data = args.use_sample_data
     record_len = args.record_len
 
     if use_sample_data:
-        acc_data, ibi_data = load_sample_data()
+        acc_data, ibi_data = load_sample_data(args.session_file, args.ibi_source)
+        # ibi_data is already from the selected source
+        recordings = [{'acc_data': acc_data, 'ibi_data': ibi_data, 'ecg_ibi_data': ibi_data, 'metadata': None, 'session_path': args.session_file}]
 
     else:
+        session_writers = None
+        session_path = args.session_file
+        buffer_len = args.buffer_len
+        if args.record_file is not None:
+            session_writers = {}
+            session_path = args.record_file
+            buffer_len = 60 if buffer_len is None else buffer_len
+
+        # Strap addresses are only remembered (and written to disk) with --quick-connect, which is what uses them
+        scanner, client_class, known_devices_path = None, None, KNOWN_DEVICES_FILE if args.quick_connect else None
+        if args.simulate > 0:
+            from PolarH10Simulator import SimulatedDevice, SimulatedBleakScanner, SimulatedBleakClient
+            duration = record_len*args.simulate_speed + 10
+            simulated_devices = [SimulatedDevice(f"SIM{i:05d}", speed=args.simulate_speed, duration=duration, replay_path=args.simulate_replay, seed=i) for i in range(args.simulate)]
+            scanner, client_class, known_devices_path = SimulatedBleakScanner(simulated_devices), SimulatedBleakClient, None
+
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        acc_data, ibi_data = loop.run_until_complete(main(record_len))
+        recordings = []
+        decode_workers = []
+        try:
+            recordings = loop.run_until_complete(main(record_len, args.device, session_path, session_writers, buffer_len, scanner, client_class, args.live_window if args.live else None, args.decode_queue, args.overflow, args.health_interval, args.ibi_source,
+                                                           args.quick_connect, args.scan_timeout, known_devices_path, decode_workers))
+        finally:
+            # Also runs on Ctrl-C or a dropped connection, so everything received so far ends up in the session files.
+            # The decode workers are stopped first, so the frames they still had queued are written and none append during finalize
+            for decode_worker in decode_workers:
+                decode_worker.stop()
+            saved_sessions = {}
+            for device_path, session_writer in (session_writers or {}).items():
+                saved_sessions[device_path] = session_writer.finalize(device_path)
+                print(f"Recording saved to {device_path}")
+                if session_writer.dropped_chunks > 0:
+                    dropped = ", ".join(f"{n} {stream}" for stream, n in session_writer.dropped_samples.items() if n > 0)
+                    print(f"  {session_writer.dropped_chunks} chunks dropped while the disk was behind ({dropped} samples)")
+            for result in recordings:
+                if result['session_path'] in saved_sessions:
+                    session = saved_sessions[result['session_path']]
+                    result['acc_data'], result['ibi_data'] = session['acc'], session['ibi']
+                    if args.ibi_source == 'ecg':
+                        result['ecg_ibi_data'] = session_ecg_ibi_data(session)
     
-    if acc_data is not None or ibi_data is not None: 
-        breathing_analyser = BreathingAnalyser(acc_data, ibi_data)
+    metrics = []
+    cache = AnalysisCache(args.cache_dir, args.cache_size*1024**2) if args.cache_dir is not None else None
+    for result in recordings:
+        acc_data, ibi_data = result['acc_data'], result['ibi_data']
+        analysis_ibi_data = result.get('ecg_ibi_data') if args.ibi_source == 'ecg' else ibi_data
+        if acc_data is None or analysis_ibi_data is None:
+            continue
+        breathing_analyser = BreathingAnalyser(acc_data, analysis_ibi_data, decimated_freq=args.decimated_freq, peak_threshold=args.peak_threshold, cache=cache)
+        metrics.append({'session': result['session_path'], 'error': '', **breathing_analyser.get_summary()})
+        if args.report is not None:
+            path = report_path(args.report, result['session_path'], len(recordings))
+            breathing_analyser.save_report(path)
+            print(f"Report saved to {path}")
+
+        if args.headless:
+            if not use_sample_data and args.record_file is None:
+                save_sample_data(acc_data, ibi_data, result['metadata'], result['session_path'], result.get('ecg_data'))
+            continue
+
         breathing_analyser.show_breathing_signal()
         breathing_analyser.show_heart_rate_variability()
 
-        if not use_sample_data:
-            response = input("Do you want to save the data? (y/n): ")
+        if not use_sample_data and args.record_file is None:
+            response = input(f"Do you want to save the data to {result['session_path']}? (y/n): ")
             if response.lower() == "y":
-                save_sample_data(acc_data, ibi_data)
+                save_sample_data(acc_data, ibi_data, result['metadata'], result['session_path'], result.get('ecg_data'))
             else:
                 print("Data not saved")
+
+    if args.headless or args.metrics_file is not None:
+        write_metrics(metrics, args.metrics_file, metrics_stream)
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import deque
+
+# DecodeWorker – Decodes PolarH10 notifications on a background thread, off the asyncio event loop
+# The bleak callbacks only copy the raw bytes and the arrival time into a bounded queue (a few microseconds), the worker
+# thread drains it in batches and runs PolarH10's decoders. When the queue is full, frames are dropped according to
+# `overflow` and counted, so a stalled decoder shows up as drops rather than as a stalled event loop.
+
+class DecodeWorker:
+    OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest')
+
+    def __init__(self, polar_device=None, max_queue=2048, overflow='drop_oldest', poll_interval=0.005):
+        """
+        `max_queue` frames can wait for the decoder (2048 is ~60 s of ACC frames).
+        `overflow`: 'drop_oldest' keeps the most recent frames, 'drop_newest' keeps a contiguous head of the stream.
+        The worker wakes every `poll_interval` seconds, or as soon as the queue is half full.
+        """
+        if overflow not in DecodeWorker.OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {DecodeWorker.OVERFLOW_POLICIES}")
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.poll_interval = poll_interval
+        self.queue = deque() # (data_conv, bytes, arrival time), appends and pops are thread-safe
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+        self.counts = {'queued': 0, 'decoded': 0, 'dropped': 0, 'errors': 0}
+        self.max_queue_len = 0
+        self.batches = 0
+        if polar_device is not None:
+            polar_device.use_decode_worker(self)
+
+    def handler(self, data_conv):
+        # Bleak callback that queues notifications for `data_conv` (e.g. PolarH10.acc_data_conv)
+        def enqueue(sender, data):
+            self.enqueue(data_conv, data)
+        return enqueue
+
+    def enqueue(self, data_conv, data):
+        arrival_time = time.time_ns()/1.0e9
+        if len(self.queue) >= self.max_queue:
+            if self.overflow == 'drop_newest':
+                self.counts['dropped'] += 1
+                return
+            try:
+                self.queue.popleft()
+                self.counts['dropped'] += 1
+            except IndexError: # drained by the worker meanwhile
+                pass
+        self.queue.append((data_conv, bytes(data), arrival_time))
+        self.counts['queued'] += 1
+        queue_len = len(self.queue)
+        if queue_len > self.max_queue_len:
+            self.max_queue_len = queue_len
+        if 2*queue_len >= self.max_queue:
+            self.wakeup.set()
+
+    def start(self):
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, name="DecodeWorker", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+            stopping = self.stopping
+            self.decode_batch()
+            if stopping:
+                break
+
+    def decode_batch(self):
+        # Decode what is queued now, frames arriving meanwhile go to the next batch
+        n = len(self.queue)
+        if n == 0:
+            return
+        self.batches += 1
+        for _ in range(n):
+            try:
+                data_conv, data, arrival_time = self.queue.popleft()
+            except IndexError:
+                break
+            try:
+                data_conv(None, data, arrival_time)
+                self.counts['decoded'] += 1
+            except Exception:
+                self.counts['errors'] += 1
+
+    def stop(self):
+        # Decode everything still queued and stop the thread
+        if self.thread is None:
+            return
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join()
+        self.thread = None
+        self.decode_batch()
+
+    def stats(self):
+        return {**self.counts, 'pending': len(self.queue), 'max_queue_len': self.max_queue_len, 'batches': self.batches}
@@ -0,0 +1,196 @@
+import asyncio
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.patches import Rectangle
+from matplotlib.transforms import IdentityTransform
+from BreathingStreamAnalyser import BreathingStreamAnalyser
+from StreamBuffer import StreamBuffer
+
+# LiveDashboard – Live breathing signal, IBI trace and current BR/HRV of one or more recording PolarH10s
+# Runs as a task on the asyncio loop that receives the BLE notifications. Each frame feeds the samples received since the
+# previous frame to a BreathingStreamAnalyser and redraws only the traces (blitting) over a fixed-length window, so a frame
+# costs the same however long the session has run. Text is slow to render, the numbers are drawn into the saved background
+# every `text_interval` s rather than on every frame. When a trace leaves its y-range only its axes are redrawn, at most one per
+# frame, so no frame holds up the loop (and the BLE notifications queued on it) for long.
+
+class LiveDashboard:
+    ACC_SAMPLING_FREQ = 200 # PolarH10.ACC_SAMPLING_FREQ
+
+    def __init__(self, window=30.0, fps=10.0, text_interval=1.0):
+        self.window = window
+        self.frame_interval = 1.0/fps
+        self.text_interval = text_interval
+        self.next_text_update = 0.0
+        self.devices = [] # one dict per PolarH10: analyser, display buffers, artists
+        self.fig = None
+        self.background = None
+        self.layout_changed = False
+        self.closed = False
+        self.frame_times = [] # draw time of each frame in s
+        self.full_redraws = 0
+        self.axes_redraws = 0
+
+    def add_device(self, polar_device, label):
+        capacity = int(self.window*self.ACC_SAMPLING_FREQ)
+        self.devices.append({
+            'polar_device': polar_device,
+            'label': label,
+            'analyser': BreathingStreamAnalyser(),
+            'breathing_times': StreamBuffer(np.float64, capacity=capacity),
+            'breathing_signal': StreamBuffer(np.float64, capacity=capacity),
+            'status': '',
+        })
+        self.layout_changed = True
+
+    def create_figure(self):
+        if self.fig is None:
+            self.fig = plt.figure(figsize=(11, 3*len(self.devices)))
+            self.fig.canvas.mpl_connect('close_event', self.on_close)
+            self.fig.canvas.mpl_connect('resize_event', lambda event: self.redraw())
+            plt.show(block=False)
+        self.fig.clear()
+        axes = self.fig.subplots(nrows=len(self.devices), ncols=2, squeeze=False, gridspec_kw={'width_ratios': [3, 2]})
+        for device, (ax_breathing, ax_ibi) in zip(self.devices, axes):
+            ax_breathing.set_xlim(-self.window, 0)
+            ax_breathing.set_ylim(0, 1)
+            ax_breathing.set_ylabel(f"{device['label']}\nBreathing Acc Mag.", color='b')
+            ax_breathing.set_xlabel('Time (s)')
+            ax_ibi.set_xlim(-self.window, 0)
+            ax_ibi.set_ylim(600, 1200)
+            ax_ibi.set_ylabel('Interbeat interval', color='r')
+            ax_ibi.set_xlabel('Time (s)')
+            # Animated artists are left out of full draws and drawn on top of the saved background each frame
+            device['breathing_line'], = ax_breathing.plot([], [], color='b', linewidth=1, animated=True)
+            device['ibi_line'], = ax_ibi.plot([], [], color='r', marker='o', markersize=3, linewidth=1.5, animated=True)
+            device['text'] = ax_breathing.text(0.01, 0.95, device['status'], transform=ax_breathing.transAxes, va='top')
+            device['axes'] = (ax_breathing, ax_ibi)
+        self.fig.tight_layout()
+        self.layout_changed = False
+        self.redraw()
+
+    def redraw(self):
+        # Full draw of the static parts, saved as the background that each frame is blitted onto
+        if self.fig is None:
+            return
+        self.full_redraws += 1
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def erase(self, bbox, color):
+        # Paint over `bbox` (display coords), so what was drawn there can be drawn anew
+        rect = Rectangle((bbox.x0 - 1, bbox.y0 - 1), bbox.width + 2, bbox.height + 2, transform=IdentityTransform(), facecolor=color, edgecolor='none')
+        rect.set_figure(self.fig)
+        rect.draw(self.fig.canvas.get_renderer())
+
+    def redraw_axes(self, ax, old_bbox):
+        # Redraw one axes (after a rescale) into the background, over the area its old ticks and labels took up
+        self.axes_redraws += 1
+        self.erase(old_bbox, self.fig.get_facecolor())
+        ax.draw(self.fig.canvas.get_renderer())
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def update_texts(self):
+        # Draw the latest numbers of every device into the background
+        renderer = self.fig.canvas.get_renderer()
+        for device in self.devices:
+            text = device['text']
+            ax_breathing = device['axes'][0]
+            self.erase(text.get_window_extent(renderer), ax_breathing.get_facecolor())
+            text.set_text(device['status'])
+            ax_breathing.draw_artist(text)
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def on_close(self, event):
+        self.closed = True
+
+    def update_data(self, device, rescale=True):
+        # Returns the (axes, bbox before rescaling) of the axes whose y-limits changed, at most one and only with `rescale`
+        polar_device = device['polar_device']
+        analyser = device['analyser']
+        acc_total = analyser.acc_total
+        analyser.update_from_device(polar_device)
+        if analyser.acc_total != acc_total: # the chunk attributes are only replaced when there were new samples
+            device['breathing_times'].append(analyser.breathing_times_chunk)
+            device['breathing_signal'].append(analyser.breathing_signal_chunk)
+
+        times = device['breathing_times'].view()
+        if len(times) == 0:
+            return []
+        now = times[-1]
+        signal = device['breathing_signal'].view()
+        device['breathing_line'].set_data(times - now, signal)
+
+        # Most recent IBIs, times rel to the start of the acc session like the breathing signal
+        with polar_device.buffer_lock:
+            ibi_times = polar_device.ibi_stream_times.view()
+            ibi_values = polar_device.ibi_stream_values.view()
+            first = np.searchsorted(ibi_times, polar_device.acc_stream_start_time + now - self.window) if len(ibi_times) > 0 else 0
+            ibi_times = ibi_times[first:] - polar_device.acc_stream_start_time - now
+            ibi_values = ibi_values[first:].copy()
+            rmssd = polar_device.rolling_hrv.latest().get(60, {}).get('rmssd', np.nan)
+        device['ibi_line'].set_data(ibi_times, ibi_values)
+
+        br = '-' if analyser.br_smooth_latest is None else f"{analyser.br_smooth_latest:.1f}"
+        br_spectral = '-' if analyser.spectral_br.br_latest is None else f"{analyser.spectral_br.br_latest:.1f}"
+        hrv = '-' if analyser.hrv_latest is None else f"{analyser.hrv_latest:.0f}"
+        rmssd = '-' if np.isnan(rmssd) else f"{rmssd:.0f}"
+        device['status'] = f"BR {br} bpm (spectral {br_spectral})   HRV {hrv} ms   RMSSD (60 s) {rmssd} ms" # drawn at the next text update
+
+        # Rescale only when a trace leaves its axes or shrinks to a fraction of them
+        if not rescale:
+            return []
+        ax_breathing, ax_ibi = device['axes']
+        for ax, values, min_span in ((ax_breathing, signal, 0.05), (ax_ibi, ibi_values, 100)):
+            if len(values) == 0:
+                continue
+            y_min, y_max = ax.get_ylim()
+            low, high = np.min(values), np.max(values)
+            span = max(high - low, min_span)
+            if low < y_min or high > y_max or span < 0.25*(y_max - y_min): # also zoom in when the trace has become small
+                old_bbox = ax.get_tightbbox(self.fig.canvas.get_renderer())
+                pad = 0.5*span # generous, so a growing trace settles after a few rescales
+                ax.set_ylim(low - pad, high + pad)
+                return [(ax, old_bbox)]
+        return []
+
+    def draw_frame(self):
+        start = time.perf_counter()
+        if self.layout_changed:
+            self.create_figure()
+        # At most one axes is rescaled per frame, the others keep their limits until a later frame
+        rescaled = []
+        for device in self.devices:
+            rescaled += self.update_data(device, rescale=len(rescaled) == 0)
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+        if rescaled:
+            self.redraw_axes(*rescaled[0])
+        elif start >= self.next_text_update: # not in the same frame as an axes redraw
+            self.update_texts()
+            self.next_text_update = start + self.text_interval
+        for device in self.devices:
+            ax_breathing, ax_ibi = device['axes']
+            ax_breathing.draw_artist(device['breathing_line'])
+            ax_ibi.draw_artist(device['ibi_line'])
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+        self.frame_times.append(time.perf_counter() - start)
+
+    async def run(self):
+        # Redraw at `fps` until cancelled or the window is closed. Frames are scheduled on an absolute clock,
+        # a slow frame delays the next one rather than queueing frames up
+        loop = asyncio.get_running_loop()
+        next_frame = loop.time()
+        while not self.closed:
+            if len(self.devices) > 0:
+                self.draw_frame()
+            next_frame = max(next_frame + self.frame_interval, loop.time())
+            await asyncio.sleep(next_frame - loop.time())
+
+    def print_stats(self, duration):
+        if len(self.frame_times) == 0:
+            return
+        frame_times = np.array(self.frame_times)
+        print(f"Live view: {len(frame_times)/duration:.1f} fps, frame time median {np.median(frame_times)*1e3:.1f} ms, "
+              f"max {frame_times.max()*1e3:.1f} ms, {self.full_redraws} full redraws, {self.axes_redraws} axes redraws")
@@ -1,8 +1,12 @@
-from bleak import BleakClient
 import asyncio
+import threading
 import time
 import numpy as np
 import math
+from StreamBuffer import StreamBuffer
+from StreamHealth import StreamHealth
+from RollingHrv import RollingHrv
+from RPeakDetector import RPeakDetector
 
 class PolarH10:
     ## HEART RATE SERVICE
@@ -56,20 +60,63 @@ class PolarH10:
 
     ACC_SAMPLING_FREQ = 200
     ECG_SAMPLING_FREQ = 130
+    MAX_IBI_FREQ = 4 # upper bound on beats per second, used to size a bounded IBI buffer
 
-    def __init__(self, bleak_device):
+    def __init__(self, bleak_device, buffer_len=None, client_class=None, hrv_windows=(30, 60, 300)):
+        # Streams are stored in compact numpy buffers: per hour, ACC takes ~10.1 MB (int16 xyz + float64 time, 14 B/sample at 200 Hz),
+        # ECG ~5.6 MB (int32 + float64 time, 12 B/sample at 130 Hz) and IBI ~60 kB, plus up to 2x slack from buffer growth.
+        # `buffer_len` (s) bounds each stream to its most recent samples (ring buffer) for endless sessions, None keeps everything.
+        # `client_class` is a stand-in for BleakClient with the same interface, such as PolarH10Simulator.SimulatedBleakClient. None uses
+        # BleakClient, imported on connect so analysis-only use of this module doesn't load bleak.
+        # `hrv_windows` (s) are the windows of the rolling RMSSD, SDNN, pNN50 and mean HR updated with every IBI, see RollingHrv.
         self.bleak_device = bleak_device
-        self.acc_stream_values = []
-        self.acc_stream_times = []
+        self.client_class = client_class
+        self.buffer_len = buffer_len
+        self.acc_stream_values = StreamBuffer(np.int16, 3, capacity=self.buffer_capacity(PolarH10.ACC_SAMPLING_FREQ))
+        self.acc_stream_times = StreamBuffer(np.float64, capacity=self.buffer_capacity(PolarH10.ACC_SAMPLING_FREQ)) # rel to first acc sample
         self.acc_stream_start_time = None
-        self.ibi_stream_values = []
-        self.ibi_stream_times = []
-        self.ecg_stream_values = []
-        self.ecg_stream_times = []
+        self.acc_time_origin = None
+        self.ibi_stream_values = StreamBuffer(np.float64, capacity=self.buffer_capacity(PolarH10.MAX_IBI_FREQ))
+        self.ibi_stream_times = StreamBuffer(np.float64, capacity=self.buffer_capacity(PolarH10.MAX_IBI_FREQ))
+        self.ecg_stream_values = StreamBuffer(np.int32, capacity=self.buffer_capacity(PolarH10.ECG_SAMPLING_FREQ))
+        self.ecg_stream_times = StreamBuffer(np.float64, capacity=self.buffer_capacity(PolarH10.ECG_SAMPLING_FREQ))
+        # IBIs from R peaks of the ECG stream, at sensor times of the R peaks in s, see RPeakDetector
+        self.r_peak_detector = RPeakDetector(PolarH10.ECG_SAMPLING_FREQ)
+        self.ecg_ibi_stream_values = StreamBuffer(np.float64, capacity=self.buffer_capacity(PolarH10.MAX_IBI_FREQ))
+        self.ecg_ibi_stream_times = StreamBuffer(np.float64, capacity=self.buffer_capacity(PolarH10.MAX_IBI_FREQ))
+        self.pmd_streams = set() # measurement types started on the PMD control point, they share one notification
         self.acc_data = None
         self.ibi_data = None
+        self.sinks = []
+        self.buffer_lock = threading.Lock() # held while appending, so readers on another thread see whole frames
+        self.decode_worker = None
+        self.packet_counts = {'acc': 0, 'hr': 0, 'ecg': 0} # notifications received per stream
+        self.health = StreamHealth() # rates, callback times, clock drift, gaps, see StreamHealth.snapshot
+        self.rolling_hrv = RollingHrv(hrv_windows) # read latest() under buffer_lock
+
+    def add_sink(self, sink):
+        # `sink` receives every decoded sample via sink.append(stream, times, values) and sink.update_metadata(**kwargs), e.g. a SessionWriter
+        self.sinks.append(sink)
+
+    def use_decode_worker(self, decode_worker):
+        # Decode notifications on `decode_worker` (a DecodeWorker) instead of in the bleak callbacks, set before starting streams
+        self.decode_worker = decode_worker
+
+    def notification_handler(self, data_conv, stream):
+        # Bleak callback for `data_conv`, queueing to the decode worker if there is one, timed into self.health
+        handler = data_conv if self.decode_worker is None else self.decode_worker.handler(data_conv)
+        def timed_handler(sender, data):
+            start = time.perf_counter()
+            handler(sender, data)
+            self.health.record_callback(stream, time.perf_counter() - start)
+        return timed_handler
+
+    def buffer_capacity(self, sampling_freq):
+        if self.buffer_len is None:
+            return None
+        return int(math.ceil(self.buffer_len*sampling_freq))
     
-    def hr_data_conv(self, sender, data):  
+    def hr_data_conv(self, sender, data, arrival_time=None):
         """
         `data` is formatted according to the GATT Characteristic and Object Type 0x2A37 Heart Rate Measurement which is one of the three characteristics included in the "GATT Service 0x180D Heart Rate".
         `data` can include the following bytes:
@@ -85,13 +132,19 @@ class PolarH10:
             Encoded by 2 bytes. Only present if flags/bit3.
         - inter-beat-intervals (IBIs)
             One IBI is encoded by 2 consecutive bytes. Up to 18 bytes depending on presence of uint16 HR format and energy expenditure.
+        `arrival_time` (unix s) is when the notification was received, now if None.
         """
+        start = time.perf_counter()
+        if arrival_time is None:
+            arrival_time = time.time_ns()/1.0e9
+        self.packet_counts['hr'] += 1
         byte0 = data[0] # heart rate format
         uint8_format = (byte0 & 1) == 0
         energy_expenditure = ((byte0 >> 3) & 1) == 1
         rr_interval = ((byte0 >> 4) & 1) == 1
 
         if not rr_interval:
+            self.health.record_frame('hr', 0, time.perf_counter() - start)
             return
 
         first_rr_byte = 2
@@ -113,10 +166,16 @@ class PolarH10:
             # TODO: move conversion to model and only convert if sensor doesn't
             # transmit data in milliseconds.
             ibi = np.ceil(ibi / 1024 * 1000)
-            self.ibi_stream_values.extend([ibi])
-            self.ibi_stream_times.extend([time.time_ns()/1.0e9])
+            ibi_time = arrival_time
+            with self.buffer_lock:
+                self.ibi_stream_values.append(ibi)
+                self.ibi_stream_times.append(ibi_time)
+                self.rolling_hrv.add(ibi_time, ibi)
+            for sink in self.sinks:
+                sink.append('ibi', ibi_time, ibi)
+        self.health.record_frame('hr', (len(data) - first_rr_byte)//2, time.perf_counter() - start)
             
-    def acc_data_conv(self, sender, data): 
+    def acc_data_conv(self, sender, data, arrival_time=None):
     # [02 EA 54 A2 42 8B 45 52 08 01 45 FF E4 FF B5 03 45 FF E4 FF B8 03 ...]
     # 02=ACC, 
     # EA 54 A2 42 8B 45 52 08 = last sample timestamp in nanoseconds, 
@@ -125,47 +184,87 @@ class PolarH10:
     # sample1, sample2,
 
         if data[0] == 0x02:
+            start = time.perf_counter()
+            if arrival_time is None:
+                arrival_time = time.time_ns()/1.0e9
+            self.packet_counts['acc'] += 1
             if not bool(self.acc_stream_values):
-                self.acc_stream_start_time = time.time_ns()/1.0e9
+                with self.buffer_lock: # read together with the buffers, e.g. by LiveDashboard while this runs on a DecodeWorker
+                    self.acc_stream_start_time = arrival_time
+                for sink in self.sinks:
+                    sink.update_metadata(acc_stream_start_time=self.acc_stream_start_time)
             
-            timestamp = PolarH10.convert_to_unsigned_long(data, 1, 8)/1.0e9 # timestamp of the last sample
             frame_type = data[9]
             resolution = (frame_type + 1) * 8 # 16 bit
             time_step = 0.005 # 200 Hz sample rate
             step = math.ceil(resolution / 8.0)
-            samples = data[10:] 
-            n_samples = math.floor(len(samples)/(step*3))
-            sample_timestamp = timestamp - (n_samples-1)*time_step
-            offset = 0
-            while offset < len(samples):
-                x = PolarH10.convert_array_to_signed_int(samples, offset, step)
-                offset += step
-                y = PolarH10.convert_array_to_signed_int(samples, offset, step) 
-                offset += step
-                z = PolarH10.convert_array_to_signed_int(samples, offset, step) 
-                offset += step
-                # mag = np.linalg.norm([x, y, z])
-                self.acc_stream_values.extend([[x, y, z]])
-                self.acc_stream_times.extend([sample_timestamp])
-                sample_timestamp += time_step
+            timestamps, samples = PolarH10.decode_pmd_frame(data, step, 3, time_step)
+            if self.acc_time_origin is None and len(timestamps) > 0:
+                self.acc_time_origin = timestamps[0]
+                for sink in self.sinks:
+                    sink.update_metadata(acc_time_origin=self.acc_time_origin)
+            acc_times = timestamps - self.acc_time_origin
+            with self.buffer_lock:
+                self.acc_stream_values.append(samples)
+                self.acc_stream_times.append(acc_times)
+            for sink in self.sinks:
+                sink.append('acc', acc_times, samples)
+            if len(timestamps) > 0:
+                self.health.record_pmd_frame('acc', timestamps[0], timestamps[-1], time_step, arrival_time)
+            self.health.record_frame('acc', len(timestamps), time.perf_counter() - start)
     
-    def ecg_data_conv(self, sender, data):
+    def ecg_data_conv(self, sender, data, arrival_time=None):
     # [00 EA 1C AC CC 99 43 52 08 00 68 00 00 58 00 00 46 00 00 3D 00 00 32 00 00 26 00 00 16 00 00 04 00 00 ...]
     # 00 = ECG; EA 1C AC CC 99 43 52 08 = last sample timestamp in nanoseconds; 00 = ECG frameType, sample0 = [68 00 00] microVolts(104) , sample1, sample2, ....
         if data[0] == 0x00:
-            timestamp = PolarH10.convert_to_unsigned_long(data, 1, 8)/1.0e9
+            start = time.perf_counter()
+            if arrival_time is None:
+                arrival_time = time.time_ns()/1.0e9
+            self.packet_counts['ecg'] += 1
             step = 3
             time_step = 1.0/ self.ECG_SAMPLING_FREQ
-            samples = data[10:]
-            n_samples = math.floor(len(samples)/step)
-            offset = 0
-            sample_timestamp = timestamp - (n_samples-1)*time_step
-            while offset < len(samples):
-                ecg = PolarH10.convert_array_to_signed_int(samples, offset, step)       
-                offset += step
-                self.ecg_stream_values.extend([ecg])
-                self.ecg_stream_times.extend([sample_timestamp])
-                sample_timestamp += time_step
+            timestamps, samples = PolarH10.decode_pmd_frame(data, step, 1, time_step)
+            beat_times, ibis = self.r_peak_detector.update(timestamps, samples[:, 0])
+            with self.buffer_lock:
+                self.ecg_stream_values.append(samples[:, 0])
+                self.ecg_stream_times.append(timestamps)
+                self.ecg_ibi_stream_values.append(ibis)
+                self.ecg_ibi_stream_times.append(beat_times)
+            for sink in self.sinks:
+                sink.append('ecg', timestamps, samples[:, 0])
+            if len(timestamps) > 0:
+                self.health.record_pmd_frame('ecg', timestamps[0], timestamps[-1], time_step, arrival_time)
+            self.health.record_frame('ecg', len(timestamps), time.perf_counter() - start)
+
+    @staticmethod
+    def decode_pmd_frame(data, step, n_channels, time_step):
+        """
+        Decode a whole PMD data frame in one pass.
+        `data` is the raw notification: 1 byte measurement type, 8 byte timestamp of the last sample (ns), 1 byte frame type, then
+        little-endian signed samples of `step` bytes (8, 16 or 24 bit) interleaved over `n_channels`.
+        Returns the per-sample timestamps (s) and an (n_samples, n_channels) int array of sample values.
+        """
+        timestamp = PolarH10.convert_to_unsigned_long(data, 1, 8)/1.0e9 # timestamp of the last sample
+        n_samples = (len(data) - 10) // (step*n_channels)
+        count = n_samples*n_channels
+        if step == 1:
+            samples = np.frombuffer(data, dtype=np.int8, count=count, offset=10).astype(np.int32)
+        elif step == 2:
+            samples = np.frombuffer(data, dtype='<i2', count=count, offset=10).astype(np.int32)
+        elif step == 3:
+            raw = np.frombuffer(data, dtype=np.uint8, count=count*3, offset=10).reshape(-1, 3).astype(np.int32)
+            samples = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+            samples = (samples << 8) >> 8 # sign extend from 24 bit
+        else:
+            raise ValueError(f"Unsupported PMD sample size: {step} bytes")
+
+        # Accumulate the sample period from the first sample, matching repeated `+= time_step` to the bit
+        timestamps = np.full(n_samples, time_step)
+        if n_samples > 0:
+            timestamps[0] = timestamp - (n_samples-1)*time_step
+        timestamps = np.cumsum(timestamps)
+
+        return timestamps, samples.reshape(n_samples, n_channels)
 
     @staticmethod
     def convert_array_to_signed_int(data, offset, length):
@@ -179,21 +278,36 @@ class PolarH10:
         )
     
     async def connect(self):
-        self.bleak_client = BleakClient(self.bleak_device)
+        client_class = self.client_class
+        if client_class is None:
+            from bleak import BleakClient
+            client_class = BleakClient
+        self.bleak_client = client_class(self.bleak_device)
         await self.bleak_client.connect()
     
     async def disconnect(self):
         await self.bleak_client.disconnect()
 
     async def get_device_info(self):
-        self.model_number = await self.bleak_client.read_gatt_char(PolarH10.MODEL_NBR_UUID)
-        self.manufacturer_name = await self.bleak_client.read_gatt_char(PolarH10.MANUFACTURER_NAME_UUID)
-        self.serial_number = await self.bleak_client.read_gatt_char(PolarH10.SERIAL_NUMBER_UUID)
-        self.battery_level = await self.bleak_client.read_gatt_char(PolarH10.BATTERY_LEVEL_UUID)
-        self.firmware_revision = await self.bleak_client.read_gatt_char(PolarH10.FIRMWARE_REVISION_UUID)
-        self.hardware_revision = await self.bleak_client.read_gatt_char(PolarH10.HARDWARE_REVISION_UUID)
-        self.software_revision = await self.bleak_client.read_gatt_char(PolarH10.SOFTWARE_REVISION_UUID)
-    
+        # The reads are issued together rather than one after another. A BLE link still serves one request at a time, so
+        # DHYB.record_device can also defer them until the streams are running
+        uuids = [PolarH10.MODEL_NBR_UUID, PolarH10.MANUFACTURER_NAME_UUID, PolarH10.SERIAL_NUMBER_UUID, PolarH10.BATTERY_LEVEL_UUID,
+                 PolarH10.FIRMWARE_REVISION_UUID, PolarH10.HARDWARE_REVISION_UUID, PolarH10.SOFTWARE_REVISION_UUID]
+        (self.model_number, self.manufacturer_name, self.serial_number, self.battery_level, self.firmware_revision,
+         self.hardware_revision, self.software_revision) = await asyncio.gather(*(self.bleak_client.read_gatt_char(uuid) for uuid in uuids))
+
+    def get_device_metadata(self):
+        # Device information as JSON serialisable strings, for session files
+        metadata = {'address': self.bleak_device.address}
+        for key in ['model_number', 'manufacturer_name', 'serial_number', 'firmware_revision', 'hardware_revision', 'software_revision']:
+            if hasattr(self, key):
+                metadata[key] = ''.join(map(chr, getattr(self, key)))
+        if hasattr(self, 'battery_level'):
+            metadata['battery_level'] = int(self.battery_level[0])
+        if self.acc_time_origin is not None:
+            metadata['acc_time_origin'] = float(self.acc_time_origin)
+        return metadata
+
     async def print_device_info(self):
         BLUE = "\033[94m"
         RESET = "\033[0m"
@@ -206,17 +320,46 @@ class PolarH10:
             f"Hardware Revision: {BLUE}{''.join(map(chr, self.hardware_revision))}{RESET}\n"
             f"Software Revision: {BLUE}{''.join(map(chr, self.software_revision))}{RESET}")
 
+    def pmd_handler(self):
+        # ACC and ECG frames arrive on the same PMD data characteristic, route each by its measurement type (byte 0)
+        handlers = {0x02: self.notification_handler(self.acc_data_conv, 'acc'), 0x00: self.notification_handler(self.ecg_data_conv, 'ecg')}
+        def dispatch(sender, data):
+            handler = handlers.get(data[0])
+            if handler is not None:
+                handler(sender, data)
+        return dispatch
+
+    async def start_pmd_stream(self, measurement_type, write_request):
+        await self.bleak_client.write_gatt_char(PolarH10.PMD_CHAR1_UUID, write_request, response=True)
+        if len(self.pmd_streams) == 0:
+            await self.bleak_client.start_notify(PolarH10.PMD_CHAR2_UUID, self.pmd_handler())
+        self.pmd_streams.add(measurement_type)
+
+    async def stop_pmd_stream(self, measurement_type):
+        # Stop measurement request [0x03, type], notifications stop with the last stream
+        await self.bleak_client.write_gatt_char(PolarH10.PMD_CHAR1_UUID, bytearray([0x03, measurement_type]), response=True)
+        self.pmd_streams.discard(measurement_type)
+        if len(self.pmd_streams) == 0:
+            await self.bleak_client.stop_notify(PolarH10.PMD_CHAR2_UUID)
+
     async def start_acc_stream(self):
-        await self.bleak_client.write_gatt_char(PolarH10.PMD_CHAR1_UUID, PolarH10.ACC_WRITE, response=True)
-        await self.bleak_client.start_notify(PolarH10.PMD_CHAR2_UUID, self.acc_data_conv)
+        await self.start_pmd_stream(0x02, PolarH10.ACC_WRITE)
         print("Collecting ACC data...", flush=True)
 
     async def stop_acc_stream(self):
-        await self.bleak_client.stop_notify(PolarH10.PMD_CHAR2_UUID)
+        await self.stop_pmd_stream(0x02)
         print("Stopping ACC data...", flush=True)
 
+    async def start_ecg_stream(self):
+        await self.start_pmd_stream(0x00, PolarH10.ECG_WRITE)
+        print("Collecting ECG data...", flush=True)
+
+    async def stop_ecg_stream(self):
+        await self.stop_pmd_stream(0x00)
+        print("Stopping ECG data...", flush=True)
+
     async def start_hr_stream(self):
-        await self.bleak_client.start_notify(PolarH10.HEART_RATE_MEASUREMENT_UUID, self.hr_data_conv)
+        await self.bleak_client.start_notify(PolarH10.HEART_RATE_MEASUREMENT_UUID, self.notification_handler(self.hr_data_conv, 'hr'))
         print("Collecting HR data...", flush=True)
 
     async def stop_hr_stream(self):
@@ -224,17 +367,24 @@ class PolarH10:
         print("Stopping HR data...", flush=True)
     
     def get_acc_data(self):
-        
-        acc_times = np.array(self.acc_stream_times)
-        acc_times = acc_times - acc_times[0] # rel to start of acc session
-        self.acc_data = {'times': acc_times, 'values': np.array(self.acc_stream_values)}
+        # Zero-copy views of the stream buffers, times are stored rel to start of acc session
+        self.acc_data = {'times': self.acc_stream_times.view(), 'values': self.acc_stream_values.view()}
 
         return self.acc_data
     
-    def get_ibi_data(self):
-
-        ibi_times = np.array(self.ibi_stream_times)
-        ibi_times = ibi_times - self.acc_stream_start_time # rel to start of acc session time in unix s
-        self.ibi_data = {'times': ibi_times, 'values': np.array(self.ibi_stream_values)}
+    def get_ibi_data(self, source='hr'):
+        # source 'hr': IBIs of the heart rate service. Values are a zero-copy view, times (~1 per second) are shifted rel to start
+        # of acc session time in unix s.
+        # source 'ecg': IBIs from R peaks of the ECG stream, at the R peak times on the sensor clock rel to the first acc sample
+        if source == 'ecg':
+            ibi_times = self.ecg_ibi_stream_times.view() - self.acc_time_origin
+            self.ibi_data = {'times': ibi_times, 'values': self.ecg_ibi_stream_values.view()}
+        else:
+            ibi_times = self.ibi_stream_times.view() - self.acc_stream_start_time
+            self.ibi_data = {'times': ibi_times, 'values': self.ibi_stream_values.view()}
 
         return self.ibi_data
+
+    def get_ecg_data(self):
+        # Zero-copy views, times are sensor times in s
+        return {'times': self.ecg_stream_times.view(), 'values': self.ecg_stream_values.view()}
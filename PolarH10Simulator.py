@@ -0,0 +1,214 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import numpy as np
+from PolarH10 import PolarH10
+from synthetic_data import synthetic_acc_data, synthetic_ibi_data, synthetic_ecg_data
+from session_file import load_session
+
+# PolarH10Simulator – Simulated Polar H10 standing in for bleak, for load testing and development without hardware
+# Implements the parts of BleakScanner/BleakClient that PolarH10 and DHYB use, and emits correctly encoded
+# PMD ACC/ECG frames and 0x2A37 heart rate packets from a synthetic breathing/RSA model or a replayed session,
+# in real time or accelerated by `speed`.
+
+POLAR_EPOCH_OFFSET_NS = 946_684_800_000_000_000 # PMD timestamps count from 2000-01-01
+
+class SimulatedDevice:
+    ACC_SAMPLES_PER_FRAME = 36 # 16 bit xyz, as streamed by a Polar H10 with a 232 byte MTU
+    ECG_SAMPLES_PER_FRAME = 73
+
+    def __init__(self, device_id="SIM00001", address=None, speed=1.0, duration=3600, breathing_rate=12.0, replay_path=None, seed=0, gatt_delay=0.0,
+                 frame_loss=0.0, clock_drift_ppm=0.0):
+        """
+        `duration` seconds of synthetic data are generated, or the session at `replay_path` is replayed.
+        `gatt_delay` (s) is added to connecting and to every GATT read and write to mimic a real link. As on a real link,
+        GATT operations of a connection are served one at a time.
+        `frame_loss` is the probability that a notification is lost, `clock_drift_ppm` how fast the sensor clock runs vs the host's.
+        """
+        self.name = f"Polar H10 {device_id}"
+        self.address = address or f"SI:MU:LA:TE:{seed // 256 % 256:02X}:{seed % 256:02X}"
+        self.details = None
+        self.rssi = -60
+        self.metadata = {}
+        self.device_id = device_id
+        self.speed = speed
+        self.gatt_delay = gatt_delay
+        self.frame_loss = frame_loss
+        self.clock_drift_ppm = clock_drift_ppm
+        self.rng = np.random.default_rng(seed)
+        if replay_path is not None:
+            session = load_session(replay_path)
+            self.acc_data, self.ibi_data, self.ecg_data = session['acc'], session['ibi'], session['ecg']
+        else:
+            self.acc_data = synthetic_acc_data(duration, breathing_rate=breathing_rate, seed=seed)
+            self.ibi_data = synthetic_ibi_data(duration, breathing_rate=breathing_rate, seed=seed)
+            self.ecg_data = synthetic_ecg_data(self.ibi_data, duration, seed=seed)
+
+    def gatt_values(self):
+        return {
+            PolarH10.MODEL_NBR_UUID: b"Polar H10",
+            PolarH10.MANUFACTURER_NAME_UUID: b"Polar Electro Oy",
+            PolarH10.SERIAL_NUMBER_UUID: self.device_id.encode(),
+            PolarH10.BATTERY_LEVEL_UUID: bytes([85]),
+            PolarH10.FIRMWARE_REVISION_UUID: b"3.1.1",
+            PolarH10.HARDWARE_REVISION_UUID: b"39044024.10",
+            PolarH10.SOFTWARE_REVISION_UUID: b"H10 FW 3.1.1",
+        }
+
+    @staticmethod
+    def encode_pmd_frame(measurement_type, frame_type, last_timestamp_ns, samples, sample_bytes):
+        frame = bytearray([measurement_type]) + int(last_timestamp_ns).to_bytes(8, byteorder="little") + bytearray([frame_type])
+        samples = np.asarray(samples, dtype='<i4').reshape(-1)
+        if sample_bytes == 2:
+            frame += samples.astype('<i2').tobytes()
+        else:
+            frame += samples.view(np.uint8).reshape(-1, 4)[:, :sample_bytes].tobytes() # little-endian low bytes
+        return frame
+
+    @staticmethod
+    def encode_hr_packet(hr, ibis_ms):
+        # Flags: uint8 HR, RR intervals present. RR intervals in 1/1024 s
+        packet = bytearray([0x10, int(min(255, max(0, round(hr))))])
+        for ibi in ibis_ms:
+            packet += int(round(ibi/1000*1024)).to_bytes(2, byteorder="little")
+        return packet
+
+    def sensor_time_ns(self, sensor_start_ns, stream_time):
+        return sensor_start_ns + stream_time*1e9*(1 + self.clock_drift_ppm*1e-6)
+
+    def acc_frames(self, sensor_start_ns):
+        # (stream time of the frame's last sample in s, encoded frame)
+        times, values = self.acc_data['times'], self.acc_data['values']
+        n = SimulatedDevice.ACC_SAMPLES_PER_FRAME
+        for start in range(0, len(times) - n + 1, n):
+            last_time = times[start + n - 1] - times[0]
+            yield last_time, SimulatedDevice.encode_pmd_frame(0x02, 0x01, self.sensor_time_ns(sensor_start_ns, last_time), values[start:start + n], 2)
+
+    def ecg_frames(self, sensor_start_ns):
+        times, values = self.ecg_data['times'], self.ecg_data['values']
+        n = SimulatedDevice.ECG_SAMPLES_PER_FRAME
+        for start in range(0, len(times) - n + 1, n):
+            last_time = times[start + n - 1] - times[0]
+            yield last_time, SimulatedDevice.encode_pmd_frame(0x00, 0x00, self.sensor_time_ns(sensor_start_ns, last_time), values[start:start + n], 3)
+
+    def hr_packets(self):
+        # One packet per second with the IBIs of the beats that ended in that second
+        times, values = self.ibi_data['times'], self.ibi_data['values']
+        if len(times) == 0:
+            return
+        beat_second = np.floor(times - times[0] + values[0]/1000).astype(int) # seconds since the first beat started
+        bounds = np.searchsorted(beat_second, np.arange(beat_second[-1] + 2))
+        for second in range(beat_second[-1] + 1):
+            ibis = values[bounds[second]:bounds[second + 1]]
+            hr = 60000/np.mean(ibis) if len(ibis) else 0
+            yield second + 1.0, SimulatedDevice.encode_hr_packet(hr, ibis)
+
+class SimulatedBleakClient:
+    def __init__(self, device, **kwargs):
+        self.device = device
+        self.is_connected = False
+        self.enabled_pmd_streams = set()
+        self.notify_tasks = {}
+        self.stream_start = None # (host loop time, sensor time ns) shared by all streams of a connection
+        self.gatt_lock = asyncio.Lock() # ATT allows one outstanding request per connection, concurrent operations queue
+
+    async def gatt_operation(self):
+        async with self.gatt_lock:
+            await asyncio.sleep(self.device.gatt_delay)
+
+    async def connect(self, **kwargs):
+        await asyncio.sleep(self.device.gatt_delay)
+        self.is_connected = True
+        return True
+
+    async def disconnect(self):
+        for task in self.notify_tasks.values():
+            task.cancel()
+        self.notify_tasks = {}
+        self.is_connected = False
+        return True
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.disconnect()
+
+    async def read_gatt_char(self, char_specifier, **kwargs):
+        await self.gatt_operation()
+        return bytearray(self.device.gatt_values()[char_specifier])
+
+    async def write_gatt_char(self, char_specifier, data, response=False):
+        await self.gatt_operation()
+        if char_specifier == PolarH10.PMD_CHAR1_UUID and len(data) >= 2:
+            if data[0] == 0x02: # start measurement
+                if data[1] == 0x00 and self.device.ecg_data is None:
+                    raise ValueError(f"{self.device.name} has no ECG data to stream (replayed session without ECG)")
+                self.enabled_pmd_streams.add(data[1])
+            elif data[0] == 0x03: # stop measurement
+                self.enabled_pmd_streams.discard(data[1])
+
+    async def start_notify(self, char_specifier, callback, **kwargs):
+        await self.gatt_operation()
+        if self.stream_start is None:
+            self.stream_start = (asyncio.get_running_loop().time(), time.time_ns() - POLAR_EPOCH_OFFSET_NS)
+        if char_specifier == PolarH10.PMD_CHAR2_UUID:
+            # Measurements run on the sensor clock from the first notify, frames are only sent while their stream is started
+            # (measurement type in byte 0), so streams can be started and stopped while notifications are on
+            sensor_start_ns = self.stream_start[1]
+            streams = [self.device.acc_frames(sensor_start_ns)]
+            if self.device.ecg_data is not None:
+                streams.append(self.device.ecg_frames(sensor_start_ns))
+            self.notify_tasks[char_specifier] = asyncio.create_task(self.send_notifications(char_specifier, callback, streams))
+        elif char_specifier == PolarH10.HEART_RATE_MEASUREMENT_UUID:
+            self.notify_tasks[char_specifier] = asyncio.create_task(self.send_notifications(char_specifier, callback, [self.device.hr_packets()]))
+
+    async def stop_notify(self, char_specifier):
+        await self.gatt_operation()
+        task = self.notify_tasks.pop(char_specifier, None)
+        if task is not None:
+            task.cancel()
+
+    async def send_notifications(self, char_specifier, callback, streams):
+        # Merge the streams in time order and send each packet once its stream time has passed (scaled by speed).
+        # Packets that are due are sent back to back, so a slow consumer falls behind rather than the schedule drifting.
+        loop = asyncio.get_running_loop()
+        start_time = self.stream_start[0]
+        pending = [next(stream, None) for stream in streams]
+        while any(item is not None for item in pending):
+            i = min((i for i, item in enumerate(pending) if item is not None), key=lambda i: pending[i][0])
+            stream_time, packet = pending[i]
+            delay = start_time + stream_time/self.device.speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if char_specifier == PolarH10.PMD_CHAR2_UUID and packet[0] not in self.enabled_pmd_streams:
+                pass
+            elif self.device.frame_loss == 0 or self.device.rng.random() >= self.device.frame_loss:
+                callback(char_specifier, packet)
+            pending[i] = next(streams[i], None)
+
+class SimulatedBleakScanner:
+    def __init__(self, devices, advertising_delay=0.0, full_scan=False):
+        # `advertising_delay` (s) until the devices are seen, to mimic a real scan. With `full_scan`, discover() scans
+        # for its whole timeout like bleak's, rather than returning once the devices were seen
+        self.devices = devices
+        self.advertising_delay = advertising_delay
+        self.full_scan = full_scan
+
+    async def discover(self, timeout=5.0, **kwargs):
+        await asyncio.sleep(timeout if self.full_scan else min(timeout, self.advertising_delay))
+        return list(self.devices) if self.advertising_delay <= timeout else []
+
+    async def find_device_by_filter(self, filterfunc, timeout=10.0, **kwargs):
+        # The first device for which filterfunc(device, advertisement_data) is true, as soon as it is seen, or None after `timeout`
+        for device in self.devices:
+            advertisement_data = SimpleNamespace(local_name=device.name, rssi=device.rssi, manufacturer_data={}, service_data={}, service_uuids=[])
+            if filterfunc(device, advertisement_data) and self.advertising_delay <= timeout:
+                await asyncio.sleep(self.advertising_delay)
+                return device
+        await asyncio.sleep(timeout)
+        return None
+
+    async def find_device_by_address(self, device_identifier, timeout=10.0, **kwargs):
+        return await self.find_device_by_filter(lambda device, _: device.address.lower() == device_identifier.lower(), timeout)
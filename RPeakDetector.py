@@ -0,0 +1,192 @@
+from collections import deque
+from scipy.signal import butter, sosfilt, sosfilt_zi, lfilter
+import numpy as np
+
+# RPeakDetector – R peaks and interbeat intervals from the Polar H10's 130 Hz ECG, after Pan & Tompkins (1985)
+# Band-pass 5-15 Hz, five-point derivative, squaring and a 150 ms moving window integration turn each QRS complex into one
+# bump. Local maxima of the integrated signal are classified as QRS or noise by adaptive thresholds, with a 200 ms refractory
+# period, a T wave check and a search back for missed beats. Each beat's R peak is the ECG maximum before its bump, refined
+# with a parabola between samples, so IBIs are not quantised to the 7.7 ms sample period (nor to the 1/1024 s of heart rate
+# packets) and are timed on the sensor clock.
+# The filters are causal and stateful and the classification is a scan over candidate peaks, so the same detector runs on a
+# whole recording at once (detect) or on live ECG frames (update) with identical results.
+
+class RPeakDetector:
+    ECG_SAMPLING_FREQ = 130 # PolarH10.ECG_SAMPLING_FREQ
+
+    def __init__(self, fs=ECG_SAMPLING_FREQ, learning_time=2.0, refractory=0.2, t_wave_window=0.36, search_window=0.25):
+        self.fs = fs
+        self.bandpass_sos = butter(2, [5/(0.5*fs), 15/(0.5*fs)], btype='band', output='sos')
+        self.derivative = np.array([2, 1, 0, -1, -2])*fs/8
+        self.integration = np.ones(int(round(0.15*fs)))/int(round(0.15*fs))
+        self.bandpass_zi = None
+        self.derivative_zi = np.zeros(len(self.derivative) - 1)
+        self.integration_zi = np.zeros(len(self.integration) - 1)
+        self.refractory = int(round(refractory*fs))
+        self.t_wave_window = int(round(t_wave_window*fs))
+        self.search_window = int(round(search_window*fs)) # samples before an integrated peak searched for its R peak
+
+        # Trailing samples of the previous chunks: the R peak search window plus the unresolved last sample
+        self.history = max(self.search_window, len(self.integration)) + 2
+        self.tail_times = None
+        self.tail_ecg = None
+        self.tail_slope = None
+        self.tail_feature = None
+        self.tail_start = 0 # stream index of the first tail sample, negative while the tail is padding
+
+        # Thresholds are initialised from the integrated signal of the first `learning_time` s, candidates wait until then
+        self.learning_samples = int(round(learning_time*fs))
+        self.learning_max = 0.0
+        self.learning_sum = 0.0
+        self.held_candidates = []
+        self.spki = None # running estimates of signal and noise peak levels
+        self.npki = None
+        self.threshold = None
+
+        self.last_beat = None # (stream index, slope, R peak time) of the last accepted beat
+        self.rr_recent = deque(maxlen=8) # samples
+        self.since_last_beat = [] # noise candidates since the last beat, for the search back
+        self.beat_times = [] # R peak times of beats accepted in the current update
+        self.previous_beat_time = None
+
+    def update(self, times, ecg):
+        """
+        Feed a chunk of ECG samples (sensor times in s, values in uV). Returns the R peak times and the IBIs (ms, ending at
+        each R peak) of beats detected in this chunk. Beats are detected one to a few hundred ms after their R peak.
+        """
+        times = np.asarray(times, dtype=float)
+        ecg = np.asarray(ecg, dtype=float)
+        self.beat_times = []
+        if len(ecg) == 0:
+            return self.collect_beats()
+        if self.bandpass_zi is None:
+            self.bandpass_zi = sosfilt_zi(self.bandpass_sos)*ecg[0]
+            # Pad the history with the first sample so the first search windows are complete
+            self.tail_times = times[0] - np.arange(self.history, 0, -1)/self.fs
+            self.tail_ecg = np.full(self.history, ecg[0])
+            self.tail_slope = np.zeros(self.history)
+            self.tail_feature = np.full(self.history, np.inf) # never a candidate
+            self.tail_start = -self.history
+
+        bandpassed, self.bandpass_zi = sosfilt(self.bandpass_sos, ecg, zi=self.bandpass_zi)
+        slope, self.derivative_zi = lfilter(self.derivative, 1, bandpassed, zi=self.derivative_zi)
+        feature, self.integration_zi = lfilter(self.integration, 1, slope*slope, zi=self.integration_zi)
+
+        t = np.concatenate((self.tail_times, times))
+        x = np.concatenate((self.tail_ecg, ecg))
+        d = np.abs(np.concatenate((self.tail_slope, slope)))
+        f = np.concatenate((self.tail_feature, feature))
+        base = self.tail_start
+        self.update_learning(feature, base + len(self.tail_feature))
+
+        # Candidates: local maxima of the integrated signal resolved by this chunk (the last sample needs its successor)
+        lo = len(self.tail_feature) - 1
+        rising = f[lo:-1] > f[lo - 1:-2]
+        falling = f[lo:-1] >= f[lo + 1:]
+        idx = np.flatnonzero(rising & falling) + lo
+        if len(idx) > 0:
+            # R peak: ECG maximum in the search window ending at each candidate, refined with a parabola through its neighbours
+            windows = np.lib.stride_tricks.sliding_window_view(x, self.search_window + 1)[idx - self.search_window]
+            r = idx - self.search_window + np.argmax(windows, axis=1)
+            left, centre, right = x[np.maximum(r - 1, 0)], x[r], x[np.minimum(r + 1, len(x) - 1)]
+            curvature = left - 2*centre + right
+            with np.errstate(divide='ignore', invalid='ignore'):
+                offset = np.where(curvature < 0, 0.5*(left - right)/curvature, 0.0)
+            r_times = t[r] + np.clip(offset, -0.5, 0.5)/self.fs
+            # Steepest slope over the integration window, for telling T waves from QRS complexes
+            slope_windows = np.lib.stride_tricks.sliding_window_view(d, len(self.integration))[idx - len(self.integration) + 1]
+            candidates = zip((idx + base).tolist(), f[idx].tolist(), slope_windows.max(axis=1).tolist(), r_times.tolist())
+            if self.spki is None:
+                self.held_candidates.extend(candidates)
+            else:
+                for candidate in candidates:
+                    self.classify(*candidate)
+
+        self.tail_times, self.tail_ecg, self.tail_slope, self.tail_feature = t[-self.history:], x[-self.history:], d[-self.history:], f[-self.history:]
+        self.tail_start = base + len(t) - self.history
+        return self.collect_beats()
+
+    def update_learning(self, feature, first_index):
+        # Accumulate the first learning_samples of the integrated signal, then set the thresholds and classify held candidates
+        if self.spki is not None:
+            return
+        n = min(len(feature), self.learning_samples - first_index)
+        if n > 0:
+            self.learning_max = max(self.learning_max, feature[:n].max())
+            self.learning_sum += feature[:n].sum()
+        if first_index + len(feature) >= self.learning_samples:
+            self.spki = self.learning_max/3
+            self.npki = self.learning_sum/self.learning_samples/2
+            self.threshold = self.npki + 0.25*(self.spki - self.npki)
+            held, self.held_candidates = self.held_candidates, []
+            for candidate in held:
+                self.classify(*candidate)
+
+    def classify(self, index, value, slope, r_time):
+        # Pan-Tompkins decision rules for one candidate peak of the integrated signal
+        if self.last_beat is not None:
+            since = index - self.last_beat[0]
+            if since < self.refractory:
+                return
+            # Search back: no beat for 1.66 mean RR, take the largest noise peak since the last beat above half the threshold
+            if len(self.rr_recent) > 0 and since > 1.66*np.mean(self.rr_recent) and len(self.since_last_beat) > 0:
+                best = max(self.since_last_beat, key=lambda candidate: candidate[1])
+                if best[1] > 0.5*self.threshold:
+                    self.spki = 0.25*best[1] + 0.75*self.spki
+                    self.accept(*best)
+                    since = index - self.last_beat[0]
+                    if since < self.refractory:
+                        return
+
+        if value > self.threshold:
+            # A peak soon after a beat with less than half its slope is a T wave
+            if self.last_beat is not None and since < self.t_wave_window and slope < 0.5*self.last_beat[1]:
+                self.add_noise(index, value, slope, r_time)
+                return
+            self.spki = 0.125*value + 0.875*self.spki
+            self.accept(index, value, slope, r_time)
+        else:
+            self.add_noise(index, value, slope, r_time)
+
+    def add_noise(self, index, value, slope, r_time):
+        self.npki = 0.125*value + 0.875*self.npki
+        self.threshold = self.npki + 0.25*(self.spki - self.npki)
+        if self.last_beat is None or index - self.last_beat[0] >= self.refractory:
+            self.since_last_beat.append((index, value, slope, r_time))
+
+    def accept(self, index, value, slope, r_time):
+        if self.last_beat is not None:
+            self.rr_recent.append(index - self.last_beat[0])
+        self.last_beat = (index, slope, r_time)
+        self.since_last_beat = []
+        self.threshold = self.npki + 0.25*(self.spki - self.npki)
+        self.beat_times.append(r_time)
+
+    def collect_beats(self):
+        # R peak times of beats accepted in this update, and their IBIs (ms) to the previous beat, which may be from an earlier update
+        beat_times = np.array(self.beat_times)
+        if len(beat_times) == 0:
+            return beat_times, np.zeros(0)
+        previous = self.previous_beat_time
+        self.previous_beat_time = beat_times[-1]
+        if previous is None:
+            return beat_times[1:], np.diff(beat_times)*1000 # the first beat has no IBI
+        return beat_times, np.diff(beat_times, prepend=previous)*1000
+
+    @staticmethod
+    def detect(times, ecg, fs=ECG_SAMPLING_FREQ):
+        # Offline: R peak times and IBIs (ms) of a whole recording, identical to feeding it chunk by chunk to update
+        return RPeakDetector(fs).update(times, ecg)
+
+    @staticmethod
+    def ibi_data(ecg_data, time_origin=None):
+        """
+        IBIs of a recorded ECG stream ({'times', 'values'}, sensor times in s) in the format of PolarH10.get_ibi_data, for
+        BreathingAnalyser. Times are rel to `time_origin`, the sensor time of the first ACC sample (PolarH10.acc_time_origin),
+        so they line up with the ACC times, or rel to the first ECG sample if it is unknown.
+        """
+        times = np.asarray(ecg_data['times'], dtype=float)
+        beat_times, ibis = RPeakDetector.detect(times, ecg_data['values'])
+        if time_origin is None:
+            time_origin = times[0] if len(times) > 0 else 0.0
+        return {'times': beat_times - time_origin, 'values': ibis}
@@ -0,0 +1,115 @@
+from collections import deque
+import numpy as np
+
+# RollingHrv – Time-domain heart rate variability over sliding time windows: RMSSD, SDNN, pNN50 and mean HR
+# A window ending at a beat holds the beats of the last `window` seconds, (t - window, t]. Successive differences are only
+# counted between two beats that are both in the window. The live path keeps running sums per window and updates them as beats
+# enter and leave, so a beat costs the same whatever the window length. RollingHrv.series computes the same values for a whole
+# recording at once with cumulative sums.
+
+METRICS = ('mean_hr', 'sdnn', 'rmssd', 'pnn50')
+NN50_THRESHOLD = 50 # ms
+
+class RollingWindow:
+    def __init__(self, window):
+        self.window = window
+        self.beats = deque() # (time, ibi - reference, squared diff to the previous beat, diff above NN50_THRESHOLD)
+        self.reference = None # ibi sums are kept relative to the first IBI, to avoid cancellation in the variance
+        self.sum_ibi = 0.0
+        self.sum_ibi_sq = 0.0
+        self.sum_diff_sq = 0.0
+        self.nn50 = 0
+        self.last_ibi = None
+
+    def add(self, time, ibi):
+        if self.reference is None:
+            self.reference = ibi
+        if self.last_ibi is not None and len(self.beats) > 0:
+            diff = ibi - self.last_ibi
+            diff_sq, is_nn50 = diff*diff, abs(diff) > NN50_THRESHOLD
+            self.sum_diff_sq += diff_sq
+            self.nn50 += is_nn50
+        else:
+            diff_sq, is_nn50 = 0.0, False
+        centred = ibi - self.reference
+        self.beats.append((time, centred, diff_sq, is_nn50))
+        self.sum_ibi += centred
+        self.sum_ibi_sq += centred*centred
+        self.last_ibi = ibi
+
+        # Drop beats that left the window. The diff of the new first beat pointed to a dropped beat, so it leaves the sums too
+        while self.beats[0][0] <= time - self.window:
+            _, centred, _, _ = self.beats.popleft()
+            self.sum_ibi -= centred
+            self.sum_ibi_sq -= centred*centred
+            _, _, diff_sq, is_nn50 = self.beats[0]
+            self.sum_diff_sq -= diff_sq
+            self.nn50 -= is_nn50
+
+    def metrics(self):
+        # NaN until the window holds enough beats: one for mean HR, two for the others
+        n = len(self.beats)
+        if n == 0:
+            return {metric: np.nan for metric in METRICS}
+        mean_ibi = self.reference + self.sum_ibi/n
+        if n < 2:
+            return {'mean_hr': 60000/mean_ibi, 'sdnn': np.nan, 'rmssd': np.nan, 'pnn50': np.nan}
+        variance = max(self.sum_ibi_sq - self.sum_ibi*self.sum_ibi/n, 0.0)/(n - 1)
+        return {
+            'mean_hr': 60000/mean_ibi,
+            'sdnn': np.sqrt(variance),
+            'rmssd': np.sqrt(max(self.sum_diff_sq, 0.0)/(n - 1)),
+            'pnn50': 100*self.nn50/(n - 1),
+        }
+
+class RollingHrv:
+    def __init__(self, windows=(30, 60, 300)):
+        # `windows`: window lengths in s, e.g. 30 s, 1 min and 5 min
+        self.windows = {window: RollingWindow(window) for window in windows}
+        self.latest_time = None
+
+    def add(self, time, ibi):
+        # Add one IBI (ms) ending at `time` (s), times must not decrease
+        for rolling_window in self.windows.values():
+            rolling_window.add(time, ibi)
+        self.latest_time = time
+
+    def latest(self):
+        # {window: {'mean_hr': bpm, 'sdnn': ms, 'rmssd': ms, 'pnn50': %}} for the window ending at the last beat
+        return {window: rolling_window.metrics() for window, rolling_window in self.windows.items()}
+
+    @staticmethod
+    def series(times, ibi_values, window):
+        """
+        The metrics of the window ending at each beat of a recording, as {'times': ..., 'mean_hr': ..., 'sdnn': ..., 'rmssd': ..., 'pnn50': ...}
+        arrays with one value per beat. Matches feeding the beats one by one to RollingHrv and reading latest() after each.
+        `window` may be np.inf for the metrics of the whole recording so far.
+        """
+        times = np.asarray(times, dtype=float)
+        ibi_values = np.asarray(ibi_values, dtype=float)
+        n_beats = len(ibi_values)
+        if n_beats == 0:
+            return {'times': times, **{metric: np.zeros(0) for metric in METRICS}}
+        idx = np.arange(n_beats)
+        starts = np.searchsorted(times, times - window, side='right') # first beat in each window
+        counts = idx - starts + 1
+
+        def window_sums(values):
+            # Sum of values[start:i + 1] for each beat i
+            cumulative = np.concatenate(([0.0], np.cumsum(values)))
+            return cumulative[idx + 1] - cumulative[starts]
+
+        centred = ibi_values - ibi_values[0]
+        sum_ibi = window_sums(centred)
+        sum_ibi_sq = window_sums(centred*centred)
+        diffs = np.concatenate(([0.0], np.diff(ibi_values))) # diff of beat i to beat i - 1, only counted if both are in the window
+        sum_diff_sq = window_sums(diffs*diffs) - diffs[starts]**2
+        nn50 = window_sums(np.abs(diffs) > NN50_THRESHOLD) - (np.abs(diffs[starts]) > NN50_THRESHOLD)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_hr = 60000/(ibi_values[0] + sum_ibi/counts)
+            pairs = np.where(counts > 1, counts - 1, np.nan)
+            sdnn = np.sqrt(np.maximum(sum_ibi_sq - sum_ibi*sum_ibi/counts, 0.0)/pairs)
+            rmssd = np.sqrt(np.maximum(sum_diff_sq, 0.0)/pairs)
+            pnn50 = 100*nn50/pairs
+        return {'times': times, 'mean_hr': mean_hr, 'sdnn': sdnn, 'rmssd': rmssd, 'pnn50': pnn50}
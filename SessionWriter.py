@@ -0,0 +1,122 @@
+import os
+import queue
+import threading
+import time
+import numpy as np
+from session_file import RECORDING_MAGIC, RECORDING_STREAMS, encode_data_record, encode_metadata_record, finalize_recording
+
+# SessionWriter – Crash-safe recording sink: PolarH10 callbacks append samples, fixed-size chunks are written to a
+# recording journal by a background thread so file I/O never blocks the event loop
+
+class SessionWriter:
+    STREAM_FREQS = {'acc': 200, 'ibi': 4, 'ecg': 130} # samples per second used to size chunks (IBI: upper bound)
+
+    def __init__(self, path, chunk_duration=5.0, fsync_interval=10.0, max_pending_chunks=64, block_when_behind=False):
+        """
+        `path` is the recording journal (.dhybrec), readable with session_file.read_recording at any time.
+        Each stream is buffered in a preallocated chunk of `chunk_duration` seconds, all streams are handed to the writer
+        thread at least every `chunk_duration` seconds, and the file is fsynced every `fsync_interval` seconds.
+        Memory stays flat at the chunk buffers plus at most `max_pending_chunks` chunks waiting for the disk. If the disk falls
+        further behind, `block_when_behind` makes append wait for it: set it when samples are appended from a DecodeWorker thread,
+        whose bounded queue and overflow policy then take the backlog (counted as its dropped frames). Otherwise (appends on the
+        event loop, i.e. inline decoding) chunks are dropped and counted (dropped_chunks, dropped_samples) rather than blocking.
+        """
+        self.path = path
+        self.chunk_duration = chunk_duration
+        self.fsync_interval = fsync_interval
+        self.chunk_times = {}
+        self.chunk_values = {}
+        self.chunk_fill = {}
+        for stream, (dtype, width) in RECORDING_STREAMS.items():
+            chunk_len = max(1, int(np.ceil(chunk_duration*SessionWriter.STREAM_FREQS[stream])))
+            self.chunk_times[stream] = np.empty(chunk_len)
+            self.chunk_values[stream] = np.empty((chunk_len,) if width is None else (chunk_len, width), dtype=dtype)
+            self.chunk_fill[stream] = 0
+        self.last_flush_time = time.monotonic()
+        self.samples_written = {stream: 0 for stream in RECORDING_STREAMS}
+        self.dropped_chunks = 0
+        self.dropped_samples = {stream: 0 for stream in RECORDING_STREAMS}
+        self.closed = False
+
+        self.file = open(path, "wb")
+        self.file.write(RECORDING_MAGIC)
+        self.max_pending_chunks = max_pending_chunks
+        self.block_when_behind = block_when_behind
+        self.chunk_slots = threading.Semaphore(max_pending_chunks) # taken by each queued data chunk until it is written
+        self.pending = queue.Queue() # (record, holds a chunk slot), unbounded so metadata never waits
+        self.writer_thread = threading.Thread(target=self.write_chunks, name="SessionWriter", daemon=True)
+        self.writer_thread.start()
+        self.update_metadata(streams={stream: {'dtype': dtype, 'width': width} for stream, (dtype, width) in RECORDING_STREAMS.items()})
+
+    def append(self, stream, times, values):
+        # Called by PolarH10's decoders: only copies into the chunk buffer, a full chunk is queued for the writer thread
+        times = np.atleast_1d(times)
+        values = np.asarray(values).reshape((len(times),) + self.chunk_values[stream].shape[1:])
+        offset = 0
+        while offset < len(times):
+            fill = self.chunk_fill[stream]
+            n = min(len(times) - offset, len(self.chunk_times[stream]) - fill)
+            self.chunk_times[stream][fill:fill + n] = times[offset:offset + n]
+            self.chunk_values[stream][fill:fill + n] = values[offset:offset + n]
+            self.chunk_fill[stream] += n
+            offset += n
+            if self.chunk_fill[stream] == len(self.chunk_times[stream]):
+                self.flush_stream(stream)
+        if time.monotonic() - self.last_flush_time >= self.chunk_duration:
+            self.flush()
+
+    def update_metadata(self, **metadata):
+        # Metadata records are small and rare, they are always queued
+        self.pending.put_nowait((encode_metadata_record(metadata), False))
+
+    def flush_stream(self, stream):
+        fill = self.chunk_fill[stream]
+        if fill == 0:
+            return
+        # If the disk has fallen `max_pending_chunks` behind, wait for it with `block_when_behind`, else drop the chunk
+        if self.chunk_slots.acquire(blocking=self.block_when_behind):
+            self.pending.put_nowait((encode_data_record(stream, self.chunk_times[stream][:fill], self.chunk_values[stream][:fill]), True))
+            self.samples_written[stream] += fill
+        else:
+            self.dropped_chunks += 1
+            self.dropped_samples[stream] += fill
+        self.chunk_fill[stream] = 0
+
+    def flush(self):
+        for stream in RECORDING_STREAMS:
+            self.flush_stream(stream)
+        self.last_flush_time = time.monotonic()
+
+    def write_chunks(self):
+        last_sync_time = time.monotonic()
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            record, holds_slot = item
+            self.file.write(record)
+            self.file.flush() # to the OS after every record, so a crash of this process loses nothing written
+            if holds_slot:
+                self.chunk_slots.release()
+            if time.monotonic() - last_sync_time >= self.fsync_interval:
+                os.fsync(self.file.fileno())
+                last_sync_time = time.monotonic()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+    def close(self):
+        # Write out partial chunks, wait for the writer thread and fsync
+        if self.closed:
+            return
+        self.flush()
+        self.pending.put(None)
+        self.writer_thread.join()
+        self.closed = True
+
+    def finalize(self, path):
+        # Close and convert the journal to a session file, the journal is removed once the session file is written
+        self.close()
+        session = finalize_recording(self.path, path)
+        os.remove(self.path)
+        return session
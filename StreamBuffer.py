@@ -0,0 +1,82 @@
+import numpy as np
+
+# StreamBuffer – Compact, growable numpy buffer for sensor streams, optionally bounded as a ring buffer
+
+class StreamBuffer:
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, dtype, width=None, capacity=None):
+        """
+        `width` is the number of values per sample (e.g. 3 for ACC xyz), None for a scalar stream.
+        `capacity` bounds the buffer to the most recent `capacity` samples, None grows it for the whole session.
+        Unbounded buffers grow by doubling, so up to twice the stored size is allocated.
+        Bounded buffers keep a mirrored copy of the ring (2 x capacity), so the retained samples are always contiguous
+        and `view()` never has to copy.
+        """
+        self.dtype = np.dtype(dtype)
+        self.sample_shape = () if width is None else (width,)
+        self.capacity = capacity
+        self.start = 0
+        self.length = 0
+        self.total = 0 # samples appended over the lifetime of the buffer, including any overwritten by the ring
+        if capacity is None:
+            self.data = np.empty((StreamBuffer.INITIAL_CAPACITY,) + self.sample_shape, dtype=self.dtype)
+        else:
+            self.data = np.empty((2*capacity,) + self.sample_shape, dtype=self.dtype)
+
+    def __len__(self):
+        return self.length
+
+    def append(self, values):
+        values = np.asarray(values).reshape((-1,) + self.sample_shape)
+        n = len(values)
+        self.total += n
+        if self.capacity is None:
+            self.append_growable(values)
+        else:
+            self.append_ring(values)
+
+    def append_growable(self, values):
+        n = len(values)
+        if self.length + n > len(self.data):
+            data = np.empty((max(2*len(self.data), self.length + n),) + self.sample_shape, dtype=self.dtype)
+            data[:self.length] = self.data[:self.length]
+            self.data = data
+        self.data[self.length:self.length + n] = values
+        self.length += n
+
+    def append_ring(self, values):
+        capacity = self.capacity
+        if len(values) >= capacity:
+            values = values[-capacity:]
+            self.start = 0
+            self.length = 0
+        n = len(values)
+        write_idx = (self.start + self.length) % capacity
+        first = min(n, capacity - write_idx)
+        # Write each sample into both halves so any window of `capacity` samples is contiguous
+        self.data[write_idx:write_idx + first] = values[:first]
+        self.data[write_idx + capacity:write_idx + capacity + first] = values[:first]
+        self.data[:n - first] = values[first:]
+        self.data[capacity:capacity + n - first] = values[first:]
+        dropped = max(0, self.length + n - capacity)
+        self.start = (self.start + dropped) % capacity
+        self.length += n - dropped
+
+    def view(self):
+        """
+        Zero-copy view of the retained samples, oldest first.
+        In ring mode the memory is reused, so copy the view if it must outlive further appends.
+        """
+        return self.data[self.start:self.start + self.length]
+
+    def since(self, total):
+        """
+        View of the samples appended after the buffer had seen `total` samples, e.g. the new samples of a live stream.
+        Samples already overwritten by the ring are skipped.
+        """
+        n_new = min(self.total - total, self.length)
+        return self.data[self.start + self.length - n_new:self.start + self.length]
+
+    def nbytes(self):
+        return self.data.nbytes
@@ -0,0 +1,199 @@
+import bisect
+import threading
+import time
+import numpy as np
+
+# StreamHealth – Per-stream health metrics of a PolarH10: frame and sample rates, callback/decode time histograms,
+# sensor vs host clock offset and drift, and gaps/overlaps between consecutive PMD frames.
+# Updated by PolarH10 for every notification at O(1) cost, read with snapshot() or as a log line with summary_line().
+# Updates may come from a DecodeWorker thread while the event loop reads, streams are added and listed under `lock`.
+
+POLAR_EPOCH_OFFSET = 946684800 # PMD timestamps count from 2000-01-01, unix time of that epoch in s
+
+class LatencyHistogram:
+    # Log-spaced bins from 1 us to ~100 ms, 4 per decade, plus an overflow bin
+    EDGES = [10**(e/4) for e in range(-24, -3)]
+
+    def __init__(self):
+        self.counts = [0]*(len(LatencyHistogram.EDGES) + 1)
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_right(LatencyHistogram.EDGES, seconds)] += 1
+        self.n += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        # Upper edge of the bin holding the q-th percentile
+        if self.n == 0:
+            return np.nan
+        target = q/100*self.n
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return LatencyHistogram.EDGES[i] if i < len(LatencyHistogram.EDGES) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {'n': self.n, 'mean': self.total/self.n if self.n else np.nan, 'p50': self.percentile(50), 'p99': self.percentile(99),
+                'max': self.max, 'edges': LatencyHistogram.EDGES, 'counts': list(self.counts)}
+
+class ClockTracker:
+    """
+    Offset of the host clock from the sensor clock (host arrival time - sensor time of a frame's last sample) and its drift.
+    Transmission latency only ever adds to the offset, so the minimum offset of each `window` seconds is used, and drift is the
+    least-squares slope of those minima over host time.
+    """
+    def __init__(self, window=10.0):
+        self.window = window
+        self.window_start = None
+        self.window_min = np.inf
+        self.latest_offset = np.nan
+        self.last_window_min = None
+        self.t0 = None
+        self.n = 0
+        self.sum_t = self.sum_o = self.sum_tt = self.sum_to = 0.0
+        self.o0 = None
+
+    def add(self, host_time, sensor_time):
+        offset = host_time - sensor_time
+        self.latest_offset = offset
+        if self.window_start is None:
+            self.window_start = host_time
+        if host_time - self.window_start >= self.window:
+            self.add_window(self.window_start + self.window/2, self.window_min)
+            self.window_start = host_time
+            self.window_min = np.inf
+        self.window_min = min(self.window_min, offset)
+
+    def add_window(self, t, offset):
+        self.last_window_min = offset
+        if self.t0 is None:
+            self.t0, self.o0 = t, offset
+        t, offset = t - self.t0, offset - self.o0 # keep the sums small for precision
+        self.n += 1
+        self.sum_t += t
+        self.sum_o += offset
+        self.sum_tt += t*t
+        self.sum_to += t*offset
+
+    def offset(self):
+        # Minimum offset of the last complete window, or of the current one before the first has completed
+        if self.last_window_min is not None:
+            return self.last_window_min
+        return self.window_min if np.isfinite(self.window_min) else np.nan
+
+    def drift(self):
+        # Host clock gain over the sensor clock, s per s (multiply by 1e6 for ppm). NaN until two windows have completed
+        denominator = self.n*self.sum_tt - self.sum_t**2
+        if self.n < 2 or denominator <= 0:
+            return np.nan
+        return (self.n*self.sum_to - self.sum_t*self.sum_o)/denominator
+
+class StreamHealth:
+    MAX_EVENTS = 100 # most recent gaps/overlaps kept per stream
+
+    def __init__(self, clock_window=10.0):
+        self.start_time = time.monotonic()
+        self.streams = {}
+        self.lock = threading.Lock() # guards adding to and iterating over self.streams
+        self.clock = ClockTracker(clock_window)
+        self.last_interval = (self.start_time, {}) # monotonic time and counts at the last interval_rates() call
+
+    def stream(self, name):
+        stream = self.streams.get(name)
+        if stream is None:
+            with self.lock:
+                stream = self.streams.setdefault(name, {
+                    'frames': 0, 'samples': 0,
+                    'callback_time': LatencyHistogram(), 'decode_time': LatencyHistogram(),
+                    'first_frame_time': None, 'last_sample_time': None, 'gaps': 0, 'missing_samples': 0, 'overlaps': 0, 'overlapping_samples': 0, 'events': [],
+                })
+        return stream
+
+    def stream_items(self):
+        # (name, stream) of each stream so far, safe to iterate while streams are added
+        with self.lock:
+            return list(self.streams.items())
+
+    def record_callback(self, name, seconds):
+        # Time spent in the bleak notification callback (inline decode, or only queueing with a DecodeWorker)
+        self.stream(name)['callback_time'].add(seconds)
+
+    def record_frame(self, name, n_samples, decode_time):
+        stream = self.stream(name)
+        if stream['first_frame_time'] is None:
+            stream['first_frame_time'] = time.monotonic()
+        stream['frames'] += 1
+        stream['samples'] += n_samples
+        stream['decode_time'].add(decode_time)
+
+    def record_pmd_frame(self, name, first_sample_time, last_sample_time, time_step, arrival_time):
+        # Continuity against the previous frame: its last sample + one step should be this frame's first sample
+        stream = self.stream(name)
+        previous = stream['last_sample_time']
+        if previous is not None:
+            missing = (first_sample_time - previous)/time_step - 1
+            if missing > 0.5:
+                stream['gaps'] += 1
+                stream['missing_samples'] += int(round(missing))
+                self.add_event(stream, 'gap', arrival_time, int(round(missing)))
+            elif missing < -0.5:
+                stream['overlaps'] += 1
+                stream['overlapping_samples'] += int(round(-missing))
+                self.add_event(stream, 'overlap', arrival_time, int(round(-missing)))
+        stream['last_sample_time'] = last_sample_time
+        if name == 'acc':
+            self.clock.add(arrival_time, last_sample_time + POLAR_EPOCH_OFFSET)
+
+    def add_event(self, stream, kind, arrival_time, n_samples):
+        stream['events'].append({'kind': kind, 'time': arrival_time, 'samples': n_samples})
+        if len(stream['events']) > StreamHealth.MAX_EVENTS:
+            del stream['events'][0]
+
+    def snapshot(self):
+        """
+        All metrics as a dict: per stream frame and sample counts and rates over the session, time from the start to its first
+        frame, callback and decode time histograms, gaps and overlaps (with the most recent events), plus the clock offset (s)
+        and drift (ppm) of the sensor's ACC timestamps.
+        """
+        elapsed = max(time.monotonic() - self.start_time, 1e-9)
+        streams = {}
+        for name, stream in self.stream_items():
+            streams[name] = {
+                'frames': stream['frames'], 'samples': stream['samples'],
+                'first_frame_after': stream['first_frame_time'] - self.start_time if stream['first_frame_time'] is not None else np.nan,
+                'frames_per_s': stream['frames']/elapsed, 'samples_per_s': stream['samples']/elapsed,
+                'callback_time': stream['callback_time'].snapshot(), 'decode_time': stream['decode_time'].snapshot(),
+                'gaps': stream['gaps'], 'missing_samples': stream['missing_samples'],
+                'overlaps': stream['overlaps'], 'overlapping_samples': stream['overlapping_samples'], 'events': list(stream['events']),
+            }
+        return {'elapsed': elapsed, 'streams': streams, 'clock_offset': self.clock.offset(), 'clock_drift_ppm': self.clock.drift()*1e6}
+
+    def interval_rates(self):
+        # Samples per second of each stream since the previous call
+        now = time.monotonic()
+        last_time, last_counts = self.last_interval
+        counts = {name: stream['samples'] for name, stream in self.stream_items()}
+        self.last_interval = (now, counts)
+        elapsed = max(now - last_time, 1e-9)
+        return {name: (count - last_counts.get(name, 0))/elapsed for name, count in counts.items()}
+
+    def summary_line(self):
+        # One log line: recent sample rates, gaps/overlaps, worst callback time and clock drift
+        rates = self.interval_rates()
+        parts = []
+        for name, stream in self.stream_items():
+            part = f"{name.upper()} {rates.get(name, 0):.1f}/s"
+            if name != 'hr':
+                part += f" gaps {stream['gaps']} ({stream['missing_samples']} smp) overlaps {stream['overlaps']}"
+            part += f" cb p99 {stream['callback_time'].percentile(99)*1e6:.0f}us"
+            parts.append(part)
+        drift = self.clock.drift()*1e6
+        parts.append(f"clock offset {self.clock.offset():+.3f} s drift {drift:+.1f} ppm" if np.isfinite(drift) else f"clock offset {self.clock.offset():+.3f} s")
+        return " | ".join(parts)
@@ -0,0 +1,135 @@
+import argparse
+import csv
+import glob
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+from BreathingAnalyser import BreathingAnalyser
+from AnalysisCache import AnalysisCache
+from ChunkedBreathingAnalyser import ChunkedBreathingAnalyser
+from session_file import load_session
+
+""" batch_analysis.py
+Analyse many recorded sessions in parallel and write one summary table
+- Sessions are given as directories (all .dhyb files in them) and/or glob patterns
+- Each session is analysed by BreathingAnalyser in its own worker process, one per core by default
+- One CSV row per session: statistics, plus the BR and HRV series as JSON lists
+- Rows are written as sessions finish, so an interrupted run resumes where it stopped. Failed sessions are retried
+- With --block-size, sessions are analysed in blocks (ChunkedBreathingAnalyser), so each worker's memory stays bounded on long recordings
+- With --cache-dir, filtered signals, peaks and HRV are cached, so rerunning with e.g. a different --peak-threshold only redoes the peaks
+"""
+
+SUMMARY_FIELDS = ['session', 'error', 'analysis_time', 'duration', 'n_breaths', 'n_beats', 'mean_br', 'median_br', 'sd_br',
+                  'mean_hrv', 'median_hrv', 'sd_hrv', 'mean_ibi', 'rmssd', 'sdnn', 'pnn50', 'br_times', 'br_values', 'hrv_times', 'hrv_values']
+SERIES_FIELDS = ['br_times', 'br_values', 'hrv_times', 'hrv_values']
+
+def find_sessions(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.dhyb")
+        paths.extend(glob.glob(pattern))
+    return sorted(set(os.path.abspath(path) for path in paths))
+
+def analyse_session(path, decimated_freq=None, peak_threshold=0.02, cache_dir=None, cache_size=2048, block_size=None):
+    # Runs in a worker process. Loads the session itself (memory-mapped) so only the path and the summary cross processes.
+    # Workers share the cache directory, entries are written atomically
+    start = time.perf_counter()
+    row = {'session': path, 'error': ''}
+    try:
+        session = load_session(path)
+        if session['acc'] is None or session['ibi'] is None:
+            raise ValueError("session has no ACC or IBI data")
+        if block_size is not None:
+            breathing_analyser = ChunkedBreathingAnalyser(session['acc'], session['ibi'], block_size=block_size, peak_threshold=peak_threshold)
+        else:
+            cache = AnalysisCache(cache_dir, cache_size*1024**2) if cache_dir is not None else None
+            breathing_analyser = BreathingAnalyser(session['acc'], session['ibi'], decimated_freq=decimated_freq, peak_threshold=peak_threshold, cache=cache)
+        row.update(breathing_analyser.get_summary())
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+    row['analysis_time'] = time.perf_counter() - start
+    return row
+
+def format_row(row):
+    formatted = {}
+    for field in SUMMARY_FIELDS:
+        value = row.get(field, '')
+        if field in SERIES_FIELDS and value != '':
+            value = json.dumps([round(v, 4) for v in value])
+        elif isinstance(value, float) and math.isnan(value):
+            value = ''
+        formatted[field] = value
+    return formatted
+
+def read_completed(output_path):
+    # Rows of sessions that were analysed successfully in an earlier run
+    if not os.path.exists(output_path):
+        return []
+    with open(output_path, newline='') as f:
+        return [row for row in csv.DictReader(f) if row.get('session') and not row.get('error')]
+
+def run_batch(session_paths, output_path, workers=None, decimated_freq=None, resume=True, peak_threshold=0.02, cache_dir=None, cache_size=2048,
+              block_size=None):
+    """
+    Analyse `session_paths` in a pool of `workers` processes (default: one per core) and write the summary to `output_path`.
+    With `resume`, sessions already in `output_path` without an error are skipped. With `cache_dir`, intermediate results are
+    kept in an AnalysisCache of at most `cache_size` MB. With `block_size` (ACC samples), sessions are analysed block by block
+    by ChunkedBreathingAnalyser instead (no decimation or cache). Returns the rows of this run.
+    """
+    completed = read_completed(output_path) if resume else []
+    done = set(row['session'] for row in completed)
+    pending = [path for path in session_paths if path not in done]
+    if len(done) > 0:
+        print(f"Skipping {len(session_paths) - len(pending)} sessions already in {output_path}")
+
+    # Rewrite the table with only the completed rows, dropping failed and partial ones, then append as sessions finish
+    with open(output_path, "w", newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(completed)
+
+        rows = []
+        if len(pending) == 0:
+            return rows
+        workers = min(workers or os.cpu_count() or 1, len(pending))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(analyse_session, path, decimated_freq, peak_threshold, cache_dir, cache_size, block_size) for path in pending]
+            for future in tqdm(as_completed(futures), total=len(futures), desc=f"Analysing ({workers} workers)"):
+                row = future.result()
+                writer.writerow(format_row(row))
+                f.flush()
+                rows.append(row)
+    return rows
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Analyse recorded sessions in parallel and write a summary table")
+    parser.add_argument("sessions", nargs="+", help="Session directories and/or glob patterns, e.g. data/ or 'data/2024-*.dhyb'")
+    parser.add_argument("--output", default="summary.csv", help="Summary table (CSV) to write, resumed if it exists")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--decimated-freq", type=float, default=None, help="Filter the breathing signal at this lower rate in Hz (e.g. 10)")
+    parser.add_argument("--peak-threshold", type=float, default=0.02, help="Min rise of a breath peak above the preceding trough")
+    parser.add_argument("--cache-dir", default=None, help="Cache filtered signals, peaks and HRV in this directory, reused by later runs")
+    parser.add_argument("--cache-size", type=float, default=2048, help="Max size of the cache in MB, least recently used results are removed first")
+    parser.add_argument("--block-size", type=int, default=None, help="Analyse in blocks of this many ACC samples (e.g. 1048576, ~87 min) to bound memory on long sessions")
+    parser.add_argument("--no-resume", action="store_true", help="Reanalyse all sessions instead of skipping those already in the output")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+
+    args = get_arguments()
+    session_paths = find_sessions(args.sessions)
+    if len(session_paths) == 0:
+        print("No session files found")
+    else:
+        start = time.perf_counter()
+        rows = run_batch(session_paths, args.output, args.workers, args.decimated_freq, resume=not args.no_resume,
+                         peak_threshold=args.peak_threshold, cache_dir=args.cache_dir, cache_size=args.cache_size, block_size=args.block_size)
+        elapsed = time.perf_counter() - start
+        failed = [row for row in rows if row['error']]
+        print(f"Analysed {len(rows)} sessions in {elapsed:.1f} s, {len(failed)} failed. Summary written to {args.output}")
+        for row in failed:
+            print(f"  {row['session']}: {row['error']}")
@@ -0,0 +1,794 @@
+import argparse
+import asyncio
+import contextlib
+import functools
+import gc
+import io
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+import numpy as np
+from scipy.signal import find_peaks, welch
+from PolarH10 import PolarH10
+from BreathingAnalyser import BreathingAnalyser
+from BreathingStreamAnalyser import BreathingStreamAnalyser
+from synthetic_data import synthetic_acc_data, synthetic_ibi_data, synthetic_ecg_data, breathing_phase
+from session_file import save_session, load_session
+from PolarH10Simulator import SimulatedDevice, SimulatedBleakClient, SimulatedBleakScanner
+from batch_analysis import run_batch
+from DHYB import monitor_loop_lag, find_devices, record_device
+from DecodeWorker import DecodeWorker
+import spectral
+from StreamHealth import StreamHealth
+from RPeakDetector import RPeakDetector
+from RollingHrv import RollingHrv, RollingWindow, METRICS, NN50_THRESHOLD
+from AnalysisCache import AnalysisCache
+from ChunkedBreathingAnalyser import ChunkedBreathingAnalyser
+
+""" benchmark.py
+Microbenchmarks for the hot paths of the recording and analysis pipeline
+- decode: vectorised PolarH10.decode_pmd_frame vs the original per-sample loop
+- streaming: per-chunk cost of BreathingStreamAnalyser at the start and end of a long session
+- multirate: full-rate vs decimated breathing signal filtering, speed and breath peak agreement
+- analysis: vectorised peak validation and smoothing in BreathingAnalyser vs the original loops
+- session_io: binary memory-mapped session files vs the original CSV save/load
+- simulator: notification throughput of several simulated Polar H10s streaming faster than real time
+- receive: BLE callback time and event loop lag with inline decoding vs a DecodeWorker, with a normal and a stalling sink
+- live: LiveDashboard frame rate and frame time while simulated devices stream, early vs late in the session
+- plot: drawing long traces raw vs through breathing_plots' min/max decimation, including zoom and pan
+- startup: import time of the analysis modules and the run time of a headless DHYB.py analysis, in fresh interpreters
+- batch: batch_analysis throughput (sessions/s) with 1, 2, 4, ... worker processes up to the core count
+- health: StreamHealth's gap and clock drift detection against frame loss and drift injected by the simulator
+- hrv: rolling RMSSD/SDNN/pNN50 live vs offline vs a direct computation per window, and per-beat cost against window length
+- spectral: batched vs per-window Welch spectra, streaming agreement, and spectral vs peak-picked breathing rate on noisy data
+- ecg: R peak detection accuracy, IBI error vs the heart rate service and speed, offline and per live frame
+- cache: reopening a saved session with a cold vs warm AnalysisCache, and after changing only the breath peak threshold
+- chunked: ChunkedBreathingAnalyser vs BreathingAnalyser on a memory-mapped session, peak memory, time and agreement
+- connect: time from scanning to the first ACC sample, full scan vs quick connect, with a simulated link and advertising delay
+See benchmark_suite.py for per-stage timings and memory as JSON, to compare commits
+"""
+
+def make_pmd_frame(measurement_type, frame_type, step, n_channels, n_samples, last_timestamp_ns=599_634_513_112_000_000, seed=0):
+    rng = np.random.default_rng(seed)
+    limit = 2**(8*step - 1)
+    values = rng.integers(-limit, limit, size=n_samples*n_channels)
+    frame = bytearray([measurement_type]) + last_timestamp_ns.to_bytes(8, byteorder="little") + bytearray([frame_type])
+    for v in values.tolist():
+        frame += v.to_bytes(step, byteorder="little", signed=True)
+    return frame
+
+def loop_decode_pmd_frame(data, step, n_channels, time_step):
+    # Reference decoder: the original per-sample `while` loop from PolarH10.acc_data_conv/ecg_data_conv
+    timestamp = PolarH10.convert_to_unsigned_long(data, 1, 8)/1.0e9
+    samples = data[10:]
+    n_samples = math.floor(len(samples)/(step*n_channels))
+    sample_timestamp = timestamp - (n_samples-1)*time_step
+    values = []
+    times = []
+    offset = 0
+    while offset < len(samples):
+        sample = []
+        for _ in range(n_channels):
+            sample.append(PolarH10.convert_array_to_signed_int(samples, offset, step))
+            offset += step
+        values.append(sample)
+        times.append(sample_timestamp)
+        sample_timestamp += time_step
+    return times, values
+
+def bench_pmd_decode(repeats):
+    # (name, measurement type, frame type, bytes per sample, channels, samples per frame, sample period)
+    cases = [
+        ("ACC 8 bit", 0x02, 0x00, 1, 3, 72, 0.005),
+        ("ACC 16 bit", 0x02, 0x01, 2, 3, 36, 0.005),
+        ("ACC 24 bit", 0x02, 0x02, 3, 3, 24, 0.005),
+        ("ECG 24 bit", 0x00, 0x00, 3, 1, 73, 1.0/PolarH10.ECG_SAMPLING_FREQ),
+    ]
+    print(f"{'frame':<12}{'samples':>8}{'loop (us)':>12}{'vector (us)':>13}{'speedup':>9}")
+    for name, measurement_type, frame_type, step, n_channels, n_samples, time_step in cases:
+        frame = make_pmd_frame(measurement_type, frame_type, step, n_channels, n_samples)
+
+        loop_times, loop_values = loop_decode_pmd_frame(frame, step, n_channels, time_step)
+        times, values = PolarH10.decode_pmd_frame(frame, step, n_channels, time_step)
+        assert times.tolist() == loop_times and values.tolist() == loop_values, f"{name}: decoders disagree"
+
+        t_loop = min(timeit.repeat(lambda: loop_decode_pmd_frame(frame, step, n_channels, time_step), number=repeats, repeat=5))/repeats
+        t_vec = min(timeit.repeat(lambda: PolarH10.decode_pmd_frame(frame, step, n_channels, time_step), number=repeats, repeat=5))/repeats
+        print(f"{name:<12}{n_samples:>8}{t_loop*1e6:>12.1f}{t_vec*1e6:>13.1f}{t_loop/t_vec:>8.1f}x")
+
+def bench_streaming(duration):
+    # 1 s ACC chunks and the IBIs that arrived in the same second, as fed live from PolarH10
+    acc_data = synthetic_acc_data(duration)
+    ibi_data = synthetic_ibi_data(duration)
+    analyser = BreathingStreamAnalyser()
+    chunk_len = PolarH10.ACC_SAMPLING_FREQ
+    update_times = []
+    ibi_idx = 0
+    for start in range(0, len(acc_data['times']), chunk_len):
+        end_time = acc_data['times'][min(start + chunk_len, len(acc_data['times'])) - 1]
+        ibi_end = np.searchsorted(ibi_data['times'], end_time, side='right')
+        t0 = time.perf_counter()
+        analyser.update_acc(acc_data['times'][start:start + chunk_len], acc_data['values'][start:start + chunk_len])
+        analyser.update_ibi(ibi_data['times'][ibi_idx:ibi_end], ibi_data['values'][ibi_idx:ibi_end])
+        update_times.append(time.perf_counter() - t0)
+        ibi_idx = ibi_end
+    update_times = np.array(update_times)*1e6
+    n_minute = min(60, len(update_times))
+    print(f"Streaming update per 1 s chunk over {duration/60:.0f} min: first minute {np.mean(update_times[:n_minute]):.0f} us, "
+          f"last minute {np.mean(update_times[-n_minute:]):.0f} us, max {np.max(update_times):.0f} us")
+    print(f"Latest breathing rate {analyser.br_smooth_latest:.1f} bpm, HRV {analyser.hrv_latest:.0f} ms")
+
+def time_call(func, repeats=3):
+    # Best wall time of `repeats` calls, each after a garbage collection
+    durations = []
+    for _ in range(repeats):
+        gc.collect()
+        t0 = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - t0)
+    return min(durations)
+
+def peak_agreement(ref_times, times, tolerance):
+    # Fraction of reference peaks with a peak in `times` within `tolerance` seconds
+    if len(ref_times) == 0 or len(times) == 0:
+        return 0.0
+    idx = np.clip(np.searchsorted(times, ref_times), 1, max(1, len(times) - 1))
+    nearest = np.minimum(np.abs(times[idx] - ref_times), np.abs(times[idx - 1] - ref_times))
+    return np.mean(nearest <= tolerance)
+
+def bench_multirate(duration, decimated_freq=10):
+    acc_data = synthetic_acc_data(duration)
+    ibi_data = synthetic_ibi_data(duration)
+    full_rate = BreathingAnalyser(acc_data, ibi_data)
+    multirate = BreathingAnalyser(acc_data, ibi_data, decimated_freq=decimated_freq)
+
+    t_full = time_call(full_rate.calculate_breathing_signal)
+    t_filters = time_call(multirate.calculate_breathing_signal_multirate)
+    t_stage = time_call(multirate.calculate_breathing_signal)
+    t_interp = time_call(multirate.interpolate_decimated_signals)
+    assert len(BreathingAnalyser(acc_data, ibi_data, decimated_freq=decimated_freq).breathing_signal) == 0, "multirate analysis built the full-rate signals"
+    full_peaks = full_rate.acc_times[full_rate.breath_peaks]
+    multirate_peaks = multirate.acc_times[multirate.breath_peaks]
+
+    print(f"Breathing signal over {duration/60:.0f} min ({len(acc_data['times'])} samples), decimated to {decimated_freq} Hz")
+    print(f"Full rate stage (filtfilt and full-rate norms): {t_full*1e3:.1f} ms")
+    print(f"Multirate filters: {t_filters*1e3:.1f} ms ({t_full/t_filters:.1f}x), whole stage {t_stage*1e3:.1f} ms ({t_full/t_stage:.1f}x)")
+    print(f"  full-rate attributes, only interpolated when plotting: {t_interp*1e3:.1f} ms")
+    print(f"Breath peaks: {len(full_peaks)} full rate, {len(multirate_peaks)} multirate, "
+          f"{peak_agreement(full_peaks, multirate_peaks, 0.1)*100:.1f}% matched within 0.1 s, "
+          f"mean breathing rate {np.mean(full_rate.br_values):.2f} vs {np.mean(multirate.br_values):.2f} bpm")
+
+def loop_breathing_rate(breathing_signal, acc_times, peak_threshold=0.02):
+    # Reference: the original per-peak loops of BreathingAnalyser.calculate_breathing_rate
+    breathing_peak_signal = -breathing_signal
+    breath_peaks_all, _ = find_peaks(breathing_peak_signal)
+    breath_peaks = []
+    for i in range(len(breath_peaks_all)):
+        peak_val = breathing_peak_signal[breath_peaks_all[i]]
+        if i == 0:
+            breath_peaks.append(breath_peaks_all[i])
+        else:
+            start_idx = breath_peaks_all[i-1]
+            end_idx = breath_peaks_all[i]
+            trough_idx = np.argmin(breathing_peak_signal[start_idx:end_idx]) + start_idx
+            if peak_val - breathing_peak_signal[trough_idx] >= peak_threshold:
+                breath_peaks.append(breath_peaks_all[i])
+    br_values = 60/(np.diff(acc_times[breath_peaks])*2)
+    window_size = 3
+    br_values_smooth = np.zeros_like(br_values)
+    for i in range(len(br_values)):
+        if i < window_size:
+            br_values_smooth[i] = np.mean(br_values[0:i+window_size])
+        elif i > len(br_values) - window_size:
+            br_values_smooth[i] = np.mean(br_values[i-window_size:])
+        else:
+            br_values_smooth[i] = np.mean(br_values[i-window_size:i+window_size])
+    return breath_peaks, br_values, br_values_smooth
+
+def loop_ibi_extremes(ibi_values):
+    # Reference: the original per-extreme loop of BreathingAnalyser.calculate_heart_rate_variability
+    ibi_peaks_idx, _ = find_peaks(ibi_values)
+    ibi_troughs_idx, _ = find_peaks(-ibi_values)
+    ibi_extremes_raw_idx = np.sort(np.append(ibi_peaks_idx, ibi_troughs_idx))
+    ibi_extremes_idx = []
+    p2p_buffer = np.zeros(3)
+    for i in range(len(ibi_extremes_raw_idx)):
+        p2p_threshold = 0.15*np.amax(p2p_buffer)
+        if i == 0:
+            ibi_extremes_idx.append(ibi_extremes_raw_idx[i])
+        else:
+            p2p = abs(ibi_values[ibi_extremes_raw_idx[i]] - ibi_values[ibi_extremes_raw_idx[i-1]])
+            if p2p > p2p_threshold:
+                ibi_extremes_idx.append(ibi_extremes_raw_idx[i])
+                p2p_buffer = np.roll(p2p_buffer, -1)
+                p2p_buffer[-1] = p2p
+    return ibi_extremes_idx
+
+def vector_breathing_rate(breathing_signal, acc_times, peak_threshold=0.02, window_size=3):
+    # BreathingAnalyser.find_breaths on its own
+    breathing_peak_signal = -breathing_signal
+    breath_peaks_all, _ = find_peaks(breathing_peak_signal)
+    breath_peaks = BreathingAnalyser.validate_breath_peaks(breathing_peak_signal, breath_peaks_all, peak_threshold)
+    br_values = 60/(np.diff(acc_times[breath_peaks])*2)
+    return breath_peaks, br_values, BreathingAnalyser.smooth_values(br_values, window_size)
+
+def vector_ibi_extremes(ibi_values):
+    ibi_peaks_idx, _ = find_peaks(ibi_values)
+    ibi_troughs_idx, _ = find_peaks(-ibi_values)
+    return BreathingAnalyser.validate_ibi_extremes(ibi_values, np.sort(np.append(ibi_peaks_idx, ibi_troughs_idx)))
+
+def bench_analysis(duration):
+    sample_ibi = np.loadtxt("data/sample_data_ibi.csv", delimiter=",")
+    sample_acc = synthetic_acc_data(sample_ibi[-1, 0])
+    long_acc = synthetic_acc_data(duration)
+    long_ibi = synthetic_ibi_data(duration)
+    datasets = [
+        ("sample", BreathingAnalyser(sample_acc, {'times': sample_ibi[:, 0], 'values': sample_ibi[:, 1]})),
+        (f"synthetic {duration/3600:.0f} h", BreathingAnalyser(long_acc, long_ibi)),
+    ]
+    for name, analyser in datasets:
+        ref_peaks, ref_br, ref_smooth = loop_breathing_rate(analyser.breathing_signal, analyser.acc_times)
+        peaks, br, smooth = vector_breathing_rate(analyser.breathing_signal, analyser.acc_times)
+        assert np.array_equal(ref_peaks, peaks) and np.array_equal(ref_br, br) and np.allclose(ref_smooth, smooth, rtol=1e-12), f"{name}: breathing rate differs"
+        ref_extremes = loop_ibi_extremes(analyser.ibi_values)
+        assert np.array_equal(ref_extremes, vector_ibi_extremes(analyser.ibi_values)), f"{name}: IBI extremes differ"
+
+        t_loop_br = time_call(lambda: loop_breathing_rate(analyser.breathing_signal, analyser.acc_times))
+        t_vec_br = time_call(lambda: vector_breathing_rate(analyser.breathing_signal, analyser.acc_times))
+        t_loop_hrv = time_call(lambda: loop_ibi_extremes(analyser.ibi_values))
+        t_vec_hrv = time_call(lambda: vector_ibi_extremes(analyser.ibi_values))
+        print(f"{name}: outputs match ({len(peaks)} breath peaks, {len(ref_extremes)} IBI extremes)")
+        print(f"  breathing rate: loop {t_loop_br*1e3:.1f} ms, vectorised {t_vec_br*1e3:.1f} ms ({t_loop_br/t_vec_br:.1f}x)")
+        print(f"  IBI extremes:   loop {t_loop_hrv*1e3:.1f} ms, vectorised {t_vec_hrv*1e3:.1f} ms ({t_loop_hrv/t_vec_hrv:.1f}x)")
+
+def direct_rolling_hrv(times, ibi_values, window):
+    # Reference: each window's metrics straight from its beats, O(window) per beat
+    metrics = {metric: np.full(len(ibi_values), np.nan) for metric in METRICS}
+    for i in range(len(ibi_values)):
+        beats = ibi_values[np.searchsorted(times, times[i] - window, side='right'):i + 1]
+        metrics['mean_hr'][i] = 60000/np.mean(beats)
+        if len(beats) > 1:
+            diffs = np.diff(beats)
+            metrics['sdnn'][i] = np.std(beats, ddof=1)
+            metrics['rmssd'][i] = np.sqrt(np.mean(diffs**2))
+            metrics['pnn50'][i] = 100*np.mean(np.abs(diffs) > NN50_THRESHOLD)
+    return metrics
+
+def bench_rolling_hrv(duration, windows=(30, 60, 300, 3600)):
+    ibi_data = synthetic_ibi_data(duration)
+    # Beats as PolarH10 timestamps them: heart rate packets arrive once a second, all IBIs of a packet get its arrival time
+    datasets = [("beat times", ibi_data['times']), ("packet times", np.ceil(ibi_data['times']))]
+    n_beats = len(ibi_data['values'])
+    ibi_values = ibi_data['values']
+    print(f"Rolling HRV over {n_beats} beats ({duration/3600:.1f} h)")
+    for name, times in datasets:
+        # Live path, one beat at a time, against the offline series and a direct computation of each window
+        rolling_hrv = RollingHrv(windows)
+        live = {window: {metric: np.zeros(n_beats) for metric in METRICS} for window in windows}
+        for i, (beat_time, ibi) in enumerate(zip(times.tolist(), ibi_values.tolist())):
+            rolling_hrv.add(beat_time, ibi)
+            for window, metrics in rolling_hrv.latest().items():
+                for metric, value in metrics.items():
+                    live[window][metric][i] = value
+        check = slice(0, min(n_beats, 5000)) # the direct reference is slow
+        for window in windows:
+            offline = RollingHrv.series(times, ibi_values, window)
+            direct = direct_rolling_hrv(times[check], ibi_values[check], window)
+            for metric in METRICS:
+                assert np.allclose(live[window][metric], offline[metric], rtol=1e-9, atol=1e-9, equal_nan=True), f"{name} {window} s {metric}: live and offline differ"
+                assert np.allclose(offline[metric][check], direct[metric], rtol=1e-9, atol=1e-9, equal_nan=True), f"{name} {window} s {metric}: offline and direct differ"
+        print(f"  {name}: live, offline and direct metrics match for windows {', '.join(f'{w} s' for w in windows)}")
+
+    times = ibi_data['times']
+    for window in windows:
+        def feed():
+            rolling_window = RollingWindow(window)
+            for beat_time, ibi in zip(times.tolist(), ibi_values.tolist()):
+                rolling_window.add(beat_time, ibi)
+                rolling_window.metrics()
+        t_live = time_call(feed, repeats=1)
+        t_offline = time_call(lambda: RollingHrv.series(times, ibi_values, window))
+        t_direct = time_call(lambda: direct_rolling_hrv(times[:2000], ibi_values[:2000], window), repeats=1)*n_beats/min(n_beats, 2000)
+        print(f"  {window:>5} s window: live {t_live/n_beats*1e6:.1f} us/beat, offline {t_offline*1e3:.1f} ms, "
+              f"direct {t_direct/n_beats*1e6:.1f} us/beat")
+
+def true_breathing_rate(end_times, window, seed=0):
+    # Mean rate (bpm) of synthetic_acc_data's breathing over each window, from its phase
+    grid = np.arange(0, end_times[-1] + 1, 0.05)
+    phase = np.interp(np.concatenate((end_times - window, end_times)), grid, breathing_phase(grid, seed=seed))
+    return (phase[len(end_times):] - phase[:len(end_times)])/(2*np.pi)/window*60
+
+def bench_spectral(duration, window=60, segment=30, chunk_len=1.0):
+    for noise in (3.0, 10.0):
+        analyser = BreathingAnalyser(synthetic_acc_data(duration, noise=noise), synthetic_ibi_data(duration))
+        print(f"Spectral breathing rate over {duration/3600:.1f} h, {noise:g} mG sensor noise, {window} s windows of {segment} s segments")
+        end_times, br, concentration = analyser.spectral_breathing_rate(window, segment)
+
+        # One scipy.signal.welch call per window, for timing and as a reference for the spectra
+        q = int(round(BreathingAnalyser.ACC_SAMPLING_FREQ/spectral.RESAMPLE_FREQ))
+        signal = spectral.decimate_mean(analyser.breathing_signal, q)
+        fs = spectral.RESAMPLE_FREQ
+        nperseg, n_window = int(segment*fs), int(window*fs)
+        def welch_per_window():
+            return np.array([welch(signal[i:i + n_window], fs, nperseg=nperseg, noverlap=nperseg//2, nfft=spectral.ZERO_PADDING*nperseg)[1]
+                             for i in range(0, len(signal) - n_window + 1, nperseg//2)])
+        _, _, psd = spectral.windowed_welch(signal, fs, window, segment)
+        assert np.allclose(psd, welch_per_window()), "batched and per-window Welch spectra differ"
+
+        # Live chunks through StreamingBreathingRate must give the same windows
+        chunk = int(chunk_len*BreathingAnalyser.ACC_SAMPLING_FREQ)
+        def streaming():
+            streaming_br = spectral.StreamingBreathingRate(BreathingAnalyser.ACC_SAMPLING_FREQ, window, segment)
+            results = [streaming_br.update(analyser.acc_times[i:i + chunk], analyser.breathing_signal[i:i + chunk]) for i in range(0, len(analyser.acc_times), chunk)]
+            return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+        stream_times, stream_br = streaming()
+        assert np.allclose(stream_times, end_times) and np.allclose(stream_br, br), "streaming and batched breathing rates differ"
+
+        t_batched = time_call(lambda: analyser.spectral_breathing_rate(window, segment))
+        t_loop = time_call(welch_per_window, repeats=1)
+        t_streaming = time_call(streaming, repeats=1)
+        print(f"  {len(br)} windows: batched {t_batched*1e3:.1f} ms, welch per window {t_loop*1e3:.0f} ms ({t_loop/t_batched:.0f}x), "
+              f"streaming in {chunk_len:g} s chunks {t_streaming*1e3:.0f} ms; spectra and streaming output match")
+
+        # Against the peak-picked br_values of the same windows and the true rate of the synthetic breathing
+        in_window = [(analyser.br_times > t - window) & (analyser.br_times <= t) for t in end_times]
+        peak_br = np.array([np.mean(analyser.br_values[mask]) if mask.any() else np.nan for mask in in_window])
+        truth = true_breathing_rate(end_times, window)
+        print(f"  spectral vs peak-picked br_values: median difference {np.nanmedian(np.abs(br - peak_br)):.2f} bpm")
+        print(f"  error vs true rate: spectral median {np.median(np.abs(br - truth)):.2f} bpm, p95 {np.percentile(np.abs(br - truth), 95):.2f}; "
+              f"peak-picked median {np.nanmedian(np.abs(peak_br - truth)):.2f} bpm, p95 {np.nanpercentile(np.abs(peak_br - truth), 95):.2f}")
+
+    t_hrv = time_call(analyser.spectral_hrv)
+    hrv = analyser.spectral_hrv()
+    print(f"Spectral HRV: {len(hrv['times'])} windows of 300 s in {t_hrv*1e3:.1f} ms, median LF {np.median(hrv['lf']):.0f} ms^2, "
+          f"HF {np.median(hrv['hf']):.0f} ms^2, HF peak {np.median(hrv['hf_peak'])*60:.1f} cycles/min")
+
+def match_beats(true_times, beat_times, tolerance=0.05):
+    # Nearest detected beat of each true beat: timing errors (s) of the matched ones, missed and extra beat counts
+    idx = np.clip(np.searchsorted(beat_times, true_times), 1, max(1, len(beat_times) - 1))
+    nearest = np.where(np.abs(beat_times[idx] - true_times) < np.abs(beat_times[idx - 1] - true_times), idx, idx - 1)
+    errors = beat_times[nearest] - true_times
+    matched = np.abs(errors) <= tolerance
+    return errors[matched], int(np.sum(~matched)), len(beat_times) - len(np.unique(nearest[matched]))
+
+def bench_ecg(duration, frame_len=73):
+    ibi_data = synthetic_ibi_data(duration)
+    true_times, true_ibis = ibi_data['times'], np.diff(ibi_data['times'])*1000
+    # The heart rate service quantises IBIs to 1/1024 s (rounded up to whole ms by PolarH10)
+    hr_ibis = np.ceil(np.round(true_ibis/1000*1024)/1024*1000)
+    print(f"R peak detection on {duration/3600:.1f} h of synthetic {PolarH10.ECG_SAMPLING_FREQ} Hz ECG ({len(true_times)} beats)")
+    for noise in (15.0, 60.0):
+        ecg_data = synthetic_ecg_data(ibi_data, duration, noise=noise)
+        times, values = ecg_data['times'], ecg_data['values']
+        t_offline = time_call(lambda: RPeakDetector.detect(times, values), repeats=1)
+        beat_times, ibis = RPeakDetector.detect(times, values)
+
+        # Live, one PMD frame at a time as PolarH10.ecg_data_conv feeds it
+        detector = RPeakDetector()
+        start = time.perf_counter()
+        results = [detector.update(times[i:i + frame_len], values[i:i + frame_len]) for i in range(0, len(times), frame_len)]
+        t_live = time.perf_counter() - start
+        live_times = np.concatenate([r[0] for r in results])
+        live_ibis = np.concatenate([r[1] for r in results])
+        assert np.array_equal(live_times, beat_times) and np.allclose(live_ibis, ibis), "live and offline R peaks differ"
+
+        errors, missed, extra = match_beats(true_times, beat_times)
+        errors_ms = np.abs(errors - np.median(errors))*1e3
+        # IBI errors of consecutive detected beats that match consecutive true beats
+        nearest = np.clip(np.searchsorted(true_times, beat_times - 0.05), 0, len(true_times) - 1)
+        consecutive = np.diff(nearest) == 1
+        ecg_ibi_error = np.abs(np.diff(beat_times)*1000 - true_ibis[nearest[:-1]])[consecutive]
+        print(f"  {noise:g} uV noise: {len(beat_times)} beats, {missed} missed, {extra} extra; offline {t_offline*1e3:.0f} ms "
+              f"({duration/t_offline:.0f}x real time), live {t_live/len(results)*1e6:.0f} us per frame ({duration/t_live:.0f}x); live matches offline")
+        print(f"    R peak timing error (after the constant delay {np.median(errors)*1e3:+.1f} ms): median {np.median(errors_ms):.2f} ms, p99 {np.percentile(errors_ms, 99):.2f} ms")
+        print(f"    IBI error: ECG median {np.median(ecg_ibi_error):.2f} ms, p99 {np.percentile(ecg_ibi_error, 99):.2f} ms; "
+              f"heart rate service median {np.median(np.abs(hr_ibis - true_ibis)):.2f} ms, p99 {np.percentile(np.abs(hr_ibis - true_ibis), 99):.2f} ms")
+
+def bench_session_io(duration):
+    acc_data = synthetic_acc_data(duration)
+    ibi_data = synthetic_ibi_data(duration)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        acc_csv = os.path.join(tmp_dir, "acc.csv")
+        ibi_csv = os.path.join(tmp_dir, "ibi.csv")
+        session_path = os.path.join(tmp_dir, "session.dhyb")
+
+        def save_csv():
+            np.savetxt(acc_csv, np.column_stack((acc_data['times'], acc_data['values'])), delimiter=",")
+            np.savetxt(ibi_csv, np.column_stack((ibi_data['times'], ibi_data['values'])), delimiter=",")
+
+        def load_csv():
+            return np.loadtxt(acc_csv, delimiter=","), np.loadtxt(ibi_csv, delimiter=",")
+
+        def load_binary(mmap):
+            session = load_session(session_path, mmap=mmap)
+            return np.asarray(session['acc']['values']).sum(), np.asarray(session['ibi']['values']).sum() # touch all data
+
+        t_save_csv = time_call(save_csv, repeats=1)
+        t_save_binary = time_call(lambda: save_session(session_path, acc_data, ibi_data, metadata={'serial_number': 'SYNTHETIC'}), repeats=1)
+        t_load_csv = time_call(load_csv, repeats=1)
+        t_open_mmap = time_call(lambda: load_session(session_path))
+        t_load_mmap = time_call(lambda: load_binary(True))
+        t_load_read = time_call(lambda: load_binary(False))
+        csv_size = os.path.getsize(acc_csv) + os.path.getsize(ibi_csv)
+        session_size = os.path.getsize(session_path)
+
+        session = load_session(session_path)
+        assert np.array_equal(session['acc']['values'], acc_data['values']) and np.array_equal(session['acc']['times'], acc_data['times'])
+
+    print(f"Session of {duration/60:.0f} min ({len(acc_data['times'])} ACC samples)")
+    print(f"  size: CSV {csv_size/1e6:.1f} MB, binary {session_size/1e6:.1f} MB")
+    print(f"  save: CSV {t_save_csv:.2f} s, binary {t_save_binary*1e3:.1f} ms")
+    print(f"  load: CSV loadtxt {t_load_csv:.2f} s, binary open (memmap) {t_open_mmap*1e3:.2f} ms, "
+          f"memmap + read all {t_load_mmap*1e3:.1f} ms, full read {t_load_read*1e3:.1f} ms ({t_load_csv/t_load_read:.0f}x)")
+
+def timed_callback(callback, callback_times):
+    def wrapper(sender, data, *args):
+        start = time.perf_counter()
+        callback(sender, data, *args)
+        callback_times.append(time.perf_counter() - start)
+    return wrapper
+
+async def run_simulated_devices(n_devices, speed, record_len, dashboard=None, loop_stats=None, decode_queue=0, overflow='drop_oldest', sink=None,
+                                device_kwargs=None, clock_window=None):
+    # Returns the PolarH10s, the time spent in each bleak callback and the recording duration.
+    # With `decode_queue`, callbacks only queue frames for a DecodeWorker per device (polar_device.decode_worker).
+    # `device_kwargs`: extra SimulatedDevice arguments per device (e.g. frame_loss), `clock_window`: StreamHealth clock window in s
+    polar_devices = []
+    callback_times = []
+    for i in range(n_devices):
+        device = SimulatedDevice(f"SIM{i:05d}", speed=speed, duration=record_len*speed + 10, seed=i, **(device_kwargs[i] if device_kwargs else {}))
+        polar_device = PolarH10(device, client_class=SimulatedBleakClient)
+        if clock_window is not None:
+            polar_device.health = StreamHealth(clock_window=clock_window)
+        if sink is not None:
+            polar_device.add_sink(sink)
+        if decode_queue > 0:
+            DecodeWorker(polar_device, max_queue=decode_queue, overflow=overflow).start()
+        handler = polar_device.notification_handler
+        polar_device.notification_handler = lambda *args, handler=handler: timed_callback(handler(*args), callback_times)
+        await polar_device.connect()
+        await polar_device.start_acc_stream()
+        await polar_device.start_hr_stream()
+        polar_devices.append(polar_device)
+        if dashboard is not None:
+            dashboard.add_device(polar_device, device.device_id)
+    tasks = []
+    if dashboard is not None:
+        tasks.append(asyncio.create_task(dashboard.run()))
+    if loop_stats is not None:
+        tasks.append(asyncio.create_task(monitor_loop_lag(loop_stats)))
+    start = asyncio.get_running_loop().time()
+    await asyncio.sleep(record_len)
+    duration = asyncio.get_running_loop().time() - start
+    for task in tasks:
+        task.cancel()
+    for polar_device in polar_devices:
+        await polar_device.disconnect()
+        if polar_device.decode_worker is not None:
+            polar_device.decode_worker.stop()
+    return polar_devices, np.array(callback_times), duration
+
+def bench_simulator(n_devices=4, speed=10, record_len=10):
+    polar_devices, callback_times, duration = asyncio.run(run_simulated_devices(n_devices, speed, record_len))
+    acc_samples = sum(polar_device.acc_stream_values.total for polar_device in polar_devices)
+    expected_samples = n_devices*PolarH10.ACC_SAMPLING_FREQ*speed*duration
+    print(f"{n_devices} simulated devices at {speed:g}x real time for {duration:.1f} s")
+    print(f"  notifications: {len(callback_times)/duration:.0f}/s, ACC samples: {acc_samples/duration:.0f}/s ({acc_samples/expected_samples:.1%} of the simulated rate)")
+    print(f"  callback time: median {np.median(callback_times)*1e6:.1f} us, p99 {np.percentile(callback_times, 99)*1e6:.1f} us, "
+          f"max {callback_times.max()*1e6:.1f} us, {callback_times.sum()/duration:.1%} of wall time")
+
+class SlowSink:
+    # Stands in for slow downstream work (disk, GC pauses): stalls `delay` s on every `every`-th ACC frame.
+    # The defaults stall more than a device's ACC frames leave time for at 100x, so a DecodeWorker has to drop
+    def __init__(self, delay=0.05, every=20):
+        self.delay = delay
+        self.every = every
+        self.n = 0
+
+    def append(self, stream, times, values):
+        if stream == 'acc':
+            self.n += 1
+            if self.n % self.every == 0:
+                time.sleep(self.delay)
+
+    def update_metadata(self, **metadata):
+        pass
+
+def bench_receive(n_devices=4, speed=100, record_len=10):
+    print(f"Receive path of {n_devices} simulated devices at {speed:g}x real time for {record_len} s")
+    print("  decoding      sink      callback median      p99       max   loop lag  received  dropped")
+    for decode_queue, label in ((0, "inline"), (2048, "worker 2048"), (256, "worker 256")):
+        for sink_label, sink in (("none", None), ("stalling", SlowSink())):
+            loop_stats = {'max_loop_lag': 0.0}
+            polar_devices, callback_times, duration = asyncio.run(
+                run_simulated_devices(n_devices, speed, record_len, loop_stats=loop_stats, decode_queue=decode_queue, sink=sink))
+            acc_samples = sum(polar_device.acc_stream_values.total for polar_device in polar_devices)
+            expected_samples = n_devices*PolarH10.ACC_SAMPLING_FREQ*speed*duration
+            dropped = sum(polar_device.decode_worker.counts['dropped'] for polar_device in polar_devices if polar_device.decode_worker is not None)
+            print(f"  {label:<13} {sink_label:<9}{np.median(callback_times)*1e6:>13.1f} us{np.percentile(callback_times, 99)*1e3:>7.2f} ms"
+                  f"{callback_times.max()*1e3:>7.2f} ms{loop_stats['max_loop_lag']*1e3:>8.1f} ms{acc_samples/expected_samples:>10.1%}{dropped:>9}")
+
+def bench_live(n_devices=2, speed=10, record_len=20, fps=10):
+    # Agg canvas, so this measures the dashboard's own work (data update, blitting) without a display
+    import matplotlib
+    matplotlib.use('Agg')
+    from LiveDashboard import LiveDashboard
+
+    dashboard = LiveDashboard(fps=fps)
+    loop_stats = {'max_loop_lag': 0.0}
+    polar_devices, callback_times, duration = asyncio.run(run_simulated_devices(n_devices, speed, record_len, dashboard, loop_stats))
+    acc_samples = sum(polar_device.acc_stream_values.total for polar_device in polar_devices)
+    expected_samples = n_devices*PolarH10.ACC_SAMPLING_FREQ*speed*duration
+    frame_times = np.array(dashboard.frame_times[1:]) # the first frame creates the figure
+    quarter = max(1, len(frame_times)//4)
+    print(f"Live view of {n_devices} simulated devices at {speed:g}x real time for {duration:.1f} s ({duration*speed/60:.0f} min of data)")
+    print(f"  {len(dashboard.frame_times)/duration:.1f} fps (target {fps:g}), {dashboard.full_redraws} full redraws, {dashboard.axes_redraws} axes redraws")
+    print(f"  frame time: first quarter median {np.median(frame_times[:quarter])*1e3:.1f} ms, last quarter median {np.median(frame_times[-quarter:])*1e3:.1f} ms, "
+          f"max {frame_times.max()*1e3:.1f} ms")
+    print(f"  ACC samples received: {acc_samples/expected_samples:.1%} of the simulated rate, max event loop lag {loop_stats['max_loop_lag']*1e3:.1f} ms")
+    # The lag monitor starts after the first frame, which creates the figure. No later frame may hold up the notifications for longer than a frame interval
+    assert loop_stats['max_loop_lag'] < dashboard.frame_interval, f"event loop held up for {loop_stats['max_loop_lag']*1e3:.0f} ms by the dashboard"
+
+def bench_plot(duration, n_traces=4):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from breathing_plots import plot_decimated
+
+    acc_data = synthetic_acc_data(duration)
+    times, values = acc_data['times'], acc_data['values'].astype(float)
+    traces = [values[:, i % 3] for i in range(n_traces)]
+
+    def draw(plot, xlims=()):
+        fig = Figure(figsize=(10, 7))
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(nrows=n_traces, ncols=1, sharex=True)
+        lines = [plot(ax, times, y) for ax, y in zip(axes, traces)]
+        start = time.perf_counter()
+        fig.canvas.draw()
+        t_draw = time.perf_counter() - start
+        t_views = []
+        for xlim in xlims:
+            start = time.perf_counter()
+            axes[0].set_xlim(*xlim)
+            fig.canvas.draw()
+            t_views.append(time.perf_counter() - start)
+        return t_draw, t_views, axes, lines
+
+    zoom = (duration/2, duration/2 + 60)
+    xlims = [zoom, (zoom[0] + 10, zoom[1] + 10), (times[0], times[-1])] # zoom to 1 min, pan, zoom out
+    t_raw, t_raw_views, _, _ = draw(lambda ax, x, y: ax.plot(x, y, marker='o', markersize=0.3, linewidth=0.05)[0], xlims)
+    t_dec, t_dec_views, axes, lines = draw(lambda ax, x, y: plot_decimated(ax, x, y, marker='o', markersize=0.3, linewidth=0.05), xlims)
+
+    # The envelope of the visible range has the same extremes as the raw samples in it
+    axes[0].set_xlim(*xlims[1])
+    visible = (times >= xlims[1][0]) & (times <= xlims[1][1])
+    shown = lines[0].get_ydata()[(lines[0].get_xdata() >= xlims[1][0]) & (lines[0].get_xdata() <= xlims[1][1])]
+    assert shown.min() == traces[0][visible].min() and shown.max() == traces[0][visible].max()
+
+    print(f"{n_traces} traces of {len(times)} samples ({duration/3600:.1f} h), {len(lines[0].get_xdata())} points drawn per trace when zoomed")
+    print(f"  first draw: raw {t_raw:.2f} s, decimated {t_dec*1e3:.0f} ms ({t_raw/t_dec:.0f}x)")
+    print(f"  zoom to 1 min / pan / zoom out: raw {' / '.join(f'{t*1e3:.0f}' for t in t_raw_views)} ms, "
+          f"decimated {' / '.join(f'{t*1e3:.0f}' for t in t_dec_views)} ms")
+
+def bench_startup(duration, repeats=5):
+    # Fresh interpreter per run, as when a job runner launches DHYB.py per session. Best of `repeats`
+    def run(command):
+        return time_call(lambda: subprocess.run([sys.executable] + command, check=True, capture_output=True), repeats=1)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        session_path = os.path.join(tmp_dir, "session.dhyb")
+        save_session(session_path, synthetic_acc_data(duration), synthetic_ibi_data(duration))
+        timings = {
+            'python': ["-c", "pass"],
+            'import BreathingAnalyser': ["-c", "import BreathingAnalyser"],
+            'import DHYB': ["-c", "import DHYB"],
+            'import matplotlib.pyplot': ["-c", "import matplotlib.pyplot"],
+            'DHYB.py --headless': ["DHYB.py", "--use-sample-data", "--session-file", session_path, "--headless"],
+            'DHYB.py --headless --report': ["DHYB.py", "--use-sample-data", "--session-file", session_path, "--headless", "--report", os.path.join(tmp_dir, "report.png")],
+        }
+        print(f"Startup (best of {repeats}, session of {duration/60:.0f} min)")
+        for name, command in timings.items():
+            print(f"  {name:<30}{min(run(command) for _ in range(repeats))*1e3:>8.0f} ms")
+
+def bench_batch(duration, n_sessions=16):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        session_paths = []
+        for i in range(n_sessions):
+            session_path = os.path.join(tmp_dir, f"session_{i}.dhyb")
+            save_session(session_path, synthetic_acc_data(duration, seed=i), synthetic_ibi_data(duration, seed=i))
+            session_paths.append(session_path)
+
+        print(f"Batch analysis of {n_sessions} sessions of {duration/60:.0f} min")
+        worker_counts = sorted(set([2**i for i in range(int(math.log2(os.cpu_count() or 1)) + 1)] + [os.cpu_count() or 1]))
+        base_rate = None
+        for workers in worker_counts:
+            output_path = os.path.join(tmp_dir, f"summary_{workers}.csv")
+            elapsed = time_call(lambda: run_batch(session_paths, output_path, workers=workers, resume=False), repeats=1)
+            rate = n_sessions/elapsed
+            base_rate = base_rate or rate
+            print(f"  {workers:>3} workers: {rate:.2f} sessions/s ({rate/base_rate:.1f}x)")
+
+def bench_health(n_devices=2, record_len=40, frame_loss=0.01, clock_window=2.0):
+    # Real time, so host and simulated sensor clocks only differ by the injected drift. Devices alternate -200 and +100 ppm
+    drifts = [(-200.0, 100.0)[i % 2] for i in range(n_devices)]
+    device_kwargs = [{'frame_loss': frame_loss, 'clock_drift_ppm': drift} for drift in drifts]
+    polar_devices, callback_times, duration = asyncio.run(run_simulated_devices(n_devices, 1, record_len, device_kwargs=device_kwargs, clock_window=clock_window))
+    print(f"Stream health of {n_devices} simulated devices over {duration:.0f} s, {frame_loss:.0%} of frames lost")
+    for polar_device, drift in zip(polar_devices, drifts):
+        health = polar_device.health.snapshot()
+        acc = health['streams']['acc']
+        lost = acc['gaps']/(acc['frames'] + acc['gaps'])
+        # A sensor clock that gains `drift` ppm shows as a host clock drift of -`drift` ppm
+        print(f"  {polar_device.bleak_device.device_id}: ACC gaps {acc['gaps']} ({acc['missing_samples']} samples, {lost:.1%} of frames), "
+              f"clock drift {health['clock_drift_ppm']:+.0f} ppm (simulated {-drift:+.0f} ppm)")
+        print(f"    {polar_device.health.summary_line()}")
+
+def bench_cache(duration):
+    acc_data = synthetic_acc_data(duration, motion_per_hour=6)
+    ibi_data = synthetic_ibi_data(duration)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        session_path = os.path.join(tmp_dir, "session.dhyb")
+        save_session(session_path, acc_data, ibi_data, metadata={'serial_number': 'SYNTHETIC'})
+        cache = AnalysisCache(os.path.join(tmp_dir, "cache"))
+
+        def reopen(cache, **kwargs):
+            # What DHYB.py --use-sample-data does before plotting: load the session and analyse it
+            session = load_session(session_path)
+            analyser = BreathingAnalyser(session['acc'], session['ibi'], cache=cache, **kwargs)
+            return analyser.get_summary()
+
+        t_uncached = time_call(lambda: reopen(None), repeats=1)
+        t_cold = time_call(lambda: reopen(cache), repeats=1)
+        t_warm = time_call(lambda: reopen(cache))
+        misses = cache.misses
+        t_threshold = time_call(lambda: reopen(cache, peak_threshold=0.03), repeats=1)
+        recomputed = cache.misses - misses
+        assert reopen(cache) == reopen(None)
+        cache_size = cache.size()
+
+    print(f"Reopening a {duration/60:.0f} min session ({len(acc_data['times'])} ACC samples)")
+    print(f"  no cache {t_uncached:.2f} s, cold cache {t_cold:.2f} s, warm cache {t_warm*1e3:.0f} ms ({t_uncached/t_warm:.0f}x), cache size {cache_size/1e6:.0f} MB")
+    print(f"  new peak threshold {t_threshold*1e3:.0f} ms, {recomputed} of 3 stages recomputed")
+
+def peak_memory(func):
+    # Result of one call and the peak memory it allocated (tracemalloc slows the call down, time it separately)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+def bench_chunked(duration, block_sizes=(2**18, 2**20)):
+    acc_data = synthetic_acc_data(duration, motion_per_hour=6)
+    ibi_data = synthetic_ibi_data(duration)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        session_path = os.path.join(tmp_dir, "session.dhyb")
+        save_session(session_path, acc_data, ibi_data, metadata={'serial_number': 'SYNTHETIC'})
+        del acc_data
+        session = load_session(session_path)
+        start = time.perf_counter()
+        # partial rather than lambdas, which would hold on to `session` until it is deleted below (so the memory map closes before cleanup)
+        whole, whole_peak = peak_memory(functools.partial(BreathingAnalyser, session['acc'], session['ibi']))
+        t_whole = time.perf_counter() - start
+        print(f"Analysing a {duration/3600:g} h session ({len(session['acc']['times'])} ACC samples, memory-mapped)")
+        print(f"  BreathingAnalyser: {t_whole:.2f} s, peak memory {whole_peak/1e6:.0f} MB")
+        for block_size in block_sizes:
+            for materialize in ((), ('breathing_signal',)):
+                start = time.perf_counter()
+                chunked, peak = peak_memory(functools.partial(ChunkedBreathingAnalyser, session['acc'], session['ibi'], block_size=block_size, materialize=materialize))
+                elapsed = time.perf_counter() - start
+                assert np.array_equal(chunked.breath_peaks, whole.breath_peaks) and chunked.get_summary() == whole.get_summary()
+                error = ""
+                if not materialize:
+                    try:
+                        chunked.spectral_breathing_rate()
+                        raise AssertionError("spectral_breathing_rate ran without the breathing signal")
+                    except ValueError:
+                        pass
+                else:
+                    assert all(np.allclose(a, b, equal_nan=True) for a, b in zip(chunked.spectral_breathing_rate(), whole.spectral_breathing_rate()))
+                    error = f", breathing signal max rel error {np.max(np.abs(chunked.breathing_signal - whole.breathing_signal))/np.max(np.abs(whole.breathing_signal)):.1e}"
+                print(f"  Chunked, {block_size} sample blocks ({block_size/PolarH10.ACC_SAMPLING_FREQ/60:.0f} min), padding {chunked.padding}, "
+                      f"materialize {list(materialize)}: {elapsed:.2f} s, peak memory {peak/1e6:.0f} MB, same breath peaks and summary{error}")
+        del session, whole, chunked
+
+async def sequential_device_info(polar_device):
+    # The original PolarH10.get_device_info, one read after another
+    for name, uuid in [('model_number', PolarH10.MODEL_NBR_UUID), ('manufacturer_name', PolarH10.MANUFACTURER_NAME_UUID),
+                       ('serial_number', PolarH10.SERIAL_NUMBER_UUID), ('battery_level', PolarH10.BATTERY_LEVEL_UUID),
+                       ('firmware_revision', PolarH10.FIRMWARE_REVISION_UUID), ('hardware_revision', PolarH10.HARDWARE_REVISION_UUID),
+                       ('software_revision', PolarH10.SOFTWARE_REVISION_UUID)]:
+        setattr(polar_device, name, await polar_device.bleak_client.read_gatt_char(uuid))
+
+async def time_to_first_sample(scanner, device_ids, quick_connect, defer_device_info, known_devices=None, scan_timeout=5.0):
+    # Seconds from the start of the scan to the first decoded ACC frame, as DHYB.main connects
+    start = time.monotonic()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        devices = await find_devices(scanner, device_ids, quick_connect, scan_timeout, known_devices)
+        result = await record_device(devices[0], 1, 0, None, client_class=SimulatedBleakClient, decode_queue=0, defer_device_info=defer_device_info)
+    return result['polar_device'].health.streams['acc']['first_frame_time'] - start
+
+async def run_connect(gatt_delay, advertising_delay):
+    device = SimulatedDevice("SIM00000", duration=20, gatt_delay=gatt_delay)
+    scanner = SimulatedBleakScanner([device], advertising_delay=advertising_delay, full_scan=True)
+    known_devices = {device.device_id: device.address}
+    timings = [
+        ("full scan, device info first (before)", await time_to_first_sample(scanner, None, False, False)),
+        ("filtered scan, device info first", await time_to_first_sample(scanner, [device.device_id], True, False)),
+        ("filtered scan, deferred device info", await time_to_first_sample(scanner, [device.device_id], True, True)),
+        ("remembered address, deferred device info", await time_to_first_sample(scanner, [device.device_id], True, True, known_devices)),
+    ]
+    polar_device = PolarH10(device, client_class=SimulatedBleakClient)
+    await polar_device.connect()
+    start = time.perf_counter()
+    await sequential_device_info(polar_device)
+    t_sequential = time.perf_counter() - start
+    start = time.perf_counter()
+    await polar_device.get_device_info()
+    t_gathered = time.perf_counter() - start
+    await polar_device.disconnect()
+    return timings, t_sequential, t_gathered
+
+def bench_connect(gatt_delay=0.03, advertising_delay=0.2):
+    timings, t_sequential, t_gathered = asyncio.run(run_connect(gatt_delay, advertising_delay))
+    print(f"Time to first ACC sample, simulated strap seen after {advertising_delay*1e3:.0f} ms, {gatt_delay*1e3:.0f} ms per GATT operation, 5 s scan timeout")
+    for label, seconds in timings:
+        print(f"  {label:<44}{seconds:>6.2f} s")
+    print(f"  7 device info reads: sequential {t_sequential*1e3:.0f} ms, gathered {t_gathered*1e3:.0f} ms (one request at a time on the link)")
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Benchmarks for the Polar H10 recording and analysis pipeline")
+    parser.add_argument("benchmarks", nargs="*", default=["decode", "streaming", "multirate", "analysis", "session_io", "simulator", "receive", "live", "plot", "startup", "batch", "health", "hrv", "spectral", "ecg", "cache", "chunked", "connect"], help="Benchmarks to run: decode, streaming, multirate, analysis, session_io, simulator, receive, live, plot, startup, batch, health, hrv, spectral, ecg, cache, chunked, connect")
+    parser.add_argument("--repeats", type=int, default=1000, help="Calls per timing run")
+    parser.add_argument("--duration", type=float, default=3600, help="Length of synthetic recordings in seconds")
+    parser.add_argument("--devices", type=int, default=4, help="Simulated devices for the simulator benchmark")
+    parser.add_argument("--speed", type=float, default=10, help="Speed-up over real time for the simulator benchmark")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+
+    args = get_arguments()
+    if "decode" in args.benchmarks:
+        bench_pmd_decode(args.repeats)
+    if "streaming" in args.benchmarks:
+        bench_streaming(args.duration)
+    if "multirate" in args.benchmarks:
+        bench_multirate(args.duration)
+    if "analysis" in args.benchmarks:
+        bench_analysis(args.duration)
+    if "session_io" in args.benchmarks:
+        bench_session_io(args.duration)
+    if "simulator" in args.benchmarks:
+        bench_simulator(args.devices, args.speed)
+    if "receive" in args.benchmarks:
+        bench_receive(args.devices, args.speed)
+    if "live" in args.benchmarks:
+        bench_live(args.devices, args.speed)
+    if "plot" in args.benchmarks:
+        bench_plot(args.duration)
+    if "startup" in args.benchmarks:
+        bench_startup(args.duration)
+    if "batch" in args.benchmarks:
+        bench_batch(args.duration)
+    if "health" in args.benchmarks:
+        bench_health()
+    if "hrv" in args.benchmarks:
+        bench_rolling_hrv(args.duration)
+    if "spectral" in args.benchmarks:
+        bench_spectral(args.duration)
+    if "ecg" in args.benchmarks:
+        bench_ecg(args.duration)
+    if "cache" in args.benchmarks:
+        bench_cache(args.duration)
+    if "chunked" in args.benchmarks:
+        bench_chunked(args.duration)
+    if "connect" in args.benchmarks:
+        bench_connect()
@@ -0,0 +1,162 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import scipy
+from PolarH10 import PolarH10
+from BreathingAnalyser import BreathingAnalyser
+from PolarH10Simulator import SimulatedDevice
+from session_file import save_session, load_session
+from synthetic_data import synthetic_acc_data, synthetic_ibi_data
+from breathing_plots import minmax_indices
+from benchmark import time_call, peak_memory
+
+""" benchmark_suite.py
+Time and memory of each stage of the pipeline on synthetic recordings from 1 minute to 24 hours, as JSON for comparing commits
+- Synthetic data: ACC with gravity, posture drift, breathing, sensor noise and bursts of motion, IBIs with respiratory sinus arrhythmia
+- Stages: PMD ACC frame decode (PolarH10.acc_data_conv), calculate_breathing_signal, calculate_breathing_rate,
+  calculate_heart_rate_variability, session save and load, and plot preparation (min/max decimation of the breathing signal)
+- Each stage is timed (best of --repeats) and its peak memory measured with tracemalloc in a separate run, with the time_call
+  and peak_memory helpers of benchmark.py
+- --output writes the results with the commit and environment, --compare flags stages slower or larger than a baseline file
+
+    python benchmark_suite.py --durations 60 3600 --output results.json
+    python benchmark_suite.py --durations 60 3600 --compare results.json
+"""
+
+DEFAULT_DURATIONS = [60, 600, 3600, 4*3600, 24*3600]
+STAGES = ['decode', 'breathing_signal', 'breathing_rate', 'heart_rate_variability', 'save', 'load', 'plot_prep']
+PLOT_WIDTH = 2000 # pixel columns the plot preparation decimates to
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True).stdout.strip() != ""
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def environment():
+    commit, dirty = git_revision()
+    return {
+        'commit': commit, 'dirty': dirty, 'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+        'platform': platform.platform(), 'processor': platform.processor() or platform.machine(), 'cpu_count': os.cpu_count(),
+    }
+
+def measure(func, repeats):
+    # Best wall time of `repeats` calls after a warm-up call, then the peak memory allocated during one more call
+    func()
+    _, peak = peak_memory(func)
+    return time_call(func, repeats), peak
+
+def encode_acc_frames(acc_data):
+    # The recording as the PMD notifications a Polar H10 sends, 36 samples per frame
+    n = SimulatedDevice.ACC_SAMPLES_PER_FRAME
+    values = acc_data['values']
+    return [SimulatedDevice.encode_pmd_frame(0x02, 0x01, int(599_634_513_112_000_000 + acc_data['times'][start + n - 1]*1e9), values[start:start + n], 2)
+            for start in range(0, len(values) - n + 1, n)]
+
+def decode_frames(frames):
+    polar_device = PolarH10(None)
+    for frame in frames:
+        polar_device.acc_data_conv(None, frame, 0.0)
+    return polar_device
+
+def plot_prep(analyser):
+    signal = analyser.breathing_signal
+    idx = minmax_indices(signal, 0, len(signal), PLOT_WIDTH)
+    return analyser.acc_times[idx], signal[idx]
+
+def run_duration(duration, repeats, tmp_dir, seed=0):
+    acc_data = synthetic_acc_data(duration, seed=seed, motion_per_hour=6)
+    ibi_data = synthetic_ibi_data(duration, seed=seed)
+    n_samples = len(acc_data['times'])
+    frames = encode_acc_frames(acc_data)
+    analyser = BreathingAnalyser(acc_data, ibi_data)
+    session_path = os.path.join(tmp_dir, f"session_{int(duration)}.dhyb")
+
+    def load():
+        session = load_session(session_path)
+        return np.asarray(session['acc']['values']).sum(), np.asarray(session['ibi']['values']).sum() # touch all data
+
+    stages = {
+        'decode': lambda: decode_frames(frames),
+        'breathing_signal': analyser.calculate_breathing_signal,
+        'breathing_rate': analyser.calculate_breathing_rate,
+        'heart_rate_variability': analyser.calculate_heart_rate_variability,
+        'save': lambda: save_session(session_path, acc_data, ibi_data, metadata={'serial_number': 'SYNTHETIC'}),
+        'load': load,
+        'plot_prep': lambda: plot_prep(analyser),
+    }
+    results = []
+    for stage in STAGES:
+        seconds, peak_bytes = measure(stages[stage], repeats if duration <= 3600 else 1)
+        results.append({'stage': stage, 'duration': duration, 'acc_samples': n_samples, 'ibi_samples': len(ibi_data['times']),
+                        'seconds': seconds, 'peak_bytes': peak_bytes, 'realtime_factor': duration/seconds if seconds > 0 else None})
+        print(f"  {stage:<24}{seconds*1e3:>10.1f} ms{peak_bytes/1e6:>10.1f} MB{duration/seconds:>12.0f}x", flush=True)
+    return results
+
+def run_suite(durations, repeats=3):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for duration in durations:
+            print(f"{format_duration(duration)} ({int(duration*PolarH10.ACC_SAMPLING_FREQ)} ACC samples)")
+            print(f"  {'stage':<24}{'time':>13}{'peak mem':>13}{'real time':>13}")
+            results.extend(run_duration(duration, repeats, tmp_dir))
+    return {'environment': environment(), 'results': results}
+
+def format_duration(seconds):
+    return f"{seconds/3600:g} h" if seconds >= 3600 else f"{seconds/60:g} min"
+
+def compare(report, baseline, threshold=0.2, min_change=0.002):
+    # Per stage and duration: time and peak memory relative to the baseline, flagged when more than `threshold` above it.
+    # Time changes under `min_change` seconds are timer noise and never flagged
+    previous = {(row['stage'], row['duration']): row for row in baseline['results']}
+    print(f"Compared with {baseline['environment'].get('commit') or 'baseline'} ({baseline['environment'].get('time')})")
+    print(f"  {'stage':<24}{'duration':>10}{'time':>10}{'memory':>10}")
+    regressions = []
+    for row in report['results']:
+        old = previous.get((row['stage'], row['duration']))
+        if old is None:
+            continue
+        time_ratio = row['seconds']/old['seconds'] if old['seconds'] > 0 else np.nan
+        memory_ratio = row['peak_bytes']/old['peak_bytes'] if old['peak_bytes'] > 0 else np.nan
+        flags = []
+        if time_ratio > 1 + threshold and row['seconds'] - old['seconds'] > min_change:
+            flags.append('slower')
+        if memory_ratio > 1 + threshold:
+            flags.append('more memory')
+        if flags:
+            regressions.append((row['stage'], row['duration'], flags))
+        print(f"  {row['stage']:<24}{format_duration(row['duration']):>10}{time_ratio:>9.2f}x{memory_ratio:>9.2f}x  {', '.join(flags)}")
+    return regressions
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Time and memory of each pipeline stage on synthetic recordings, as JSON")
+    parser.add_argument("--durations", type=float, nargs="+", default=DEFAULT_DURATIONS, help="Recording lengths in seconds (default: 1 min, 10 min, 1 h, 4 h, 24 h)")
+    parser.add_argument("--repeats", type=int, default=3, help="Timing runs per stage, the best is reported (recordings over 1 h: 1)")
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative increase in time or memory reported as a regression")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+
+    args = get_arguments()
+    report = run_suite(args.durations, args.repeats)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"Results written to {args.output}")
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        print(f"{len(regressions)} regressions" if regressions else "No regressions")
+        sys.exit(1 if regressions else 0)
@@ -1,53 +1,85 @@
 from bleak import BleakScanner, BleakClient
+import argparse
 import asyncio
 
 # BLE Scanner – Scan for BLE devices and print out their details
+# Devices are connected to concurrently, each bounded by a timeout, so an unresponsive device doesn't hold up the others.
+# Each device's services are printed as one block once all are done.
 
-async def main():
-    devices = await BleakScanner.discover()
-    for device in devices:
-        print()
-        print(f"Name: {device.name}")
-        print(f"Address: {device.address}")
-        print(f"Details: {device.details}")
-        print(f"Metadata: {device.metadata}")
-        print(f"RSSI: {device.rssi}")
+def device_details(device):
+    return [
+        "",
+        f"Name: {device.name}",
+        f"Address: {device.address}",
+        f"Details: {device.details}",
+        f"Metadata: {getattr(device, 'metadata', None)}",
+        f"RSSI: {getattr(device, 'rssi', None)}",
+    ]
 
-    for device in devices:
-        this_device = await BleakScanner.find_device_by_address(device.address)
+async def list_services(device):
+    # The device's services, characteristics and descriptors as printable lines
+    lines = []
+    async with BleakClient(device) as client:
+        lines.append(f"Services found for device")
+        lines.append(f"Name: \033[92m{device.name}\033[0m")
+        lines.append(f"\tDevice Address:{device.address}")
+
+        lines.append("\tAll Services")
+        for service in client.services:
+            lines.append("")
+            lines.append(f"\t\tDescription: {service.description}")
+            lines.append(f"\t\tService: {service}")
+
+        lines.append("")
+        lines.append(f"\tService Characteristics:")
+        for service in client.services:
+            lines.append("")
+            lines.append(f"\t\tDescription: {service.description}")
+            lines.append(f"\t\tService: {service}")
+
+            lines.append(f"\t\tCharacteristics:")
+            for c in service.characteristics:
+                lines.append("")
+                lines.append(f"\t\t\tUUID: {c.uuid}")
+                lines.append(f"\t\t\tDescipriton: {c.description}")
+                lines.append(f"\t\t\tHandle: {c.handle}")
+                lines.append(f"\t\t\tProperties: {c.properties}")
+
+                lines.append("\t\t\tDescriptors:")
+                for descrip in c.descriptors:
+                    lines.append(f"\t\t\t\t{descrip}")
+    return lines
+
+async def enumerate_services(device, connect_timeout, semaphore):
+    async with semaphore:
         try:
-            async with BleakClient(this_device) as client:
-                print(f"Services found for device")
-                print(f"Name: \033[92m{device.name}\033[0m")
-                print(f"\tDevice Address:{device.address}")
-
-                print("\tAll Services")
-                for service in client.services:
-                    print()
-                    print(f"\t\tDescription: {service.description}")
-                    print(f"\t\tService: {service}")
-                
-                print()
-                print(f"\tService Characteristics:")
-                for service in client.services:
-                    print()
-                    print(f"\t\tDescription: {service.description}")
-                    print(f"\t\tService: {service}")
-
-                    print(f"\t\tCharacteristics:")
-                    for c in service.characteristics:
-                        print()
-                        print(f"\t\t\tUUID: {c.uuid}")
-                        print(f"\t\t\tDescipriton: {c.description}")
-                        print(f"\t\t\tHandle: {c.handle}")
-                        print(f"\t\t\tProperties: {c.properties}")
-
-                        print("\t\t\tDescriptors:")
-                        for descrip in c.descriptors:
-                            print(f"\t\t\t\t{descrip}")
-        except Exception as e:
-            print(f"Could not connect to device: {device}")
-            print(f"Error: {e}")
-
-
-asyncio.run(main())
\ No newline at end of file
+            return await asyncio.wait_for(list_services(device), connect_timeout)
+        except Exception as e: # includes asyncio.TimeoutError
+            return [f"Could not connect to device: {device}", f"Error: {type(e).__name__}: {e}"]
+
+async def main(scan_timeout=5.0, connect_timeout=20.0, max_connections=4, name_filter=None):
+    devices = await BleakScanner.discover(timeout=scan_timeout)
+    if name_filter is not None:
+        devices = [device for device in devices if device.name is not None and name_filter in device.name]
+    for device in devices:
+        print("\n".join(device_details(device)))
+
+    # The devices found are connected to directly, without scanning for each again. At most `max_connections` at a time,
+    # adapters limit concurrent connections
+    semaphore = asyncio.Semaphore(max_connections)
+    results = await asyncio.gather(*(enumerate_services(device, connect_timeout, semaphore) for device in devices))
+    for lines in results:
+        print("\n".join(lines))
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Scan for BLE devices and list their services")
+    parser.add_argument("--scan-timeout", type=float, default=5.0, help="Seconds to scan for devices")
+    parser.add_argument("--connect-timeout", type=float, default=20.0, help="Seconds allowed to connect to a device and list its services")
+    parser.add_argument("--max-connections", type=int, default=4, help="Devices connected to at the same time")
+    parser.add_argument("--name", default=None, help="Only list devices whose name contains this, e.g. Polar")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+
+    args = get_arguments()
+    asyncio.run(main(args.scan_timeout, args.connect_timeout, args.max_connections, args.name))
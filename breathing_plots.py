@@ -0,0 +1,181 @@
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import numpy as np
+
+# breathing_plots – Plots of a BreathingAnalyser's signals, breathing rate and heart rate variability
+# Imported on first use, so analysis without plots (headless runs, batch analysis) doesn't pay for matplotlib. pyplot and the
+# GUI backend are only imported by the show_* functions, reports are drawn on an Agg canvas
+# Sample-rate traces are drawn through a min/max envelope of the visible x-range (about one min/max pair per pixel column),
+# recomputed on zoom and pan, so figures of 24 h recordings stay interactive. Peak and extreme markers are drawn exactly.
+
+def minmax_indices(y, start, stop, n_bins):
+    """
+    Indices of y[start:stop] that keep the min and max of each of `n_bins` equal-size bins, in order, plus both ends.
+    Every local extreme that would be visible at this resolution is kept, unlike plain subsampling.
+    """
+    n = stop - start
+    if n <= 2*n_bins:
+        return np.arange(start, stop)
+    bin_size = int(np.ceil(n / n_bins))
+    n_full = n // bin_size
+    blocks = np.asarray(y[start:start + n_full*bin_size]).reshape(n_full, bin_size)
+    offsets = start + np.arange(n_full)*bin_size
+    idx_min = offsets + blocks.argmin(axis=1)
+    idx_max = offsets + blocks.argmax(axis=1)
+    idx = np.column_stack((np.minimum(idx_min, idx_max), np.maximum(idx_min, idx_max))).ravel()
+    tail_start = start + n_full*bin_size
+    if tail_start < stop:
+        tail = np.asarray(y[tail_start:stop])
+        idx = np.append(idx, np.sort([tail_start + tail.argmin(), tail_start + tail.argmax()]))
+    return np.concatenate(([start], idx, [stop - 1]))
+
+class DecimatedLine:
+    # A Line2D showing the min/max envelope of (x, y) over its axes' current x-range. x must be sorted
+    BLOCK_SIZE = 64 # samples per block of the precomputed envelope used for wide views
+
+    def __init__(self, ax, x, y, **kwargs):
+        self.x = x
+        self.y = y
+        # Min/max of each block, computed once. Wide views are decimated from these instead of every sample, the extremes are the same
+        self.block_idx = minmax_indices(y, 0, len(y), int(np.ceil(len(y) / DecimatedLine.BLOCK_SIZE)))
+        idx = self.visible_indices(ax, x[0], x[-1]) if len(x) > 0 else np.zeros(0, dtype=int)
+        self.line, = ax.plot(x[idx], y[idx], **kwargs) # the full-range envelope keeps the global min and max for autoscaling
+        self.view = None # (x-range, width) the line was last decimated for
+        # A plain function rather than a bound method, as the callback registry only holds weak references to methods.
+        # Connected on every axes sharing x, as older matplotlib (e.g. the pinned 3.7) only calls it on the axes that was zoomed or panned, not on its
+        # siblings. Axes must share x before the line is added
+        for sibling in ax.get_shared_x_axes().get_siblings(ax):
+            sibling.callbacks.connect('xlim_changed', lambda _, ax=ax: self.update(ax))
+
+    def visible_indices(self, ax, x_min, x_max):
+        # One sample beyond each edge so the line runs to the axes border
+        start = max(0, np.searchsorted(self.x, x_min) - 1)
+        stop = min(len(self.x), np.searchsorted(self.x, x_max, side='right') + 1)
+        n_bins = max(500, int(ax.bbox.width))
+        if stop - start < 4*DecimatedLine.BLOCK_SIZE*n_bins:
+            return minmax_indices(self.y, start, stop, n_bins)
+        block_start, block_stop = np.searchsorted(self.block_idx, [start, stop])
+        idx = self.block_idx[block_start:block_stop]
+        return idx[minmax_indices(self.y[idx], 0, len(idx), n_bins)]
+
+    def update(self, ax):
+        if len(self.x) == 0:
+            return
+        view = (tuple(ax.get_xlim()), int(ax.bbox.width))
+        if view == self.view: # shared axes and autoscaling report the same limits repeatedly
+            return
+        self.view = view
+        idx = self.visible_indices(ax, *view[0])
+        self.line.set_data(self.x[idx], self.y[idx])
+
+def plot_decimated(ax, x, y, **kwargs):
+    # Drop-in for ax.plot(x, y, **kwargs) for long sample-rate traces
+    return DecimatedLine(ax, x, y, **kwargs).line
+
+def show_breathing_signal(analyser):
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(nrows=4, ncols=1, figsize=(10, 7))
+    plot_decimated(axes[0], analyser.acc_times, analyser.acc_values[:, 0], color='r', marker='o', label='x', markersize=0.3, linewidth=0.05)
+    plot_decimated(axes[0], analyser.acc_times, analyser.acc_low_pass[:, 0], color='gray', marker='o', label='gravity', markersize=0.3, linewidth=0.5)
+    axes[0].legend()
+    axes[0].set_ylabel('X Acceleration')
+
+    plot_decimated(axes[1], analyser.acc_times, analyser.acc_values[:, 1], color='g', marker='o', label='y', markersize=0.3, linewidth=0.05)
+    plot_decimated(axes[1], analyser.acc_times, analyser.acc_low_pass[:, 1], color='gray', marker='o', label='y', markersize=0.3, linewidth=0.5)
+    axes[1].set_ylabel('Y Acceleration')
+
+    plot_decimated(axes[2], analyser.acc_times, analyser.acc_values[:, 2], color='b', marker='o', label='z', markersize=0.3, linewidth=0.05)
+    plot_decimated(axes[2], analyser.acc_times, analyser.acc_low_pass[:, 2], color='gray', marker='o', label='z', markersize=0.3, linewidth=0.5)
+    axes[2].set_ylabel('Z Acceleration')
+
+    plot_decimated(axes[3], analyser.acc_times, analyser.acc_values_norm, color='k', marker='o', label='z', markersize=0.3, linewidth=0.05)
+    plot_decimated(axes[3], analyser.acc_times, analyser.acc_low_pass_norm, color='gray', marker='o', label='z', markersize=0.3, linewidth=0.5)
+    axes[3].set_ylabel('Norm')
+    axes[3].set_xlabel('Time')
+    plt.tight_layout()
+    plt.gcf().canvas.manager.set_window_title("Accelerometer & Low Pass data")
+    plt.show(block=False)
+
+    # Filtered
+    plt.figure()
+    plot_decimated(plt.gca(), analyser.acc_times, analyser.acc_values_filt[:, 0], color='r', marker='o', label='x', markersize=0.2, linewidth = 0.1)
+    plot_decimated(plt.gca(), analyser.acc_times, analyser.acc_values_filt[:, 1], color='g', marker='o', label='y', markersize=0.2, linewidth = 0.1)
+    plot_decimated(plt.gca(), analyser.acc_times, analyser.acc_values_filt[:, 2], color='b', marker='o', label='z', markersize=0.2, linewidth = 0.1)
+    plt.gcf().canvas.manager.set_window_title("Filtered Data")
+    plt.legend()
+    plt.xlabel('Time')
+    plt.ylabel('Acceleration (filtered)')
+    plt.show(block=False)
+
+def show_heart_rate_variability(analyser):
+    import matplotlib.pyplot as plt
+
+    # Breath peaks and IBI peaks
+    fig, axes = plt.subplots(nrows=2, ncols=1, figsize=(11, 6), sharex=True)
+    plot_decimated(axes[0], analyser.acc_times, analyser.acc_values_filt_norm, color='k', marker='o', label='norm', markersize=0.05, linewidth = 0)
+    plot_decimated(axes[0], analyser.acc_times, analyser.breathing_signal, color='b', marker='o', label='x', markersize=0.5, linewidth = 0.3)
+    axes[0].vlines(analyser.acc_times[analyser.breath_peaks], ymin=np.min(analyser.breathing_signal), ymax=np.max(analyser.breathing_signal), color='b', linewidth=0.2)
+    axes[0].set_ylim(0.9*np.min(analyser.breathing_signal), 1.1*np.max(analyser.breathing_signal))
+    fig.suptitle(f"Average breath rate: {np.average(analyser.br_values):.1f} bpm")
+    axes[0].set_xlabel('Time')
+    axes[0].set_ylabel('Breathing Acc Mag.', color='b')
+    axes[0].tick_params(axis='y', labelcolor='b')
+    plot_decimated(axes[1], analyser.ibi_times, analyser.ibi_values, color='r', marker='o', label='y', markersize=3, linewidth=2)
+    axes[1].vlines(analyser.ibi_times[analyser.ibi_extremes_idx], ymin=np.min(analyser.ibi_values), ymax=np.max(analyser.ibi_values), color='r', linewidth=0.2)
+    axes[1].set_ylabel('Interbeat interval', color='r')
+    axes[1].tick_params(axis='y', labelcolor='r')
+    plt.show(block=False)
+
+    # BR and HRV over time
+    fig, ax1 = plt.subplots(figsize=(11, 6))
+    ax2 = ax1.twinx()
+    ax1.plot(analyser.br_times, analyser.br_values, color='b', marker='o', label='x', markersize=3, linewidth=1)
+    ax1.plot(analyser.br_times, analyser.br_values_smooth, color='b', marker='o', label='x', markersize=0, linewidth=2, linestyle='--')
+    ax1.set_xlabel('Time')
+    ax1.set_ylabel('Breath rate (bpm)', color='b')
+    ax1.tick_params(axis='y', labelcolor='b')
+    ax2.plot(analyser.hrv_times, analyser.hrv_values, color='r', marker='o', label='hrv', markersize=3, linewidth=2)
+    ax2.plot(analyser.br_times, analyser.hrv_values_interp, color='gray', marker='o', label='hrv_interp', markersize=0, linewidth=1, linestyle='--')
+    ax2.set_ylabel('HRV (ms)', color='r')
+    ax2.tick_params(axis='y', labelcolor='r')
+    ax2.set_xlabel('Time')
+    plt.show(block=False)
+
+    # Breathing rate vs hrv
+    plt.figure()
+    plt.plot(analyser.br_values_smooth, analyser.hrv_values_interp, color='k', marker='o', label='y', markersize=3, linewidth=0)
+    plt.xlabel('Breath rate')
+    plt.ylabel('HRV')
+    plt.show()
+
+
+def save_report(analyser, path):
+    # Summary figure written to an image file. Draws on a bare Figure with an Agg canvas, so neither pyplot nor a display is needed
+    fig = Figure(figsize=(11, 12))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(nrows=4, ncols=1)
+    axes[1].sharex(axes[0])
+    axes[2].sharex(axes[0])
+    plot_decimated(axes[0], analyser.acc_times, analyser.breathing_signal, color='b', linewidth=0.5)
+    if len(analyser.breath_peaks) > 0:
+        axes[0].plot(analyser.acc_times[analyser.breath_peaks], analyser.breathing_signal[analyser.breath_peaks], 'o', color='b', markersize=2)
+    axes[0].set_ylabel('Breathing Acc Mag.', color='b')
+    plot_decimated(axes[1], analyser.ibi_times, analyser.ibi_values, color='r', marker='o', markersize=1, linewidth=0.5)
+    if len(analyser.ibi_extremes_idx) > 0:
+        axes[1].plot(analyser.ibi_times[analyser.ibi_extremes_idx], analyser.ibi_values[analyser.ibi_extremes_idx], 'o', color='k', markersize=2)
+    axes[1].set_ylabel('Interbeat interval', color='r')
+    ax2 = axes[2].twinx()
+    axes[2].plot(analyser.br_times, analyser.br_values, color='b', marker='o', markersize=2, linewidth=0.5)
+    axes[2].plot(analyser.br_times, analyser.br_values_smooth, color='b', linewidth=1.5, linestyle='--')
+    axes[2].set_ylabel('Breath rate (bpm)', color='b')
+    axes[2].set_xlabel('Time')
+    ax2.plot(analyser.hrv_times, analyser.hrv_values, color='r', marker='o', markersize=2, linewidth=1)
+    ax2.set_ylabel('HRV (ms)', color='r')
+    axes[3].plot(analyser.br_values_smooth, analyser.hrv_values_interp, color='k', marker='o', markersize=3, linewidth=0)
+    axes[3].set_xlabel('Breath rate')
+    axes[3].set_ylabel('HRV')
+    br_mean = np.average(analyser.br_values) if len(analyser.br_values) > 0 else np.nan
+    fig.suptitle(f"Average breath rate: {br_mean:.1f} bpm")
+    fig.tight_layout()
+    fig.savefig(path, dpi=100)
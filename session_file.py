@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import struct
+import zlib
+import numpy as np
+
+# session_file – Compact binary session files (.dhyb) holding the ACC, IBI and ECG streams of a recording plus device metadata
+#
+# Layout: 8 byte magic, uint32 format version, uint32 header length, JSON header, then each array's raw bytes,
+# every block aligned to 64 bytes. The header lists each array's dtype, shape and byte offset, so arrays open
+# as np.memmap views and analysis can start without reading the whole file.
+# At 200 Hz an ACC sample is 14 bytes (int16 xyz + float64 time) instead of ~80 bytes of CSV text.
+
+MAGIC = b"DHYBSESS"
+VERSION = 1
+ALIGNMENT = 64
+STREAMS = ("acc", "ibi", "ecg")
+
+# Recording journals (.dhybrec) are appended to while recording, see SessionWriter.
+# Layout: 8 byte magic, then records of [tag, kind, stream index, payload length, crc32 of payload] + payload.
+# Metadata records hold a JSON object, data records a uint64 sample count, float64 times and the stream's values.
+# A record is only used if it is complete and its checksum matches, so a crash loses at most the chunk being written.
+RECORDING_MAGIC = b"DHYBREC1"
+RECORD_HEADER = struct.Struct("<4sHHII")
+RECORD_TAG = b"CHNK"
+RECORD_METADATA = 0
+RECORD_DATA = 1
+RECORDING_STREAMS = {'acc': ('<i2', 3), 'ibi': ('<f8', None), 'ecg': ('<i4', None)} # dtype and width as stored by PolarH10
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def save_session(path, acc_data=None, ibi_data=None, ecg_data=None, metadata=None):
+    """
+    Write a session file. Each stream is a dict {'times', 'values'} as returned by PolarH10.get_acc_data/get_ibi_data,
+    arrays keep their dtypes. `metadata` is any JSON serialisable dict, e.g. PolarH10.get_device_metadata().
+    """
+    arrays = {}
+    for stream, data in zip(STREAMS, (acc_data, ibi_data, ecg_data)):
+        if data is not None:
+            arrays[f"{stream}_times"] = np.ascontiguousarray(data['times'])
+            arrays[f"{stream}_values"] = np.ascontiguousarray(data['values'])
+
+    entries = {name: {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': 0} for name, array in arrays.items()}
+    header = {'version': VERSION, 'metadata': metadata or {}, 'arrays': entries}
+    # The header holds the array offsets, which depend on the header length, so grow its reserved space until it fits
+    data_start = align(16 + len(json.dumps(header).encode()))
+    while True:
+        offset = data_start
+        for name, array in arrays.items():
+            entries[name]['offset'] = offset
+            offset = align(offset + array.nbytes)
+        header_bytes = json.dumps(header).encode()
+        if 16 + len(header_bytes) <= data_start:
+            break
+        data_start = align(16 + len(header_bytes))
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.array([VERSION, len(header_bytes)], dtype='<u4').tobytes())
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(entries[name]['offset'])
+            array.tofile(f)
+        f.truncate(max(offset, data_start))
+
+def read_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a session file")
+        version, header_len = np.frombuffer(f.read(8), dtype='<u4')
+        if version > VERSION:
+            raise ValueError(f"{path} has unsupported session format version {version}")
+        return json.loads(f.read(int(header_len)))
+
+def load_session(path, mmap=True):
+    """
+    Open a session file. Returns {'acc': {'times', 'values'}, 'ibi': ..., 'ecg': ..., 'metadata': {...}},
+    streams that weren't recorded are None. With `mmap` the arrays are read-only np.memmap views, only the pages that
+    are touched get read from disk.
+    """
+    header = read_header(path)
+    arrays = {}
+    for name, entry in header['arrays'].items():
+        dtype = np.dtype(entry['dtype'])
+        shape = tuple(entry['shape'])
+        if mmap and int(np.prod(shape)) > 0:
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=entry['offset'], shape=shape)
+        else:
+            with open(path, "rb") as f:
+                f.seek(entry['offset'])
+                arrays[name] = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+    session = {'metadata': header['metadata']}
+    for stream in STREAMS:
+        if f"{stream}_times" in arrays:
+            session[stream] = {'times': arrays[f"{stream}_times"], 'values': arrays[f"{stream}_values"]}
+        else:
+            session[stream] = None
+    return session
+
+def encode_record(kind, stream, payload):
+    stream_idx = list(RECORDING_STREAMS).index(stream) if stream is not None else 0
+    return RECORD_HEADER.pack(RECORD_TAG, kind, stream_idx, len(payload), zlib.crc32(payload)) + payload
+
+def encode_data_record(stream, times, values):
+    dtype, _ = RECORDING_STREAMS[stream]
+    payload = (np.array([len(times)], dtype='<u8').tobytes() + np.ascontiguousarray(times, dtype='<f8').tobytes()
+               + np.ascontiguousarray(values, dtype=dtype).tobytes())
+    return encode_record(RECORD_DATA, stream, payload)
+
+def encode_metadata_record(metadata):
+    return encode_record(RECORD_METADATA, None, json.dumps(metadata).encode())
+
+def read_recording(path):
+    """
+    Read a recording journal, including one left half-written by a crash, up to its last complete record.
+    Returns the same structure as load_session, with IBI times made rel to the start of the acc session like PolarH10.get_ibi_data.
+    """
+    chunks = {stream: ([], []) for stream in RECORDING_STREAMS}
+    metadata = {}
+    stream_names = list(RECORDING_STREAMS)
+    with open(path, "rb") as f:
+        if f.read(len(RECORDING_MAGIC)) != RECORDING_MAGIC:
+            raise ValueError(f"{path} is not a recording journal")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            tag, kind, stream_idx, payload_len, crc = RECORD_HEADER.unpack(header)
+            payload = f.read(payload_len)
+            if tag != RECORD_TAG or len(payload) < payload_len or zlib.crc32(payload) != crc:
+                break # incomplete or corrupt tail
+            if kind == RECORD_METADATA:
+                metadata.update(json.loads(payload))
+            elif kind == RECORD_DATA:
+                stream = stream_names[stream_idx]
+                dtype, width = RECORDING_STREAMS[stream]
+                n = int(np.frombuffer(payload, dtype='<u8', count=1)[0])
+                chunks[stream][0].append(np.frombuffer(payload, dtype='<f8', count=n, offset=8))
+                values = np.frombuffer(payload, dtype=dtype, offset=8 + 8*n)
+                chunks[stream][1].append(values if width is None else values.reshape(-1, width))
+
+    session = {'metadata': metadata}
+    for stream, (times, values) in chunks.items():
+        if len(times) == 0:
+            session[stream] = None
+            continue
+        session[stream] = {'times': np.concatenate(times), 'values': np.concatenate(values)}
+    if session['ibi'] is not None and 'acc_stream_start_time' in metadata:
+        session['ibi']['times'] = session['ibi']['times'] - metadata['acc_stream_start_time']
+    return session
+
+def finalize_recording(recording_path, path):
+    # Convert a (possibly half-written) recording journal to a session file
+    session = read_recording(recording_path)
+    save_session(path, acc_data=session['acc'], ibi_data=session['ibi'], ecg_data=session['ecg'], metadata=session['metadata'])
+    return session
+
+def compact_values(values, dtype):
+    # CSV columns load as float64, store them as `dtype` when that is lossless
+    if np.all(np.isfinite(values)) and np.array_equal(values, np.round(values)):
+        info = np.iinfo(dtype)
+        if values.size == 0 or (values.min() >= info.min and values.max() <= info.max):
+            return values.astype(dtype)
+    return values
+
+def convert_csv_session(acc_csv, ibi_csv, path, metadata=None):
+    """
+    Convert the CSV files written by the old DHYB.save_sample_data (time, x, y, z and time, ibi) to a session file.
+    Either CSV may be None or missing.
+    """
+    acc_data = None
+    ibi_data = None
+    if acc_csv is not None and os.path.exists(acc_csv):
+        sample_acc_data = np.loadtxt(acc_csv, delimiter=",", ndmin=2)
+        acc_data = {'times': sample_acc_data[:, 0], 'values': compact_values(sample_acc_data[:, 1:], np.int16)}
+    if ibi_csv is not None and os.path.exists(ibi_csv):
+        sample_ibi_data = np.loadtxt(ibi_csv, delimiter=",", ndmin=2)
+        ibi_data = {'times': sample_ibi_data[:, 0], 'values': sample_ibi_data[:, 1]}
+    save_session(path, acc_data=acc_data, ibi_data=ibi_data, metadata=metadata)
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Convert CSV recordings written by older versions of DHYB.py, or a recording journal left by an interrupted session, to a session file")
+    parser.add_argument("--acc-csv", default="data/sample_data_acc.csv", help="ACC CSV (time, x, y, z)")
+    parser.add_argument("--ibi-csv", default="data/sample_data_ibi.csv", help="IBI CSV (time, ibi)")
+    parser.add_argument("--recover", default=None, help="Recording journal (.dhybrec) to recover instead of converting CSVs")
+    parser.add_argument("--output", default="data/sample_data.dhyb", help="Session file to write")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+
+    args = get_arguments()
+    if args.recover is not None:
+        session = finalize_recording(args.recover, args.output)
+        n_acc = 0 if session['acc'] is None else len(session['acc']['times'])
+        n_ibi = 0 if session['ibi'] is None else len(session['ibi']['times'])
+        print(f"Recovered {n_acc} ACC samples and {n_ibi} IBIs")
+    else:
+        convert_csv_session(args.acc_csv, args.ibi_csv, args.output)
+    print(f"Wrote {args.output}")
@@ -0,0 +1,163 @@
+from collections import deque
+import numpy as np
+
+# spectral – Breathing rate and HRV frequency-domain power from Welch spectra over sliding windows
+# A window's spectrum is the mean of the periodograms of its half-overlapping segments (Welch). Consecutive windows step by one
+# segment hop, so they share all but one segment: every segment's periodogram is computed once, in one batched FFT over a
+# strided view of the signal, and each window's spectrum is a moving mean over the segment periodograms. StreamingWelch does
+# the same on live chunks, keeping only the periodograms of the current window.
+
+RESAMPLE_FREQ = 4.0 # Hz, rate the breathing signal and IBI series are analysed at
+BR_BAND = (0.1, 1.0) # Hz of the breathing signal, which oscillates twice per breath (3-30 breaths per min)
+LF_BAND = (0.04, 0.15) # Hz
+HF_BAND = (0.15, 0.4) # Hz
+ZERO_PADDING = 4 # FFT length as a multiple of the segment length, for a finer frequency grid
+
+def decimate_mean(values, q):
+    # Mean of each block of `q` samples, a partial last block is dropped. The breathing signal is already low-pass filtered
+    n_blocks = len(values)//q
+    return values[:n_blocks*q].reshape(n_blocks, q).mean(axis=1)
+
+def segment_periodograms(segments, fs, nfft):
+    # One-sided PSD of each row of `segments` (Hann window, mean removed), scaled like scipy.signal.welch. One batched FFT
+    taper = np.hanning(segments.shape[-1] + 1)[:-1] # periodic Hann, as scipy's default
+    spectrum = np.fft.rfft((segments - segments.mean(axis=-1, keepdims=True))*taper, n=nfft, axis=-1)
+    psd = (spectrum.real**2 + spectrum.imag**2)/(fs*np.sum(taper**2))
+    psd[..., 1:(nfft + 1)//2] *= 2 # fold negative frequencies, not DC or Nyquist
+    return psd
+
+def windowed_welch(values, fs, window, segment):
+    """
+    Welch spectra of sliding windows of `window` seconds, made of half-overlapping segments of `segment` seconds.
+    Windows step by the segment hop (segment/2). Returns the end of each window (s from the first sample), the
+    frequencies and the spectra (n_windows x n_frequencies).
+    """
+    nperseg = int(round(segment*fs))
+    hop = nperseg//2
+    n_segments = int(round((window*fs - nperseg)/hop)) + 1 # per window
+    nfft = ZERO_PADDING*nperseg
+    freqs = np.fft.rfftfreq(nfft, 1/fs)
+    if len(values) < nperseg + (n_segments - 1)*hop:
+        return np.zeros(0), freqs, np.zeros((0, len(freqs)))
+    segments = np.lib.stride_tricks.sliding_window_view(values, nperseg)[::hop] # strided view, no copy
+    psd = segment_periodograms(segments, fs, nfft)
+    cumulative = np.concatenate((np.zeros((1, len(freqs))), np.cumsum(psd, axis=0)))
+    window_psd = (cumulative[n_segments:] - cumulative[:-n_segments])/n_segments
+    return (np.arange(len(window_psd))*hop + nperseg + (n_segments - 1)*hop)/fs, freqs, window_psd
+
+def peak_frequency(freqs, psd, band):
+    # Frequency of the largest peak in `band` of each spectrum, refined with a parabola through the neighbouring bins,
+    # and the fraction of the band's power within one bin either side of it (near 1 for a clean rhythm)
+    in_band = np.flatnonzero((freqs >= band[0]) & (freqs <= band[1]))
+    band_psd = psd[:, in_band]
+    peak = np.argmax(band_psd, axis=1)
+    rows = np.arange(len(psd))
+    idx = in_band[peak]
+    left, centre, right = psd[rows, np.maximum(idx - 1, 0)], psd[rows, idx], psd[rows, np.minimum(idx + 1, len(freqs) - 1)]
+    curvature = left - 2*centre + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.where(curvature < 0, 0.5*(left - right)/curvature, 0.0)
+        concentration = (left + centre + right)/band_psd.sum(axis=1)
+    df = freqs[1] - freqs[0]
+    return freqs[idx] + np.clip(offset, -0.5, 0.5)*df, concentration
+
+def band_power(freqs, psd, band):
+    in_band = (freqs >= band[0]) & (freqs < band[1])
+    return psd[:, in_band].sum(axis=1)*(freqs[1] - freqs[0])
+
+def spectral_breathing_rate(acc_times, breathing_signal, fs=200, window=60, segment=30):
+    """
+    Breathing rate (breaths per min) of sliding windows of the breathing signal, from the peak of their Welch spectrum.
+    Returns the window end times, the rates and the peak concentration of each window (see peak_frequency), which is low
+    for noisy windows without a clear rhythm.
+    """
+    q = max(1, int(round(fs/RESAMPLE_FREQ)))
+    signal = decimate_mean(np.asarray(breathing_signal, dtype=float), q)
+    ends, freqs, psd = windowed_welch(signal, fs/q, window, segment)
+    peak_freq, concentration = peak_frequency(freqs, psd, BR_BAND)
+    return acc_times[0] + ends, 60*peak_freq/2, concentration # two breathing signal cycles per breath
+
+def resample_ibi(ibi_times, ibi_values, fs=RESAMPLE_FREQ):
+    # IBI series interpolated linearly onto an even grid from the first to the last beat
+    grid = np.arange(ibi_times[0], ibi_times[-1], 1/fs)
+    return grid, np.interp(grid, ibi_times, ibi_values)
+
+def spectral_hrv(ibi_times, ibi_values, window=300, segment=120):
+    """
+    LF (0.04-0.15 Hz) and HF (0.15-0.4 Hz) power (ms^2) of the resampled IBI series over sliding windows, their ratio and the
+    HF peak frequency (Hz, follows breathing). Returns a dict of arrays with one value per window, 'times' are window ends.
+    """
+    ibi_times, ibi_values = np.asarray(ibi_times, dtype=float), np.asarray(ibi_values, dtype=float)
+    if len(ibi_times) < 2:
+        ends, freqs, psd = np.zeros(0), np.fft.rfftfreq(8), np.zeros((0, 5))
+        grid = np.zeros(1)
+    else:
+        grid, resampled = resample_ibi(ibi_times, ibi_values)
+        ends, freqs, psd = windowed_welch(resampled, RESAMPLE_FREQ, window, segment)
+    lf = band_power(freqs, psd, LF_BAND)
+    hf = band_power(freqs, psd, HF_BAND)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lf_hf = lf/hf
+    hf_peak = peak_frequency(freqs, psd, HF_BAND)[0] if len(psd) else np.zeros(0)
+    return {'times': grid[0] + ends, 'lf': lf, 'hf': hf, 'lf_hf': lf_hf, 'hf_peak': hf_peak}
+
+class StreamingWelch:
+    """
+    Welch spectra of sliding windows over a live stream, identical to windowed_welch on the whole stream.
+    Each segment's periodogram is computed once, when the segment completes, and kept while it is part of the current window.
+    """
+    def __init__(self, fs, window, segment):
+        self.fs = fs
+        self.nperseg = int(round(segment*fs))
+        self.hop = self.nperseg//2
+        self.n_segments = int(round((window*fs - self.nperseg)/self.hop)) + 1
+        self.nfft = ZERO_PADDING*self.nperseg
+        self.freqs = np.fft.rfftfreq(self.nfft, 1/fs)
+        self.pending = np.zeros(0) # samples from the start of the next segment on
+        self.next_segment_start = 0 # stream index of pending[0]
+        self.periodograms = deque(maxlen=self.n_segments)
+        self.psd_sum = np.zeros(len(self.freqs))
+
+    def update(self, values):
+        # Returns the end times (s from the first sample) and spectra of windows completed by `values`
+        x = np.concatenate((self.pending, values))
+        n_new = (len(x) - self.nperseg)//self.hop + 1 if len(x) >= self.nperseg else 0
+        ends, spectra = [], []
+        if n_new > 0:
+            segments = np.lib.stride_tricks.sliding_window_view(x, self.nperseg)[::self.hop][:n_new]
+            for j, psd in enumerate(segment_periodograms(segments, self.fs, self.nfft)):
+                if len(self.periodograms) == self.n_segments:
+                    self.psd_sum -= self.periodograms[0]
+                self.periodograms.append(psd)
+                self.psd_sum += psd
+                if len(self.periodograms) == self.n_segments:
+                    ends.append((self.next_segment_start + j*self.hop + self.nperseg)/self.fs)
+                    spectra.append(self.psd_sum/self.n_segments)
+            self.next_segment_start += n_new*self.hop
+            x = x[n_new*self.hop:]
+        self.pending = x
+        return np.array(ends), np.array(spectra).reshape(-1, len(self.freqs))
+
+class StreamingBreathingRate:
+    # spectral_breathing_rate for live chunks of the breathing signal, e.g. from BreathingStreamAnalyser
+    def __init__(self, fs=200, window=60, segment=30):
+        self.q = max(1, int(round(fs/RESAMPLE_FREQ)))
+        self.welch = StreamingWelch(fs/self.q, window, segment)
+        self.pending = np.zeros(0) # samples of an incomplete decimation block
+        self.first_time = None
+        self.br_latest = None
+
+    def update(self, times, breathing_signal):
+        # Returns the window end times, breathing rates and peak concentrations of windows completed by this chunk
+        if self.first_time is None and len(times) > 0:
+            self.first_time = times[0]
+        x = np.concatenate((self.pending, breathing_signal))
+        n_blocks = len(x)//self.q
+        self.pending = x[n_blocks*self.q:]
+        ends, psd = self.welch.update(decimate_mean(x, self.q))
+        if len(psd) == 0:
+            return np.zeros(0), np.zeros(0), np.zeros(0)
+        peak_freq, concentration = peak_frequency(self.welch.freqs, psd, BR_BAND)
+        br = 60*peak_freq/2
+        self.br_latest = br[-1]
+        return self.first_time + ends, br, concentration
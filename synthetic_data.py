@@ -0,0 +1,79 @@
+import numpy as np
+
+# synthetic_data – Synthetic Polar H10 style recordings for benchmarks and offline development: ACC (breathing, posture drift,
+# sensor noise and optional motion bursts), IBIs with respiratory sinus arrhythmia, and ECG with a P-QRS-T complex at each beat
+
+ACC_SAMPLING_FREQ = 200 # PolarH10.ACC_SAMPLING_FREQ
+
+def breathing_phase(times, breathing_rate=12.0, rate_variation=3.0, seed=0):
+    # Breathing rate (bpm) wanders slowly around `breathing_rate`, phase is its integral
+    rng = np.random.default_rng(seed)
+    drift_period = rng.uniform(120, 300)
+    rate = breathing_rate + rate_variation*np.sin(2*np.pi*times/drift_period + rng.uniform(0, 2*np.pi))
+    dt = np.diff(times, prepend=times[0])
+    return 2*np.pi*np.cumsum(rate/60*dt)
+
+def synthetic_acc_data(duration, breathing_rate=12.0, breathing_amplitude=10.0, noise=3.0, fs=ACC_SAMPLING_FREQ, seed=0, motion_per_hour=0.0):
+    """
+    ACC in milli-g as streamed by the Polar H10: gravity with slow posture drift, a breathing oscillation of
+    `breathing_amplitude` mG and white sensor noise of `noise` mG, rounded to int16.
+    `motion_per_hour` bursts of movement (2-10 s of smoothed 50-200 mG noise) are added at random times.
+    """
+    rng = np.random.default_rng(seed)
+    times = np.arange(int(duration*fs))/fs
+    posture = 0.05*np.sin(2*np.pi*times/600)
+    gravity = 1000*np.column_stack((np.sin(posture), -np.cos(posture), 0.15*np.ones_like(times)))
+    breathing = np.sin(breathing_phase(times, breathing_rate, seed=seed))
+    chest_axis = np.array([0.2, 0.3, 0.93])
+    values = gravity + breathing_amplitude*breathing[:, None]*chest_axis + rng.normal(0, noise, (len(times), 3))
+    if motion_per_hour > 0:
+        motion_rng = np.random.default_rng(seed + 3) # separate stream, so the rest of the data doesn't depend on it
+        smoothing = np.ones(int(0.1*fs))/int(0.1*fs)
+        for _ in range(motion_rng.poisson(motion_per_hour*duration/3600)):
+            start = motion_rng.integers(0, max(1, len(times)))
+            stop = min(len(times), start + int(motion_rng.uniform(2, 10)*fs))
+            burst = motion_rng.normal(0, motion_rng.uniform(50, 200), (stop - start, 3))
+            values[start:stop] += np.column_stack([np.convolve(burst[:, i], smoothing, mode='same') for i in range(3)])*np.sqrt(len(smoothing))
+    return {'times': times, 'values': np.round(np.clip(values, -32768, 32767)).astype(np.int16)}
+
+def synthetic_ibi_data(duration, breathing_rate=12.0, mean_ibi=900.0, rsa_amplitude=60.0, noise=8.0, seed=0):
+    """
+    IBI in ms with respiratory sinus arrhythmia: heart rate rises on inhale and falls on exhale, following the same
+    breathing phase as `synthetic_acc_data` for the same seed.
+    """
+    rng = np.random.default_rng(seed + 1)
+    n_beats = int(duration*1000/(mean_ibi - rsa_amplitude)) + 1
+    beat_noise = rng.normal(0, noise, n_beats)
+    grid = np.arange(0, duration + 2*mean_ibi/1000, 0.1)
+    grid_phase = breathing_phase(grid, breathing_rate, seed=seed)
+    # Each beat's IBI depends on the breathing phase at the previous beat, a few fixed-point passes settle the beat times
+    beat_times = np.arange(1, n_beats + 1)*mean_ibi/1000
+    for _ in range(4):
+        previous_beat = np.concatenate(([0.0], beat_times[:-1]))
+        ibi = mean_ibi - rsa_amplitude*np.sin(np.interp(previous_beat, grid, grid_phase)) + beat_noise
+        beat_times = np.cumsum(ibi)/1000
+    keep = beat_times <= duration
+    return {'times': beat_times[keep], 'values': np.ceil(ibi[keep])}
+
+ECG_SAMPLING_FREQ = 130 # PolarH10.ECG_SAMPLING_FREQ
+
+def synthetic_ecg_data(ibi_data, duration, fs=ECG_SAMPLING_FREQ, noise=15.0, seed=0):
+    """
+    ECG in microvolts: a P-QRS-T complex of Gaussian waves for every beat of `ibi_data` (beat times are the R peaks),
+    slow baseline wander and white noise, rounded to integers.
+    """
+    rng = np.random.default_rng(seed + 2)
+    times = np.arange(int(duration*fs))/fs
+    values = 50*np.sin(2*np.pi*0.2*times) + rng.normal(0, noise, len(times))
+    # (offset from R peak in s, width in s, amplitude in uV)
+    waves = [(-0.16, 0.025, 120), (-0.03, 0.010, -150), (0.0, 0.012, 1200), (0.03, 0.010, -250), (0.26, 0.045, 300)]
+    half_window = int(0.4*fs)
+    for beat_time in ibi_data['times']:
+        centre = int(round(beat_time*fs))
+        lo, hi = max(0, centre - half_window), min(len(times), centre + half_window)
+        if lo >= hi:
+            continue
+        dt = times[lo:hi] - beat_time
+        for offset, width, amplitude in waves:
+            values[lo:hi] += amplitude*np.exp(-0.5*((dt - offset)/width)**2)
+    return {'times': times, 'values': np.round(values).astype(np.int32)}
@@ -0,0 +1,73 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from RollingHrv import RollingHrv, METRICS, NN50_THRESHOLD
+
+# RollingHrv's live path (one beat at a time) against RollingHrv.series and against each window computed straight from its beats,
+# on the recorded sample IBIs. Run with `python -m pytest tests`
+
+WINDOWS = (30, 60, 300)
+
+@pytest.fixture(scope="module")
+def sample_ibis():
+    data = np.loadtxt(os.path.join(REPO_DIR, "data", "sample_data_ibi.csv"), delimiter=",", ndmin=2)
+    return data[:, 0], data[:, 1]
+
+def beat_times(sample_ibis, timing):
+    # 'beat': the recorded beat times, 'packet': all IBIs of a heart rate packet (one a second) share its arrival time
+    times, _ = sample_ibis
+    return times if timing == 'beat' else np.ceil(times)
+
+def live_series(times, ibi_values, windows):
+    rolling_hrv = RollingHrv(windows)
+    live = {window: {metric: np.zeros(len(ibi_values)) for metric in METRICS} for window in windows}
+    for i, (beat_time, ibi) in enumerate(zip(times.tolist(), ibi_values.tolist())):
+        rolling_hrv.add(beat_time, ibi)
+        for window, metrics in rolling_hrv.latest().items():
+            for metric, value in metrics.items():
+                live[window][metric][i] = value
+    return live
+
+def direct_series(times, ibi_values, window):
+    # Each window's metrics straight from its beats
+    metrics = {metric: np.full(len(ibi_values), np.nan) for metric in METRICS}
+    for i in range(len(ibi_values)):
+        beats = ibi_values[np.searchsorted(times, times[i] - window, side='right'):i + 1]
+        metrics['mean_hr'][i] = 60000/np.mean(beats)
+        if len(beats) > 1:
+            diffs = np.diff(beats)
+            metrics['sdnn'][i] = np.std(beats, ddof=1)
+            metrics['rmssd'][i] = np.sqrt(np.mean(diffs**2))
+            metrics['pnn50'][i] = 100*np.mean(np.abs(diffs) > NN50_THRESHOLD)
+    return metrics
+
+@pytest.mark.parametrize("timing", ['beat', 'packet'])
+def test_live_matches_series(sample_ibis, timing):
+    times, ibi_values = beat_times(sample_ibis, timing), sample_ibis[1]
+    live = live_series(times, ibi_values, WINDOWS)
+    for window in WINDOWS:
+        offline = RollingHrv.series(times, ibi_values, window)
+        for metric in METRICS:
+            np.testing.assert_allclose(live[window][metric], offline[metric], rtol=1e-9, atol=1e-9, err_msg=f"{window} s {metric}")
+
+@pytest.mark.parametrize("timing", ['beat', 'packet'])
+@pytest.mark.parametrize("window", WINDOWS + (np.inf,))
+def test_series_matches_direct(sample_ibis, timing, window):
+    times, ibi_values = beat_times(sample_ibis, timing), sample_ibis[1]
+    offline = RollingHrv.series(times, ibi_values, window)
+    direct = direct_series(times, ibi_values, window)
+    for metric in METRICS:
+        np.testing.assert_allclose(offline[metric], direct[metric], rtol=1e-9, atol=1e-9, err_msg=f"{window} s {metric}")
+
+def test_metrics_need_enough_beats():
+    rolling_hrv = RollingHrv((30,))
+    assert all(np.isnan(value) for value in rolling_hrv.latest()[30].values())
+    rolling_hrv.add(1.0, 1000.0)
+    metrics = rolling_hrv.latest()[30]
+    assert metrics['mean_hr'] == pytest.approx(60.0)
+    assert np.isnan(metrics['sdnn']) and np.isnan(metrics['rmssd']) and np.isnan(metrics['pnn50'])
+    assert all(len(values) == 0 for values in RollingHrv.series([], [], 30).values())